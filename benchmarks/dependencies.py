@@ -0,0 +1,127 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Benchmark resolving the dependencies of plugins.
+
+A repository of synthetic plugins is created, where each root plugin depends
+on a chain of plugins, and all the chains end in a shared library. The
+dependencies of all the roots are resolved with a fake BukGet, which takes
+LATENCY seconds for each query, with:
+    recursive   One query for each level, with the stack searched linearly,
+                which is how mcman resolved dependencies before the resolver
+                module.
+    resolver    resolver.resolve, with nothing remembered.
+    remembered  resolver.resolve again, with the plugins from the last run
+                remembered.
+
+Run it from the root of the repository:
+    python benchmarks/dependencies.py [chains] [depth]
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mcman.logic.plugins import resolver, utils  # noqa
+
+# The seconds each query to the fake BukGet takes
+LATENCY = 0.002
+
+
+def create_plugins(chains, depth):
+    """ Create the repository, and return it and the roots. """
+    plugins = {'library': {
+        'slug': 'library',
+        'plugin_name': 'Library',
+        'versions': [{'type': 'Release', 'hard_dependencies': []}],
+    }}
+    roots = list()
+    for chain in range(chains):
+        dependency = 'Library'
+        for level in range(depth):
+            name = 'Chain{}Level{}'.format(chain, level)
+            plugins[name.lower()] = {
+                'slug': name.lower(),
+                'plugin_name': name,
+                'versions': [{'type': 'Release',
+                              'hard_dependencies': [dependency]}],
+            }
+            dependency = name
+        roots.append(plugins[dependency.lower()])
+    return plugins, roots
+
+
+def fake_lookup(plugins, queries):
+    """ Return a lookup function which counts it's queries in `queries`. """
+    def lookup(names):
+        queries.append(names)
+        time.sleep(LATENCY)
+        return [plugins[name.lower()] for name in names
+                if name.lower() in plugins]
+    return lookup
+
+
+def recursive(plugins, lookup, stack=None):
+    """ Resolve the dependencies the way mcman did before. """
+    if stack is None:
+        stack = plugins[:]
+    deps = utils.extract_dependencies(plugins, 'Release')
+    deps = [dep for dep in deps
+            if not any(p['plugin_name'] == dep for p in stack)]
+    if len(deps) > 0:
+        results = lookup(deps)
+        for plugin in results:
+            if not any(p['slug'] == plugin['slug'] for p in stack):
+                stack.append(plugin)
+        recursive(results, lookup, stack)
+    return stack
+
+
+def measure(name, function):
+    """ Print the time and the queries of one run of `function`. """
+    queries = list()
+    started = time.perf_counter()
+    results = function(queries)
+    elapsed = time.perf_counter() - started
+    print('{:<12}{:>9.1f} ms{:>9} queries'.format(name, elapsed * 1000,
+                                                  len(queries)))
+    return results
+
+
+def main():
+    """ Run the benchmark. """
+    chains = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    plugins, roots = create_plugins(chains, depth)
+    print('Resolving {} chains of {} plugins'.format(chains, depth))
+
+    expected = measure('recursive', lambda queries: recursive(
+        list(roots), fake_lookup(plugins, queries)))
+    resolver.clear()
+    results = measure('resolver', lambda queries: resolver.resolve(
+        roots, fake_lookup(plugins, queries), 'Release'))
+    measure('remembered', lambda queries: resolver.resolve(
+        roots, fake_lookup(plugins, queries), 'Release'))
+
+    assert sorted(p['slug'] for p in results) == \
+        sorted(p['slug'] for p in expected)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Benchmark reading the identity of plugins from their plugin.yml.
+
+A folder of synthetic plugin jars is created, and the name, main class and
+version of each jar is read with:
+    zipfile     zipfile and the pure Python yaml.safe_load, which is how
+                mcman read them before the descriptor module.
+    libyaml     zipfile and libyaml's CSafeLoader, if it is available.
+    descriptor  descriptor.read_entry and descriptor.parse_plugin_yml.
+
+Run it from the root of the repository:
+    python benchmarks/plugin_yml.py [jars] [classes per jar]
+
+"""
+
+import os
+import sys
+import tempfile
+import time
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mcman.logic.plugins import descriptor  # noqa
+
+PLUGIN_YML = '''name: Plugin{number}
+main: io.example.plugin{number}.Plugin{number}
+version: 1.{number}
+author: Someone
+description: Synthetic plugin number {number}.
+depend: [Vault]
+commands:
+  plugin{number}:
+    description: The command of plugin {number}.
+    usage: /<command> [reload|help]
+    aliases: [p{number}]
+permissions:
+  plugin{number}.*:
+    description: All permissions of plugin {number}.
+    default: op
+    children:
+      plugin{number}.use: true
+      plugin{number}.reload: true
+'''
+
+
+def create_jars(folder, jars, classes):
+    """ Create `jars` plugin jars with `classes` classes each. """
+    paths = list()
+    for number in range(jars):
+        path = os.path.join(folder, 'Plugin{}.jar'.format(number))
+        with ZipFile(path, 'w', ZIP_DEFLATED) as zipped:
+            zipped.writestr('META-INF/MANIFEST.MF', 'Manifest-Version: 1.0\n')
+            for cls in range(classes):
+                zipped.writestr(
+                    'io/example/plugin{}/Class{}.class'.format(number, cls),
+                    os.urandom(64) * 8)
+            zipped.writestr('plugin.yml', PLUGIN_YML.format(number=number))
+        paths.append(path)
+    return paths
+
+
+def with_zipfile(path, loader):
+    """ Read the identity with zipfile, and parse it with `loader`. """
+    with ZipFile(path, 'r') as zipped:
+        if 'plugin.yml' not in zipped.namelist():
+            return None
+        yml = yaml.load(zipped.read('plugin.yml').decode(), Loader=loader)
+    return yml['main'], yml['name'], str(yml['version'])
+
+
+def with_descriptor(path):
+    """ Read the identity with the descriptor module. """
+    return descriptor.parse_plugin_yml(
+        descriptor.read_entry(path, 'plugin.yml'))
+
+
+def measure(name, function, paths, rounds=3):
+    """ Print the best time of `rounds` runs of `function` on all paths. """
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        results = [function(path) for path in paths]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print('{:<12}{:>9.1f} ms{:>9.1f} us/jar'.format(
+        name, best * 1000, best * 1e6 / len(paths)))
+    return results
+
+
+def main():
+    """ Run the benchmark. """
+    jars = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    classes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as folder:
+        print('Creating {} jars with {} classes each'.format(jars, classes))
+        paths = create_jars(folder, jars, classes)
+
+        expected = measure('zipfile', lambda path: with_zipfile(
+            path, yaml.SafeLoader), paths)
+        if hasattr(yaml, 'CSafeLoader'):
+            measure('libyaml', lambda path: with_zipfile(
+                path, yaml.CSafeLoader), paths)
+        results = measure('descriptor', with_descriptor, paths)
+        assert results == expected
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The cache command of mcman.
+
+This module is the home of the front end part of the command. This means that
+as little as possible logic should go here. The logic is placed in the cache
+module in the logic package.
+
+"""
+
+from mcman.logic import cache as backend
+from mcman.logic import common, httpcache
+from mcman.command import Command
+
+
+class CacheCommand(Command):
+
+    """ The cache command of mcman. """
+
+    def __init__(self, args):
+        """ Parse command, and execute tasks. """
+        Command.__init__(self)
+
+        self.args = args
+
+        self.register_subcommand('stats', self.stats)
+        self.register_subcommand('prune', self.prune)
+
+        self.invoke_subcommand(args.subcommand, (ValueError, OSError))
+
+    def stats(self):
+        """ Show statistics about the cache. """
+        if backend.FOLDER is None:
+            self.p_main('The cache is disabled')
+        else:
+            count, size = backend.stats()
+
+            self.p_main('Cache in {}:'.format(backend.FOLDER))
+            self.p_blank()
+            self.p_sub('Files: {}', count)
+            self.p_sub('Size:  {}', common.format_size(size))
+            self.p_sub('Limit: {}', common.format_size(backend.LIMIT))
+            self.p_blank()
+
+        count, size = httpcache.stats()
+        totals = httpcache.load_totals()
+        requests = sum(totals.values())
+        hit_rate = 0
+        if requests > 0:
+            hit_rate = (totals['hits'] + totals['revalidated']) * 100 \
+                // requests
+
+        self.p_main('Responses in {}:'.format(httpcache.FOLDER))
+        self.p_blank()
+        self.p_sub('Responses:   {}', count)
+        self.p_sub('Size:        {}', common.format_size(size))
+        self.p_sub('Hits:        {}', totals['hits'])
+        self.p_sub('Revalidated: {}', totals['revalidated'])
+        self.p_sub('Misses:      {}', totals['misses'])
+        self.p_sub('Hit rate:    {}%', hit_rate)
+        self.p_blank()
+
+    def prune(self):
+        """ Remove the least recently used files from the cache. """
+        removed, freed = httpcache.prune()
+        self.p_main('Removed {} old responses, freed {}'.format(
+            removed, common.format_size(freed)))
+
+        if backend.FOLDER is None:
+            self.p_main('The cache is disabled')
+            return
+
+        limit = backend.LIMIT
+        if self.args.to is not None:
+            limit = common.parse_size(self.args.to)
+
+        self.p_main('Pruning the cache to {}'.format(
+            common.format_size(limit)))
+
+        removed, freed = backend.prune(limit)
+
+        self.p_sub('Removed {} files, freed {}'.format(
+            removed, common.format_size(freed)))
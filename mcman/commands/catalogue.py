@@ -0,0 +1,75 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The catalogue command of mcman.
+
+This module is the home of the front end part of the command. This means that
+as little as possible logic should go here. The logic is placed in the
+catalogue module in the plugins package.
+
+"""
+
+import time
+from urllib.error import URLError
+
+from mcman.logic.plugins import catalogue as backend
+from mcman.logic.plugins import plugins
+from mcman.command import Command
+
+
+class CatalogueCommand(Command):
+
+    """ The catalogue command of mcman. """
+
+    def __init__(self, args):
+        """ Parse command, and execute tasks. """
+        Command.__init__(self)
+
+        self.args = args
+
+        self.register_subcommand('sync', self.sync)
+        self.register_subcommand('status', self.status)
+
+        self.invoke_subcommand(args.subcommand, (ValueError, OSError,
+                                                 URLError))
+
+    def sync(self):
+        """ Update the catalogue from BukGet. """
+        plugins.init(self.args.base_url, self.args.user_agent)
+
+        if self.args.full:
+            self.p_main('Fetching all plugins from BukGet')
+        else:
+            self.p_main('Fetching the plugins updated since the last sync')
+
+        fetched, total = backend.sync(self.args.full)
+
+        self.p_sub('Fetched {} plugins, the catalogue has {} plugins'.format(
+            fetched, total))
+
+    def status(self):
+        """ Show how many plugins the catalogue has, and how new it is. """
+        total, synced = backend.status()
+
+        self.p_main('Catalogue in {}:'.format(backend.CATALOGUE_FILE))
+        self.p_blank()
+        self.p_sub('Plugins:        {}', total)
+        if synced > 0:
+            self.p_sub('Newest version: {}', time.strftime(
+                '%Y-%m-%d %H:%M', time.localtime(synced)))
+        else:
+            self.p_sub('Newest version: never synced')
+        self.p_blank()
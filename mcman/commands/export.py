@@ -26,7 +26,7 @@ import json
 import mcman.logic.servers as s_backend
 from mcman.logic.plugins import plugins as p_backend
 from mcman.logic.plugins import utils as p_utils
-from mcman.logic import common
+from mcman.logic import common, index
 from mcman.command import Command
 
 
@@ -41,6 +41,9 @@ class ExportCommand(Command):
 
         args.types = args.types.split(',')
 
+        p_backend.init(args.base_url, args.user_agent)
+        s_backend.init(args.spacegdn_url, args.user_agent)
+
         if args.quiet:
             self.printer = lambda *a, **b: None
 
@@ -56,7 +59,8 @@ class ExportCommand(Command):
 
         if 'plugins' in self.args.types:
             self.p_main('Finding plugins')
-            for plugin in p_backend.list_plugins():
+            installed = p_backend.list_plugins(self.args.scan_workers)
+            for plugin in installed:
                 version = p_utils.select_installed_version(plugin)
                 plugins[plugin['installed_file']] = (plugin['slug'],
                                                      version['slug'])
@@ -71,6 +75,7 @@ class ExportCommand(Command):
             server = dict()
             server['id'] = key
             server['file'] = file
+            server['sha256'] = index.digests(file)['sha256']
 
             document['servers'].append(server)
 
@@ -80,8 +85,11 @@ class ExportCommand(Command):
             plugin['file'] = file
             plugin['slug'] = slug
             plugin['version-slug'] = version
+            plugin['sha256'] = index.digests(file)['sha256']
 
             document['plugins'].append(plugin)
 
+        index.save()
+
         self.args.output.write(json.dumps(document))
         self.args.output.write('\n')
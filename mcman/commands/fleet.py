@@ -0,0 +1,74 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The fleet command of mcman.
+
+This module is the home of the front end part of the command. This means that
+as little as possible logic should go here. The logic is placed in the fleet
+module in the logic package.
+
+"""
+
+from urllib.error import URLError
+
+from mcman.logic import fleet as backend
+from mcman.logic.plugins import plugins
+from mcman.command import Command
+
+
+class FleetCommand(Command):
+
+    """ The fleet command of mcman. """
+
+    def __init__(self, args):
+        """ Parse command, and execute tasks. """
+        Command.__init__(self)
+
+        self.args = args
+
+        plugins.init(args.base_url, args.user_agent, args.offline)
+
+        self.register_subcommand('scan', self.scan)
+
+        self.invoke_subcommand(args.subcommand, (ValueError, OSError,
+                                                 URLError))
+
+    def scan(self):
+        """ Scan the plugins of several servers, and report outdated ones. """
+        roots = self.args.roots
+        self.p_main('Scanning the plugins of {} servers'.format(len(roots)))
+
+        scans = backend.scan(roots, self.args.scan_workers, self.args.jobs)
+        installed = sum(len(found) for found in scans.values())
+        unique = len(backend.unique_jars(scans))
+        self.p_sub('Found {} plugins, {} distinct jars'.format(installed,
+                                                               unique))
+
+        self.p_main('Looking up {} jars on BukGet'.format(unique))
+        report = backend.outdated(scans, self.args.version)
+
+        if len(report) == 0:
+            self.p_main('All plugins are up to date')
+            return
+
+        self.p_main('Outdated plugins:')
+        self.p_blank()
+        for name, version, newest, outdated_roots in report:
+            self.p_sub('{} {} -- Out of date, newest version: {}'.format(
+                name, version, newest))
+            for root in outdated_roots:
+                self.p_sub('    {}'.format(root))
+        self.p_blank()
@@ -43,6 +43,9 @@ class ImportCommand(Command):
 
         self.to_download = list()
 
+        p_backend.init(args.base_url, args.user_agent)
+        s_backend.init(args.spacegdn_url, args.user_agent)
+
         self.run()
 
     def run(self):
@@ -83,11 +86,9 @@ class ImportCommand(Command):
             common.download(jar[1], destination=destination, checksum=jar[2],
                             prefix=this_prefix)
             if jar[1].endswith('.zip'):
-                print(' ' * len(this_prefix) + "Unzipping...", end=' ')
                 p_backend.unzip_plugin(destination,
                                        '/'.join(jar[0].split('/')[:-1]) + '/')
                 os.remove(destination)
-                print('Success')
 
     def parse_plugins(self, plugins, remote_plugins):
         """ Populate the to_download list with plugins to download. """
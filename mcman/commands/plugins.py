@@ -22,7 +22,6 @@ module in the backend package.
 
 """
 
-import os
 from urllib.error import URLError
 
 from mcman.logic.plugins import plugins as backend
@@ -42,7 +41,7 @@ class PluginsCommand(Command):
         self.server = args.server
         self.args = args
 
-        backend.init(args.base_url, args.user_agent)
+        backend.init(args.base_url, args.user_agent, args.offline)
         backend.VERSION = self.args.version
 
         self.register_subcommand('search', self.search)
@@ -139,7 +138,7 @@ class PluginsCommand(Command):
         """ List installed plugins. """
         self.p_main('Finding installed plugins')
 
-        plugins = backend.list_plugins()
+        plugins = backend.list_plugins(self.args.scan_workers)
 
         if len(plugins) == 0:
             self.p_sub('Found no plugins')
@@ -176,7 +175,7 @@ class PluginsCommand(Command):
         self.args.ignored = [e.lower() for e in self.args.ignored]
 
         self.p_main('Finding installed plugins')
-        installed = backend.list_plugins()
+        installed = backend.list_plugins(self.args.scan_workers)
 
         self.p_main('Finding plugins on BukGet')
         plugins = backend.dependencies(self.args.server, self.args.plugins,
@@ -217,7 +216,7 @@ class PluginsCommand(Command):
         backend.download('Continue to download?',
                          '({{part:>{}}}/{{total}}) '.format(
                              len(str(len(plugins)))),
-                         plugins, self.args.no_confirm)
+                         plugins, self.args.no_confirm, self.args.jobs)
 
         self.p_blank()
         self.p_raw('Done!')
@@ -228,7 +227,7 @@ class PluginsCommand(Command):
 
         self.p_main('Finding installed plugins')
 
-        installed = backend.list_plugins()
+        installed = backend.list_plugins(self.args.scan_workers)
 
         self.p_main('Looking up versions on BukGet')
 
@@ -263,10 +262,7 @@ class PluginsCommand(Command):
         if common.ask('Continue to update?', skip=self.args.no_confirm):
             prefix_format = '({{part:>{}}}/{{total}}) '.format(
                 len(str(len(to_update))))
-            for i in range(len(to_update)):
-                plugin = to_update[i]
-                os.remove(plugin['installed_file'])
-                prefix = prefix_format.format(total=len(to_update), part=i+1)
-                backend.download_plugin(plugin, prefix)
+            backend.download_plugins(to_update, prefix_format,
+                                     self.args.jobs, replace=True)
             self.p_blank()
             self.p_raw('Done!')
@@ -16,10 +16,12 @@
 
 """ The server command of mcman. """
 
+import os
 from urllib.error import URLError
 
 from mcman.logic import servers as backend
 from mcman.logic import common as utils
+from mcman.logic import progress
 from mcman.command import Command
 
 
@@ -119,7 +121,10 @@ class ServersCommand(Command):
         """ Identify what server a jar file is. """
         self.p_main('Calculating checksum of `{}`'.format(self.args.jar.name))
 
-        checksum = utils.checksum_file(self.args.jar)
+        task = progress.start('checksum', self.args.jar.name,
+                              os.fstat(self.args.jar.fileno()).st_size)
+        checksum = utils.checksum_file(self.args.jar, task)
+        task.finish()
         self.args.jar.close()
 
         self.p_main('Finding build on SpaceGDN')
@@ -0,0 +1,71 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The watch command of mcman.
+
+This module is the home of the front end part of the command. This means that
+as little as possible logic should go here. The logic is placed in the watch
+module in the logic package.
+
+"""
+
+from mcman.logic import common, servers
+from mcman.logic import watch as backend
+from mcman.logic.plugins import plugins
+from mcman.command import Command
+
+
+class WatchCommand(Command):
+
+    """ The watch command of mcman. """
+
+    def __init__(self, args):
+        """ Parse command and execute tasks. """
+        Command.__init__(self)
+        self.args = args
+
+        plugins.init(args.base_url, args.user_agent, args.offline)
+        servers.init(args.spacegdn_url, args.user_agent)
+
+        self.run()
+
+    def run(self):
+        """ Run the command. """
+        plugins_folder = common.find_plugins_folder()
+        folders = sorted({plugins_folder, '.'})
+        state = backend.State(plugins_folder, '.', self.args.version)
+
+        self.p_main('Finding installed plugins and servers')
+        state.refresh()
+        snapshot = state.snapshot()
+        self.p_sub('Found {} plugins and {} server jars'.format(
+            len(snapshot['plugins']), len(snapshot['servers'])))
+
+        watcher = backend.watcher(folders, self.args.poll, self.args.interval)
+        method = 'polling' if type(watcher) is backend.PollingWatcher \
+            else 'inotify'
+        self.p_main('Watching {} with {}'.format(', '.join(folders), method))
+
+        server = backend.serve(state, (self.args.host, self.args.port))
+        self.p_main('Serving the state on http://{}:{}/'.format(
+            *server.server_address[:2]))
+
+        try:
+            backend.watch(state, watcher)
+        finally:
+            server.shutdown()
+            server.server_close()
+            watcher.close()
@@ -0,0 +1,93 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Asynchronous access to BukGet and SpaceGDN.
+
+pyBukGet and pySpaceGDN block while they wait for the API. A Client wraps one
+of them, and has a coroutine for each of it's functions, which runs the
+function in the executor of the event loop. Independent queries can then be
+sent at the same time with asyncio.gather.
+
+The logic modules have async versions of the functions that send
+independent queries, and the normal functions wrap them with run. All event
+loops share one executor, so the threads are reused between the calls.
+
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# How many queries may be waiting for an API at once
+MAX_WORKERS = 8
+
+_LOCK = threading.Lock()
+_EXECUTOR = None
+
+
+def executor():
+    """ Return the executor of the queries, and create it if needed. """
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(MAX_WORKERS)
+        return _EXECUTOR
+
+
+class Client(object):
+
+    """ An asynchronous client for BukGet or SpaceGDN.
+
+    The client has the same functions as the module it wraps, but they are
+    coroutines. For example:
+        plugins = await Client(bukget).search(query, fields='slug')
+
+    """
+
+    def __init__(self, module):
+        """ Initialize the client, which wraps `module`. """
+        self.module = module
+
+    def __getattr__(self, name):
+        """ Return a coroutine function for the function `name`. """
+        function = getattr(self.module, name)
+        if not callable(function):
+            return function
+
+        async def call(*args, **kwargs):
+            """ Call the function in the shared executor. """
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                executor(), functools.partial(function, *args, **kwargs))
+        return call
+
+
+def run(coroutine):
+    """ Run `coroutine` to the end on a new event loop, and return it's result.
+
+    The queries of the clients run in the shared executor, so only the event
+    loop is made for each call. This is safe to call from several threads at
+    once.
+
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,301 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" A local cache of downloaded files, shared by all servers.
+
+The files are stored as blobs named by their MD5 checksum, which is what
+BukGet and SpaceGDN give us for each plugin version and build. When the cache
+is larger than the limit, the least recently used blobs are removed.
+
+Files are hard linked between the cache and the servers when they are on the
+same file system. Identical jars used by many servers on the same host are
+then only stored once on disk, and in the page cache. mcman always replaces
+files instead of writing to them, so a link is never changed in place by
+mcman. Blobs are verified before they are installed, in case something else
+wrote to one of the links. They are not made read-only, as that would make
+the installed links read-only too.
+
+A blob and it's links share one inode, so the use of a blob is not recorded
+on the blob itself, as that would change the modification time of every
+installed copy. It is recorded as the modification time of a sidecar file
+next to the blob instead, named like the blob with USED_SUFFIX.
+
+"""
+
+import os
+import re
+import shutil
+
+# The default size limit of the cache, in bytes
+DEFAULT_LIMIT = 1024 ** 3
+
+# The folder the blobs are stored in. None when the cache is disabled.
+FOLDER = None
+# The size limit of the cache, in bytes
+LIMIT = DEFAULT_LIMIT
+# Whether to hard link files instead of copying them
+LINK = True
+
+CHECKSUM_PATTERN = re.compile('^[0-9a-f]{32}$')
+# The suffix of the sidecar files which record when a blob was last used
+USED_SUFFIX = '.used'
+
+
+def cache_home():
+    """ Return the folder mcman keeps it's caches in.
+
+    This is $XDG_CACHE_HOME/mcman, or ~/.cache/mcman if XDG_CACHE_HOME is not
+    set.
+
+    """
+    home = os.environ.get('XDG_CACHE_HOME')
+    if not home:
+        home = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(home, 'mcman')
+
+
+def default_folder():
+    """ Return the default folder for the blobs. """
+    return os.path.join(cache_home(), 'artifacts')
+
+
+def init(folder=None, limit=DEFAULT_LIMIT, link=True):
+    """ Initialize the cache.
+
+    Up to three parameters are accepted:
+        folder=None              The folder to store the blobs in. Defaults to
+                                 the folder returned by default_folder().
+        limit=DEFAULT_LIMIT      The size limit in bytes. If it is 0 the cache
+                                 is disabled.
+        link=True                Whether to hard link files to and from the
+                                 cache instead of copying them.
+
+    """
+    global FOLDER, LIMIT, LINK
+    if limit <= 0:
+        FOLDER = None
+    else:
+        FOLDER = folder if folder is not None else default_folder()
+    LIMIT = limit
+    LINK = link
+
+
+def blob_path(checksum):
+    """ Return the path of the blob with the `checksum`.
+
+    None is returned if the cache is disabled, or the checksum is not a MD5
+    checksum.
+
+    """
+    if FOLDER is None or checksum is None:
+        return None
+    checksum = checksum.lower()
+    if not CHECKSUM_PATTERN.match(checksum):
+        return None
+    return os.path.join(FOLDER, checksum[:2], checksum)
+
+
+def mark_used(path):
+    """ Record that the blob at `path` was used now, in it's sidecar file. """
+    try:
+        with open(path + USED_SUFFIX, 'a'):
+            pass
+        os.utime(path + USED_SUFFIX)
+    except OSError:
+        pass
+
+
+def last_used(path):
+    """ Return when the blob at `path` was last used, as a timestamp. """
+    try:
+        return os.stat(path + USED_SUFFIX).st_mtime
+    except OSError:
+        return os.stat(path).st_mtime
+
+
+def verify(path, checksum):
+    """ Return whether the blob at `path` still has the `checksum`.
+
+    The MD5 checksum is taken from the index, so an unchanged blob is not
+    read again. A blob that was written to through one of it's links gets a
+    new size or modification time, and is hashed again.
+
+    """
+    # Imported here, as the index uses the cache folder
+    from mcman.logic import index
+    try:
+        return index.digests(path)['md5'] == checksum
+    except OSError:
+        return False
+
+
+def evict(path):
+    """ Remove the blob at `path` and it's sidecar file. """
+    for file in (path, path + USED_SUFFIX):
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+
+
+def lookup(checksum):
+    """ Find the blob with the `checksum`.
+
+    The path to the blob is returned, or None if it is not cached. A blob
+    which does not have the checksum any more is removed. The blob is marked
+    as used.
+
+    """
+    path = blob_path(checksum)
+    if path is None or not os.path.isfile(path):
+        return None
+    if not verify(path, checksum.lower()):
+        evict(path)
+        return None
+    mark_used(path)
+    return path
+
+
+def install(checksum, destination):
+    """ Install the blob with the `checksum` to `destination`.
+
+    The blob is hard linked to the destination if LINK is True and it is
+    possible, else it is copied. Anything already at the destination is
+    replaced.
+
+    True is returned if the blob was cached and installed, else False.
+
+    """
+    path = lookup(checksum)
+    if path is None:
+        return False
+
+    temporary = destination + '.cache'
+    try:
+        link_or_copy(path, temporary)
+        os.replace(temporary, destination)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return False
+    return True
+
+
+def store(path, checksum):
+    """ Store the file at `path` in the cache as the blob for `checksum`.
+
+    The file is hard linked into the cache if LINK is True and it is possible,
+    else it is copied. The caller must have verified that the checksum of the
+    file is right. The cache is pruned to the size limit afterwards. Failures
+    are ignored, as the cache is just an optimization.
+
+    """
+    blob = blob_path(checksum)
+    if blob is None or os.path.isfile(blob):
+        return
+
+    temporary = blob + '.tmp{}'.format(os.getpid())
+    try:
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        link_or_copy(path, temporary)
+        os.replace(temporary, blob)
+        mark_used(blob)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return
+
+    prune(LIMIT)
+
+
+def link_or_copy(source, destination):
+    """ Hard link `source` to `destination`, or copy it if that fails.
+
+    The file is always copied if LINK is False.
+
+    """
+    if LINK:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source, destination)
+
+
+def blobs():
+    """ List the blobs in the cache.
+
+    A list of (last used time, size, path) tuples is returned, sorted with
+    the least recently used first.
+
+    """
+    if FOLDER is None or not os.path.isdir(FOLDER):
+        return []
+
+    result = list()
+    for prefix in os.listdir(FOLDER):
+        folder = os.path.join(FOLDER, prefix)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if not CHECKSUM_PATTERN.match(name):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                size = os.stat(path).st_size
+                used = last_used(path)
+            except OSError:
+                continue
+            result.append((used, size, path))
+
+    result.sort()
+    return result
+
+
+def stats():
+    """ Return a tuple with the amount of blobs and their total size. """
+    found = blobs()
+    return len(found), sum(blob[1] for blob in found)
+
+
+def prune(limit=None):
+    """ Remove the least recently used blobs until the cache fits `limit`.
+
+    The limit defaults to LIMIT. A tuple with the amount of removed blobs and
+    the bytes freed is returned.
+
+    """
+    if limit is None:
+        limit = LIMIT
+
+    found = blobs()
+    size = sum(blob[1] for blob in found)
+    removed = 0
+    freed = 0
+    for _, blob_size, path in found:
+        if size <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        evict(path)
+        size -= blob_size
+        freed += blob_size
+        removed += 1
+
+    return removed, freed
@@ -15,15 +15,32 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """ Common utilities for the plugin and server backends. """
-import sys
 import hashlib
 import os
 import os.path
 import struct
 import termios
 import fcntl
-from urllib.request import urlretrieve
-from math import ceil
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.error import ContentTooShortError, HTTPError
+from urllib.parse import urlparse
+from zipfile import BadZipFile, ZipInfo
+
+from mcman.logic import cache, progress, ratelimit, transport
+
+# The default amount of concurrent downloads
+DEFAULT_JOBS = 4
+# The size of the chunks files are read and downloaded in
+CHUNK_SIZE = 64 * 1024
+# How many times a download is attempted before giving up
+RETRIES = 3
+# The suffixes of sizes, each is 1024 times the last
+SIZE_SUFFIXES = 'KMGT'
+# The message of a download with the wrong checksum
+CHECKSUM_MISMATCH = ('The checksums did not match! The installed file was '
+                     'kept.')
 
 
 def levenshtein(first, second):
@@ -93,8 +110,8 @@ def list_names(array, separator=', ', last_separator=' and '):
 
 
 def download(url, destination=None, checksum=None, prefix='',
-             display_name=None):
-    """ Download with progressbar.
+             display_name=None, task=None):
+    """ Download with progress.
 
     Arguments:
         url             URL to download from.
@@ -107,6 +124,18 @@ def download(url, destination=None, checksum=None, prefix='',
                         Defaults to an empty string.
         display_name    The name to display on the left side instead of the
                         destination. Defaults to None.
+        task            The progress task to report to. Defaults to None. When
+                        it is None a download task is started, and finished
+                        with the result. A task that is passed is not
+                        finished.
+
+    The file is downloaded to a temporary file next to the destination, and
+    only moved into place when the checksum is verified. The file at the
+    destination is therefore left untouched if the download fails.
+
+    If the checksum is given, and a file with that checksum is in the cache,
+    the file is installed from the cache instead of being downloaded. Files
+    that are downloaded and checked are stored in the cache.
 
     True is returned if the checksum succeeds or is not done, False only if it
     fails.
@@ -121,21 +150,266 @@ def download(url, destination=None, checksum=None, prefix='',
     if '/' in destination:
         makedirs(destination)
 
-    term_width = get_term_width()
-    pprefix = prefix + display_name
-    progress = create_progress_bar(prefix=pprefix, width=term_width)
-    urlretrieve(url, filename=destination, reporthook=progress)
+    own_task = task is None
+    if own_task:
+        task = progress.start('download', prefix + display_name)
+
+    if checksum is not None and len(checksum) == 0:
+        checksum = None
+    if checksum is not None and cache.install(checksum, destination):
+        task.update(1, 1)
+        if own_task:
+            task.finish(True, 'Found in cache')
+        return True
+
+    try:
+        actual_checksum = retrieve(url, destination,
+                                   reporthook=task.reporthook,
+                                   checksum=checksum)
+    except (OSError, HTTPException) as error:
+        if own_task:
+            task.finish(False, 'Error: {}'.format(error))
+        raise
+
+    success = checksum is None or actual_checksum == checksum
+    if success and checksum is not None:
+        cache.store(destination, checksum)
+    if own_task:
+        task.finish(success, None if success else CHECKSUM_MISMATCH)
+    return success
+
+
+def retrieve(url, destination, reporthook=None, retries=RETRIES,
+             checksum=None):
+    """ Download `url` to `destination`, and checksum it on the way.
+
+    The file is downloaded in chunks of CHUNK_SIZE, and each chunk is fed to
+    the MD5 hash as it is written. The file is therefore never read again.
+
+    The data is written to `destination` + '.part', which is moved to
+    `destination` with os.replace when the download is done and the checksum
+    is verified. If the checksum does not match, the .part file is removed,
+    and `destination` is left untouched. If the connection is lost, the
+    download is retried, continuing from the end of the .part file with a
+    Range request. An If-Range header with the ETag or Last-Modified date from
+    the first response makes the server send the whole file again if it has
+    changed. The .part file is kept when all attempts fail, so the next
+    download of the same url continues from it. Retries are delayed with a
+    jittered backoff, see transport.backoff, and not made after the deadline,
+    or when the request already failed over to every mirror.
+
+    Arguments:
+        url           URL to download from.
+        destination   Path to download the file to.
+        reporthook    Progress hook with the same signature as the hook of
+                      urlretrieve. Defaults to None.
+        retries       How many times to try the download. Defaults to
+                      RETRIES.
+        checksum      The MD5 checksum the file must have to be moved into
+                      place. Defaults to None, which accepts any file.
+
+    The MD5 checksum of the downloaded file is returned. The last error is
+    raised if none of the attempts succeeds.
+
+    """
+    part = destination + '.part'
+    error = None
+    for attempt in range(max(retries, 1)):
+        if attempt > 0:
+            transport.backoff(attempt - 1)
+        try:
+            actual_checksum = retrieve_part(url, part, reporthook)
+            break
+        except transport.DeadlineExceeded:
+            raise
+        except HTTPError as err:
+            if err.code == 416:
+                # The .part file does not fit the remote file any more
+                remove_part(part)
+            elif err.code < 500 or transport.failed_over(err):
+                raise
+            error = err
+        except (OSError, HTTPException) as err:
+            if transport.failed_over(err):
+                raise
+            error = err
+    else:
+        raise error
+
+    if checksum is not None and actual_checksum != checksum:
+        remove_part(part)
+        return actual_checksum
+
+    os.replace(part, destination)
+    os.remove(part + '.meta')
+    return actual_checksum
+
 
-    if checksum is not None and len(checksum) > 0:
-        print('\n' + ' ' * len(prefix) + 'Checking checksum...', end=' ')
-        actual_checksum = checksum_file(destination)
-        if actual_checksum == checksum:
-            print('Success')
+def retrieve_part(url, part, reporthook=None):
+    """ Make one attempt at downloading `url` to the .part file `part`.
+
+    The download continues from the end of `part` if there is a matching meta
+    file next to it, and is throttled to the limits in ratelimit. See retrieve
+    for more information.
+
+    The MD5 checksum of the whole file is returned. ContentTooShortError is
+    raised if the connection is closed before the whole file is received.
+
+    """
+    meta_file = part + '.meta'
+    meta = read_part_meta(meta_file)
+    host = urlparse(url).hostname
+
+    headers = {'Accept-Encoding': 'identity'}
+    offset = 0
+    if os.path.isfile(part) and meta.get('url') == url \
+            and meta.get('validator'):
+        offset = os.path.getsize(part)
+        headers['Range'] = 'bytes={}-'.format(offset)
+        headers['If-Range'] = meta['validator']
+
+    with transport.open(url, headers=headers) as response:
+        md5 = hashlib.md5()
+        if offset > 0 and response.status == 206 \
+                and content_range_start(response.headers) == offset:
+            mode = 'ab'
+            with open(part, 'rb') as file:
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                    md5.update(chunk)
         else:
-            os.remove(destination)
-            print('The checksums did not match! The file was deleted.')
-            return False
-    return True
+            # The server sent the whole file
+            mode = 'wb'
+            offset = 0
+            meta = {'url': url, 'validator': validator(response.headers)}
+            with open(meta_file, 'w') as file:
+                json.dump(meta, file)
+
+        length = int(response.headers.get('Content-Length', -1))
+        total = offset + length if length >= 0 else -1
+        size = offset
+        with open(part, mode) as file:
+            if reporthook is not None:
+                reporthook(size, 1, total)
+            while True:
+                transport.check_deadline()
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                ratelimit.throttle(host, len(chunk))
+                file.write(chunk)
+                md5.update(chunk)
+                size += len(chunk)
+                if reporthook is not None:
+                    reporthook(size, 1, total)
+
+    if total >= 0 and size < total:
+        raise ContentTooShortError(
+            'retrieval incomplete: got only {} out of {} bytes'.format(
+                size, total), None)
+    return md5.hexdigest()
+
+
+def read_part_meta(meta_file):
+    """ Read the meta file of a .part file.
+
+    A dict with the url and validator of the .part file is returned. The dict
+    is empty if the meta file doesn't exist or can't be read.
+
+    """
+    try:
+        with open(meta_file, 'r') as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return dict()
+    if type(meta) is not dict:
+        return dict()
+    return meta
+
+
+def remove_part(part):
+    """ Remove a .part file and it's meta file, if they exist. """
+    for file in (part, part + '.meta'):
+        if os.path.exists(file):
+            os.remove(file)
+
+
+def validator(headers):
+    """ Find a validator for the If-Range header in the response headers.
+
+    A strong ETag is preferred, then the Last-Modified date. None is returned
+    if neither is usable.
+
+    """
+    etag = headers.get('ETag')
+    if etag is not None and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def content_range_start(headers):
+    """ Return the first byte of the Content-Range header, or -1. """
+    content_range = headers.get('Content-Range', '')
+    try:
+        unit, ranges = content_range.split(' ', 1)
+        if unit != 'bytes':
+            return -1
+        return int(ranges.split('-', 1)[0])
+    except ValueError:
+        return -1
+
+
+def download_many(downloads, jobs=DEFAULT_JOBS):
+    """ Download files concurrently.
+
+    The downloads are done by a bounded pool of `jobs` workers. The files
+    with a known size are started first, largest first, and the rest in the
+    order they are given. No requests are made to find the sizes. While the
+    downloads are running one progress bar line is displayed for each active
+    transfer.
+
+    Arguments:
+        downloads    A list of (display name, size, function) tuples. The
+                     size is in bytes, or None if it is not known. The
+                     function does the actual download. It is called in a
+                     worker thread with the progress task as the only
+                     argument, and it should return whether the download
+                     succeeded.
+        jobs         How many downloads to run at once. Defaults to
+                     DEFAULT_JOBS.
+
+    A list with whether each download succeeded is returned, in the same order
+    as `downloads`. A failing download does not affect the others.
+
+    """
+    if len(downloads) < 1:
+        return []
+    jobs = max(1, min(jobs, len(downloads)))
+
+    # sorted is stable, so the files of unknown size keep their order
+    order = sorted(range(len(downloads)),
+                   key=lambda i: (downloads[i][1] is None,
+                                  -(downloads[i][1] or 0)))
+
+    results = [False] * len(downloads)
+
+    def worker(index):
+        """ Run one download, and report the result. """
+        name, _, function = downloads[index]
+        task = progress.start('download', name)
+        try:
+            results[index] = function(task)
+            message = None if results[index] else CHECKSUM_MISMATCH
+        except (OSError, HTTPException, ValueError, BadZipFile) as error:
+            message = 'Error: {}'.format(error)
+        task.finish(results[index], message)
+
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = [executor.submit(worker, index) for index in order]
+        # Raise unexpected exceptions from the workers
+        for future in futures:
+            future.result()
+
+    return results
 
 
 def makedirs(file):
@@ -145,60 +419,83 @@ def makedirs(file):
         os.makedirs(folder)
 
 
-def create_progress_bar(width, prefix=None):
-    """ Create a progress bar.
+def digest_file(file, algorithms=('md5', ), task=None):
+    """ Calculate several digests of a file in one pass.
 
-    This returns a function which can be used as the progress hook for
-    urlretrieve. If you don't want to use the function of urlretrieve, the
-    signature for the function is int, int, int: Count, count_size, max.
+    The file is read once, in chunks of CHUNK_SIZE, and each chunk is passed
+    to all the hashers. So the memory usage is the same no matter how big
+    the file is, and extra digests cost no extra reads.
 
-    Intended for the download function.
+    Up to three parameters are accepted:
+        file                  The name of the file to digest, or the
+                              (relative) path to it. An open binary file may
+                              be passed instead.
+        algorithms=('md5', )  The names of the algorithms, as accepted by
+                              hashlib.new.
+        task=None             A progress task to advance with the bytes read.
+
+    A dict from each algorithm to the hex digest is returned.
 
     """
-    left = ceil(width/2)
-    right = width-left
-    net_bar_size = right-8
-    char_size = net_bar_size/100
-    frmt = '{{prefix:<{}}}[{{bar_left}}{{bar_right}}] {{prc}}%\r'.format(left)
-    last_percent = -1
-
-    def progress_hook(count, blocksize, totalsize):
-        """ Progress hook. """
-        percent = min(ceil(count*blocksize*100/totalsize), 100)
-        nonlocal last_percent
-        if percent == last_percent:
-            return
-        else:
-            last_percent = percent
-        fill_size = int(char_size*percent)
-        empty_size = net_bar_size-fill_size
-        text = frmt.format(prefix=prefix,
-                           bar_left=('='*(fill_size-1)+'>' if percent < 100
-                                     else '='*fill_size),
-                           bar_right=' '*empty_size,
-                           prc=percent)
+    if type(file) is str:
+        with open(file, 'rb') as file:
+            return digest_file(file, algorithms, task)
 
-        sys.stdout.write(text)
-        sys.stdout.flush()
+    hashers = [(name, hashlib.new(name)) for name in algorithms]
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        for _, hasher in hashers:
+            hasher.update(chunk)
+        if task is not None:
+            task.advance(len(chunk))
+    return {name: hasher.hexdigest() for name, hasher in hashers}
 
-    progress_hook(0, 1, 100)
-    return progress_hook
 
+def checksum_file(file, task=None):
+    """ Checksum a file.
 
-def checksum_file(file):
-    """ MD5 Checksum of file.
+    This function will return the MD5 checksum of the file. See digest_file
+    for the parameters.
 
-    This function will return the MD5 checksum of the file.
+    """
+    return digest_file(file, ('md5', ), task)['md5']
 
-    One parameter is accepted:
-        file    The name of the file to checksum, or the (relative) path to it.
+
+def parse_size(size):
+    """ Parse a size like '20M' or '1.5G' to a number of bytes.
+
+    The suffixes K, M, G and T are accepted, in upper or lower case, and are
+    powers of 1024. A trailing 'B' or 'iB' is ignored. ValueError is raised if
+    the size can't be parsed.
 
     """
-    if type(file) is str:
-        with open(file, 'rb') as file:
-            return checksum_file(file)
-    else:
-        return hashlib.md5(file.read()).hexdigest()
+    text = str(size).strip().upper()
+    for suffix in ('IB', 'B'):
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[:-len(suffix)]
+            break
+    multiplier = 1
+    if len(text) > 0 and text[-1] in SIZE_SUFFIXES:
+        multiplier = 1024 ** (SIZE_SUFFIXES.index(text[-1]) + 1)
+        text = text[:-1]
+    try:
+        value = float(text)
+    except ValueError:
+        raise ValueError('Invalid size: {}'.format(size))
+    if value < 0:
+        raise ValueError('Invalid size: {}'.format(size))
+    return int(value * multiplier)
+
+
+def format_size(size):
+    """ Format a number of bytes to a human readable string. """
+    value = float(size)
+    for suffix in ('B', ) + tuple(s + 'iB' for s in SIZE_SUFFIXES):
+        if value < 1024 or suffix == 'TiB':
+            break
+        value /= 1024
+    if suffix == 'B':
+        return '{} B'.format(int(value))
+    return '{:.1f} {}'.format(value, suffix)
 
 
 def replace_last(string, old, new):
@@ -224,24 +521,33 @@ def get_term_width(term=1):
         return 80
 
 
-def extract_file(zipped, file, dest):
+def extract_file(zipped, file, dest, task=None):
     """ Extract file from ZipFile archive to dest.
 
     This function will extract the file in `file` in the zip archive to the
     file in `dest` in the filesystem. Folders are handled correctly, too.
+    Files are streamed in chunks of CHUNK_SIZE to a temporary file, and then
+    moved into place, so the whole file is never held in memory.
 
-    This function takes three arguments:
-        zipped    The ZipFile to extract the file from.
-        file      The path in the ZipFile to the file to extract.
-        dest      The path in the filesystem to the destination.
+    This function takes up to four arguments:
+        zipped       The ZipFile to extract the file from.
+        file         The path in the ZipFile to the file to extract, or the
+                     ZipInfo of it.
+        dest         The path in the filesystem to the destination.
+        task=None    A progress task to advance with the bytes extracted.
 
     """
+    name = file.filename if isinstance(file, ZipInfo) else file
     if '/' in dest:
         os.makedirs('/'.join(dest.split('/')[:-1]), exist_ok=True)
-    if not file.endswith('/'):
-        content = zipped.read(file)
-        with open(dest, 'wb') as dest:
-            dest.write(content)
+    if not name.endswith('/'):
+        temporary = dest + '.part'
+        with zipped.open(file) as source, open(temporary, 'wb') as target:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                target.write(chunk)
+                if task is not None:
+                    task.advance(len(chunk))
+        os.replace(temporary, dest)
 
 
 def ask(question, default=True, skip=False):
@@ -294,13 +600,14 @@ def format_name(name):
     return name
 
 
-def find_plugins_folder():
-    """ Find the plugins folder.
+def find_plugins_folder(root='.'):
+    """ Find the plugins folder of the server in `root`.
 
     This will return the relative path to the plugins folder.
-    Currently either '.' or 'plugins' is returend.
+    Currently either `root`/plugins or `root` is returned, which is 'plugins'
+    or '.' for the current folder.
 
     """
-    if 'plugins' in os.listdir('.'):
-        return 'plugins'
-    return '.'
+    if 'plugins' in os.listdir(root):
+        return os.path.normpath(os.path.join(root, 'plugins'))
+    return os.path.normpath(root)
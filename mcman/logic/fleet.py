@@ -0,0 +1,91 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The backend for the mcman fleet command.
+
+A fleet is a set of server folders on the same host. The plugins of all of
+them are scanned at once, and each distinct jar is looked up on BukGet only
+once, no matter how many servers it is installed on.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mcman.logic import common
+from mcman.logic.plugins import plugins, utils
+
+
+def scan(roots, workers=None, jobs=common.DEFAULT_JOBS):
+    """ Scan the installed plugins of the servers in `roots`.
+
+    Up to `jobs` servers are scanned at once, and `workers` is passed to
+    scan_installed_plugins for each of them. A dict from each root to a list
+    of the tuples from scan_installed_plugins is returned.
+
+    """
+    def scan_root(root):
+        """ Scan the plugins of the server in `root`. """
+        folder = common.find_plugins_folder(root)
+        return list(plugins.scan_installed_plugins(workers, folder=folder))
+
+    with ThreadPoolExecutor(max(1, jobs)) as executor:
+        results = list(executor.map(scan_root, roots))
+    return dict(zip(roots, results))
+
+
+def unique_jars(scans):
+    """ Return one tuple for each distinct jar in `scans`.
+
+    `scans` is a dict like the one from scan. The jars are told apart by
+    their checksum.
+
+    """
+    jars = dict()
+    for installed in scans.values():
+        for record in installed:
+            jars.setdefault(record[0], record)
+    return list(jars.values())
+
+
+def outdated(scans, v_type='release'):
+    """ Find the outdated plugins in `scans`.
+
+    `scans` is a dict like the one from scan. All distinct jars are looked up
+    on BukGet in one batched set of queries, and each installed plugin is
+    paired with it's plugin dict by it's checksum, so every installed version
+    of a plugin is compared with the newest version of `v_type`.
+
+    A list of tuples is returned, one for each outdated plugin version:
+        (plugin name, installed version, newest version, roots)
+    where roots is a sorted list of the servers it is installed on. The list
+    is sorted by the plugin name and the installed version.
+
+    """
+    found = plugins.lookup_plugin_checksums(unique_jars(scans))
+
+    report = dict()
+    for root, installed in scans.items():
+        for md5, _, name, version, _ in installed:
+            plugin = found.get(md5)
+            if plugin is None:
+                continue
+            newest = utils.select_newest_version(plugin, v_type)
+            if newest is None or not newest['version'] > version:
+                continue
+            key = (name, version, newest['version'])
+            report.setdefault(key, set()).add(root)
+
+    return sorted(key + (sorted(roots), ) for key, roots in report.items())
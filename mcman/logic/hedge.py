@@ -0,0 +1,192 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Hedged requests for idempotent queries.
+
+A few requests to BukGet take far longer than the rest. A hedged query is
+sent again if it has not answered after the time most queries of the same
+kind have answered in, and the first answer of the two is used. The delay is
+the 95th percentile of the latencies of the last queries of the same kind, or
+DEFAULT_DELAY until there are MIN_SAMPLES of them. This only costs one more
+request for the slowest 5% of the queries. Queries answered only from the
+response cache in httpcache take no time, and are not counted, as they would
+pull the delay down to MIN_DELAY.
+
+Queries that fail with a network or server error are retried up to RETRIES
+times, with a jittered backoff. The retries are not hedged, and a query that
+already failed over to every mirror in transport is not retried, so a failing
+service gets at most RETRIES requests per mirror. Only idempotent queries may
+be hedged, as they may be sent more than once.
+
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.client import HTTPException
+from urllib.error import HTTPError
+
+from mcman.logic import httpcache, transport
+
+# The delay in seconds before hedging, until there are enough latencies
+DEFAULT_DELAY = 2.0
+# The shortest delay in seconds before hedging
+MIN_DELAY = 0.05
+# How many latencies are needed to use the percentile
+MIN_SAMPLES = 10
+# How many latencies to remember of each kind of query
+SAMPLES = 100
+# The percentile of the latencies to hedge after
+PERCENTILE = 95
+# How many times a query is attempted before giving up
+RETRIES = 3
+# How many queries and hedges may run at once
+MAX_WORKERS = 16
+
+# The latencies of the last queries, by kind
+_LATENCIES = dict()
+# How many queries were hedged
+_HEDGED = 0
+_LOCK = threading.Lock()
+_EXECUTOR = None
+
+
+def executor():
+    """ Return the executor of the queries, and create it if needed. """
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(MAX_WORKERS)
+        return _EXECUTOR
+
+
+def record(kind, latency):
+    """ Remember the `latency` of a query of `kind`. """
+    with _LOCK:
+        _LATENCIES.setdefault(kind, deque(maxlen=SAMPLES)).append(latency)
+
+
+def delay(kind):
+    """ Return the seconds to wait before hedging a query of `kind`. """
+    with _LOCK:
+        latencies = sorted(_LATENCIES.get(kind, ()))
+    if len(latencies) < MIN_SAMPLES:
+        return DEFAULT_DELAY
+    index = min(len(latencies) * PERCENTILE // 100, len(latencies) - 1)
+    return max(latencies[index], MIN_DELAY)
+
+
+def hedged():
+    """ Return how many queries have been hedged. """
+    with _LOCK:
+        return _HEDGED
+
+
+def is_transient(error):
+    """ Return whether `error` may go away if the query is retried. """
+    if isinstance(error, transport.DeadlineExceeded) \
+            or transport.failed_over(error):
+        return False
+    if isinstance(error, HTTPError):
+        return error.code >= 500
+    return isinstance(error, (OSError, HTTPException))
+
+
+def attempt(kind, function, args, kwargs, hedge=True):
+    """ Make one attempt at calling `function`, hedged if `hedge` is True.
+
+    The result of the first call to succeed is returned. If both calls fail
+    the error of the last one is raised.
+
+    """
+    global _HEDGED
+    pool = executor()
+
+    def timed():
+        hits, sent = httpcache.thread_counters()
+        started = time.monotonic()
+        result = function(*args, **kwargs)
+        latency = time.monotonic() - started
+        new_hits, new_sent = httpcache.thread_counters()
+        if new_sent > sent or new_hits == hits:
+            record(kind, latency)
+        return result
+
+    pending = {pool.submit(timed)}
+    if hedge:
+        done, _ = wait(pending, timeout=delay(kind))
+    if hedge and len(done) == 0:
+        with _LOCK:
+            _HEDGED += 1
+        pending.add(pool.submit(timed))
+
+    error = None
+    while len(pending) > 0:
+        done, pending = wait(pending, timeout=transport.remaining(),
+                             return_when=FIRST_COMPLETED)
+        if len(done) == 0:
+            raise transport.DeadlineExceeded('The deadline was exceeded')
+        for future in done:
+            try:
+                return future.result()
+            except Exception as caught:
+                error = caught
+    raise error
+
+
+def call(kind, function, *args, **kwargs):
+    """ Call `function` with `args` and `kwargs`, hedged and retried.
+
+    `kind` names the kind of query, queries of the same kind share their
+    latencies. Only the first attempt is hedged. The result of the function
+    is returned.
+
+    """
+    for number in range(RETRIES):
+        if number > 0:
+            transport.backoff(number - 1)
+        try:
+            return attempt(kind, function, args, kwargs, hedge=number == 0)
+        except Exception as error:
+            if number == RETRIES - 1 or not is_transient(error):
+                raise
+
+
+class Hedged(object):
+
+    """ A wrapper of an API module, which hedges and retries it's functions.
+
+    The wrapper has the same functions as the module, for example:
+        Hedged(bukget).search(query, fields='slug')
+
+    """
+
+    def __init__(self, module):
+        """ Initialize the wrapper, which wraps `module`. """
+        self.module = module
+
+    def __getattr__(self, name):
+        """ Return a hedged version of the function `name`. """
+        function = getattr(self.module, name)
+        if not callable(function):
+            return function
+        kind = '{}.{}'.format(getattr(self.module, '__name__', ''), name)
+
+        def hedged_function(*args, **kwargs):
+            """ Call the function, hedged and retried. """
+            return call(kind, function, *args, **kwargs)
+        return hedged_function
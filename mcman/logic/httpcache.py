@@ -0,0 +1,386 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" A local cache of the responses from BukGet and SpaceGDN.
+
+The metadata from the APIs rarely changes within an hour, so the responses
+are stored on disk, and reused until their time to live runs out. The time
+to live depends on the service and the endpoint, see TTLS. A stale response
+is revalidated with If-None-Match and If-Modified-Since, so an unchanged
+response costs an empty 304 response instead of the whole body.
+
+Responses are keyed by the service, the method, the path relative to the base
+url, and the sorted query and form parameters. So the same query hits the
+cache no matter which mirror it was sent to, or in which order the
+parameters were given. Only urls under the base urls registered with
+register are cached, which keeps downloads out of this cache.
+
+The cache sits in front of the failover opener of the transport, so it is
+used by pyBukGet and pySpaceGDN too.
+
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from http.client import parse_headers
+from io import BytesIO
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl, urlencode
+from urllib.request import Request
+from urllib.response import addinfourl
+
+from mcman.logic import cache
+
+# The seconds a response is fresh, by service and endpoint. The endpoint is
+# the first part of the path, None is the default of the service.
+TTLS = {
+    'bukget': {None: 60 * 60, 'categories': 24 * 60 * 60},
+    'spacegdn': {None: 60 * 60, 'jars': 24 * 60 * 60, 'builds': 10 * 60},
+}
+# The default seconds a response is fresh, for other services
+DEFAULT_TTL = 60 * 60
+# How many seconds a stale response is kept for revalidation
+MAX_AGE = 7 * 24 * 60 * 60
+
+# The folder the responses are stored in
+FOLDER = os.path.join(cache.cache_home(), 'http')
+# Whether the cache is used
+ENABLED = True
+# Whether to revalidate responses even if they are fresh
+REFRESH = False
+
+# The base urls of each service
+_SERVICES = dict()
+# The counters of this run, see counters
+_COUNTERS = {'hits': 0, 'revalidated': 0, 'misses': 0}
+_LOCK = threading.Lock()
+# The cache hits and the requests sent by each thread, see thread_counters
+_THREAD = threading.local()
+
+
+def init(enabled=True, refresh=False):
+    """ Initialize the cache.
+
+    Two parameters are accepted:
+        enabled=True     Whether the cache is used at all.
+        refresh=False    Whether to revalidate fresh responses too.
+
+    """
+    global ENABLED, REFRESH
+    ENABLED = enabled
+    REFRESH = refresh
+
+
+def register(service, bases):
+    """ Cache the responses from the urls under `bases` as `service`.
+
+    `bases` is a base url, or a list of mirrors of the same service.
+
+    """
+    if isinstance(bases, str) or bases is None:
+        bases = [bases]
+    with _LOCK:
+        _SERVICES[service] = [base for base in bases if base]
+
+
+def normalize(url, data=None):
+    """ Find the service, endpoint and normalized query of `url`.
+
+    `data` is the body of the request, if any. A tuple of the service, the
+    endpoint and the normalized query is returned, or None if the url is not
+    under a registered base url, or is the base url itself.
+
+    """
+    with _LOCK:
+        services = list(_SERVICES.items())
+    for service, bases in services:
+        for base in bases:
+            if url.startswith(base):
+                break
+        else:
+            continue
+        path, _, query = url[len(base):].partition('?')
+        path = path.strip('/')
+        if not path:
+            return None
+        query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+        if data is not None:
+            if isinstance(data, bytes):
+                data = data.decode('latin-1')
+            data = urlencode(sorted(parse_qsl(data, keep_blank_values=True)))
+        return service, path.split('/')[0], '{}?{}#{}'.format(path, query,
+                                                              data or '')
+    return None
+
+
+def ttl(service, endpoint):
+    """ Return how many seconds a response from `endpoint` is fresh. """
+    ttls = TTLS.get(service, dict())
+    return ttls.get(endpoint, ttls.get(None, DEFAULT_TTL))
+
+
+def entry_path(key):
+    """ Return the path of the file of the response with `key`. """
+    name = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+    return os.path.join(FOLDER, name[:2], name + '.json')
+
+
+def load(key):
+    """ Load the stored response with `key`, or return None. """
+    try:
+        with open(entry_path(key), 'r') as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if type(entry) is not dict or entry.get('key') != list(key):
+        return None
+    return entry
+
+
+def save(key, entry):
+    """ Store the response `entry` with `key`. Failures are ignored. """
+    path = entry_path(key)
+    temporary = '{}.tmp{}-{}'.format(path, os.getpid(),
+                                     threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, 'w') as file:
+            json.dump(entry, file)
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def count(counter):
+    """ Add one to `counter`. """
+    with _LOCK:
+        _COUNTERS[counter] += 1
+
+
+def count_thread(counter):
+    """ Add one to `counter` of this thread. """
+    setattr(_THREAD, counter, getattr(_THREAD, counter, 0) + 1)
+
+
+def thread_counters():
+    """ Return how many hits and requests sent this thread has had.
+
+    A tuple of the fresh responses from the cache, and the requests sent to
+    the servers, including revalidations, is returned. Compare two of them to
+    tell whether a call was answered only from the cache.
+
+    """
+    return getattr(_THREAD, 'hits', 0), getattr(_THREAD, 'sent', 0)
+
+
+def counters():
+    """ Return a copy of the counters of this run.
+
+    The counters are:
+        hits           Fresh responses from the cache.
+        revalidated    Stale responses the server said are unchanged.
+        misses         Responses fetched from the server.
+
+    """
+    with _LOCK:
+        return dict(_COUNTERS)
+
+
+def to_response(entry, url):
+    """ Create a response like the ones from urlopen from `entry`. """
+    raw = ''.join('{}: {}\r\n'.format(name, value)
+                  for name, value in entry['headers']) + '\r\n'
+    headers = parse_headers(BytesIO(raw.encode('latin-1')))
+    body = base64.b64decode(entry['body'])
+    response = addinfourl(BytesIO(body), headers, url, entry['status'])
+    response.msg = 'OK'
+    return response
+
+
+class CachingOpener(object):
+
+    """ An opener which answers requests to the APIs from the cache.
+
+    It wraps another opener, and has the same open method, so it can be
+    installed as the global opener of urllib.
+
+    """
+
+    def __init__(self, opener):
+        """ Initialize the opener, which sends requests with `opener`. """
+        self.opener = opener
+
+    def open(self, fullurl, data=None, *args, **kwargs):
+        """ Open `fullurl`, from the cache if possible. """
+        request = fullurl
+        if not isinstance(request, Request):
+            request = Request(fullurl)
+        if data is not None:
+            request.data = data
+
+        found = None
+        if ENABLED and request.get_method() in ('GET', 'POST'):
+            found = normalize(request.full_url, request.data)
+        if found is None:
+            count_thread('sent')
+            return self.opener.open(request, None, *args, **kwargs)
+
+        service, endpoint, query = found
+        key = [service, request.get_method(), query]
+        entry = load(key)
+        now = time.time()
+        if entry is not None and not REFRESH \
+                and now - entry['time'] < ttl(service, endpoint):
+            count('hits')
+            count_thread('hits')
+            return to_response(entry, request.full_url)
+
+        if entry is not None:
+            if entry.get('etag'):
+                request.add_unredirected_header('If-None-Match',
+                                                entry['etag'])
+            if entry.get('last_modified'):
+                request.add_unredirected_header('If-Modified-Since',
+                                                entry['last_modified'])
+
+        count_thread('sent')
+        try:
+            response = self.opener.open(request, None, *args, **kwargs)
+        except HTTPError as error:
+            if error.code != 304 or entry is None:
+                raise
+            error.close()
+            count('revalidated')
+            entry['time'] = now
+            save(key, entry)
+            return to_response(entry, request.full_url)
+
+        count('misses')
+        with response:
+            body = response.read()
+            status = response.status
+            headers = response.headers
+        if status == 200 \
+                and 'no-store' not in headers.get('Cache-Control', ''):
+            save(key, {
+                'key': key,
+                'time': now,
+                'status': status,
+                'headers': [(name, value) for name, value in headers.items()
+                            if name.lower() not in ('content-length',
+                                                    'transfer-encoding',
+                                                    'connection')],
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'body': base64.b64encode(body).decode('ascii'),
+            })
+        result = addinfourl(BytesIO(body), headers, request.full_url, status)
+        result.msg = getattr(response, 'msg', 'OK')
+        return result
+
+
+def entries():
+    """ List the stored responses.
+
+    A list of (modification time, size, path) tuples is returned.
+
+    """
+    result = list()
+    if not os.path.isdir(FOLDER):
+        return result
+    for prefix in os.listdir(FOLDER):
+        folder = os.path.join(FOLDER, prefix)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result.append((stat.st_mtime, stat.st_size, path))
+    return result
+
+
+def stats():
+    """ Return a tuple with the amount of stored responses and their size.
+    """
+    found = entries()
+    return len(found), sum(entry[1] for entry in found)
+
+
+def prune(max_age=MAX_AGE):
+    """ Remove the responses that were stored more than `max_age` ago.
+
+    A tuple with the amount of removed responses and the bytes freed is
+    returned.
+
+    """
+    removed = 0
+    freed = 0
+    limit = time.time() - max_age
+    for mtime, size, path in entries():
+        if mtime >= limit:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+def load_totals():
+    """ Return the counters of all runs, as saved by save_totals. """
+    try:
+        with open(os.path.join(FOLDER, 'counters.json'), 'r') as file:
+            totals = json.load(file)
+    except (OSError, ValueError):
+        totals = dict()
+    if type(totals) is not dict:
+        totals = dict()
+    return {name: int(totals.get(name, 0)) for name in _COUNTERS}
+
+
+def save_totals():
+    """ Add the counters of this run to the saved totals, and reset them. """
+    with _LOCK:
+        current = dict(_COUNTERS)
+        for name in _COUNTERS:
+            _COUNTERS[name] = 0
+    if not any(current.values()):
+        return
+    totals = load_totals()
+    for name, value in current.items():
+        totals[name] += value
+    path = os.path.join(FOLDER, 'counters.json')
+    temporary = path + '.tmp{}'.format(os.getpid())
+    try:
+        os.makedirs(FOLDER, exist_ok=True)
+        with open(temporary, 'w') as file:
+            json.dump(totals, file)
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
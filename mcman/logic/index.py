@@ -0,0 +1,232 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" A persistent index of the fingerprints of installed jars.
+
+Hashing every jar, and parsing the plugin.yml of every plugin, is the slowest
+part of listing plugins and servers. The index remembers the results for
+each jar, and they are reused as long as the path, inode, size and
+modification time of the jar are the same. An unchanged jar then costs one
+stat, and is not read at all.
+
+The MD5 and SHA-256 digests of each jar are calculated in the same read, so
+the SHA-256 digest costs no extra I/O.
+
+The index is stored in INDEX_FILE, with a digest of the entries. If the file
+is damaged, or the digest doesn't match, the whole index is discarded and
+rebuilt. init(rescan=True) ignores the entries from earlier runs, and
+replaces all entries that are used. Entries stored since then are used, so a
+jar is only read once per run.
+
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from mcman.logic import cache, common
+
+# The format of the index file, increased on incompatible changes
+FORMAT = 1
+
+# The digests stored for each jar, MD5 is the one BukGet and SpaceGDN use
+DIGESTS = ('md5', 'sha256')
+
+# The file the index is stored in
+INDEX_FILE = os.path.join(cache.cache_home(), 'index.json')
+# Whether to ignore the entries in the index
+RESCAN = False
+
+_ENTRIES = None
+_CHANGED = set()
+# The paths stored since init, which are used even when rescanning
+_STORED = set()
+_LOCK = threading.Lock()
+_SAVE_LOCK = threading.Lock()
+
+
+def init(rescan=False):
+    """ Initialize the index.
+
+    If `rescan` is True all jars are hashed and parsed again, and the index
+    is updated with the new results.
+
+    """
+    global RESCAN, _ENTRIES
+    with _LOCK:
+        RESCAN = rescan
+        _ENTRIES = None
+        _CHANGED.clear()
+        _STORED.clear()
+
+
+def digest(entries):
+    """ Return the digest of `entries`, used to check the integrity. """
+    data = json.dumps(entries, sort_keys=True).encode()
+    return hashlib.md5(data).hexdigest()
+
+
+def is_valid_entry(entry):
+    """ Return whether `entry` looks like an entry of the index. """
+    if type(entry) is not dict:
+        return False
+    key = entry.get('key')
+    return type(key) is list and len(key) == 3 \
+        and all(type(part) is int for part in key)
+
+
+def read():
+    """ Read the index file.
+
+    A dict of absolute path to entry is returned. It is empty if there is no
+    index file, or if it fails the integrity check.
+
+    """
+    try:
+        with open(INDEX_FILE, 'r') as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return dict()
+
+    if type(data) is not dict or data.get('format') != FORMAT:
+        return dict()
+    entries = data.get('entries')
+    if type(entries) is not dict or data.get('digest') != digest(entries):
+        return dict()
+    if not all(is_valid_entry(entry) for entry in entries.values()):
+        return dict()
+    return entries
+
+
+def entries():
+    """ Return the entries, and read them if needed.
+
+    The lock must be held when this is called.
+
+    """
+    global _ENTRIES
+    if _ENTRIES is None:
+        _ENTRIES = read()
+    return _ENTRIES
+
+
+def fingerprint(path):
+    """ Return the fingerprint of the file at `path`.
+
+    The fingerprint is a list of the inode, size and modification time in
+    nanoseconds. OSError is raised if the file can't be stat'ed.
+
+    """
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def lookup(path):
+    """ Look up the jar at `path` in the index.
+
+    A tuple of the current fingerprint of the jar and the entry is returned.
+    The entry is a dict with the saved fields, or None if the jar is not
+    indexed, has changed or RESCAN is set and it was not stored in this run.
+    Pass the fingerprint to store.
+
+    """
+    path = os.path.abspath(path)
+    key = fingerprint(path)
+    with _LOCK:
+        entry = entries().get(path)
+        stale = RESCAN and path not in _STORED
+    if stale or entry is None or entry['key'] != key:
+        return key, None
+    return key, entry
+
+
+def store(path, key, **fields):
+    """ Store `fields` for the jar at `path`.
+
+    `key` must be the fingerprint returned by lookup before the jar was read,
+    so a jar that changes while it is read is not indexed with the old
+    results. The fields must be serializable to JSON.
+
+    """
+    path = os.path.abspath(path)
+    entry = dict(fields)
+    entry['key'] = key
+    with _LOCK:
+        found = entries()
+        old = found.get(path)
+        if old is not None and old['key'] == key \
+                and not (RESCAN and path not in _STORED):
+            old.update(entry)
+        else:
+            found[path] = entry
+        _CHANGED.add(path)
+        _STORED.add(path)
+
+
+def digests(path):
+    """ Return the DIGESTS of the jar at `path`, using the index.
+
+    All the digests are calculated in one read if any of them is missing. A
+    dict from each algorithm to the hex digest is returned.
+
+    """
+    key, entry = lookup(path)
+    if entry is not None and all(name in entry for name in DIGESTS):
+        return {name: entry[name] for name in DIGESTS}
+    found = common.digest_file(path, DIGESTS)
+    store(path, key, **found)
+    return found
+
+
+def checksum(path):
+    """ Return the MD5 checksum of the jar at `path`, using the index. """
+    return digests(path)['md5']
+
+
+def save():
+    """ Save the changed entries to the index file.
+
+    The index file is read again first, so entries saved by other mcman
+    processes are kept. Entries of files that no longer exist are removed.
+    Failures are ignored, as the index is just an optimization. Saves from
+    several threads are done one at a time.
+
+    """
+    with _SAVE_LOCK:
+        with _LOCK:
+            if len(_CHANGED) == 0:
+                return
+            found = entries()
+            merged = read()
+            for path in _CHANGED:
+                merged[path] = dict(found[path])
+            _CHANGED.clear()
+
+        merged = {path: entry for path, entry in merged.items()
+                  if os.path.isfile(path)}
+        data = {'format': FORMAT, 'digest': digest(merged),
+                'entries': merged}
+
+        temporary = INDEX_FILE + '.tmp{}'.format(os.getpid())
+        try:
+            os.makedirs(os.path.dirname(INDEX_FILE), exist_ok=True)
+            with open(temporary, 'w') as file:
+                json.dump(data, file)
+            os.replace(temporary, INDEX_FILE)
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
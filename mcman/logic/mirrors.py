@@ -0,0 +1,146 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Selection of the fastest mirror of BukGet and SpaceGDN.
+
+The latency to each mirror is measured with a request to it's base url, and
+the mirrors are used in order of latency. The measurements are saved in
+RANKING_FILE, and reused for MAX_AGE seconds, so mcman doesn't have to measure
+them on each run. Failing over between the mirrors is done by the transport.
+
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.error import HTTPError
+
+from mcman.logic import cache, transport
+
+# How many seconds a latency measurement is reused
+MAX_AGE = 24 * 60 * 60
+# The timeout in seconds of a latency measurement
+PROBE_TIMEOUT = 5
+
+# The file the measurements are saved in
+RANKING_FILE = os.path.join(cache.cache_home(), 'mirrors.json')
+
+
+def parse_urls(text):
+    """ Parse a comma separated list of base urls. """
+    urls = [url.strip() for url in text.split(',') if url.strip()]
+    if len(urls) == 0:
+        raise ValueError('No url given')
+    return urls
+
+
+def probe(url, timeout=PROBE_TIMEOUT):
+    """ Measure the latency of `url`.
+
+    The seconds until the response headers are received is returned, or None
+    if the mirror didn't respond. An HTTP error response counts as a response,
+    as the base url of a service doesn't have to be a valid request.
+
+    """
+    started = time.monotonic()
+    try:
+        transport.open(url, timeout=timeout).close()
+    except HTTPError as error:
+        error.close()
+    except (OSError, HTTPException):
+        return None
+    return time.monotonic() - started
+
+
+def load_ranking():
+    """ Load the saved measurements.
+
+    A dict of url to a dict with the 'latency' and the 'time' it was measured
+    is returned. It is empty if there are no saved measurements.
+
+    """
+    try:
+        with open(RANKING_FILE, 'r') as file:
+            ranking = json.load(file)
+    except (OSError, ValueError):
+        return dict()
+    if type(ranking) is not dict:
+        return dict()
+    return ranking
+
+
+def save_ranking(ranking):
+    """ Save the measurements. Failures are ignored. """
+    temporary = RANKING_FILE + '.tmp{}'.format(os.getpid())
+    try:
+        os.makedirs(os.path.dirname(RANKING_FILE), exist_ok=True)
+        with open(temporary, 'w') as file:
+            json.dump(ranking, file)
+        os.replace(temporary, RANKING_FILE)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def rank(urls):
+    """ Sort `urls` by their latency.
+
+    Saved measurements newer than MAX_AGE are reused, the other urls are
+    measured in parallel, and the new measurements are saved. Mirrors that
+    didn't respond are put last. Mirrors with the same latency keep their
+    order.
+
+    """
+    ranking = load_ranking()
+    now = time.time()
+
+    def is_fresh(url):
+        """ Return whether there is a usable measurement of `url`. """
+        entry = ranking.get(url)
+        return type(entry) is dict and now - entry.get('time', 0) < MAX_AGE
+
+    stale = [url for url in urls if not is_fresh(url)]
+    if len(stale) > 0:
+        with ThreadPoolExecutor(len(stale)) as executor:
+            latencies = list(executor.map(probe, stale))
+        for url, latency in zip(stale, latencies):
+            ranking[url] = {'latency': latency, 'time': now}
+        save_ranking(ranking)
+
+    def key(url):
+        """ Sort by latency, with the mirrors that didn't respond last. """
+        latency = ranking[url].get('latency')
+        return (latency is None, latency or 0)
+
+    return sorted(urls, key=key)
+
+
+def select(urls):
+    """ Select the mirror to use of `urls`, and register them for failover.
+
+    `urls` may also be a single url. A single url is used as it is, without
+    measuring it. The url of the fastest mirror is returned.
+
+    """
+    if isinstance(urls, str) or urls is None:
+        urls = [urls]
+    urls = list(urls)
+    if len(urls) > 1:
+        urls = rank(urls)
+    transport.add_mirrors(urls)
+    return urls[0]
@@ -0,0 +1,349 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" A local catalogue of the plugins on BukGet.
+
+The catalogue is a SQLite database with the metadata of all plugins that the
+plugin commands use. It is filled by sync, which only asks BukGet for the
+plugins with versions newer than the last sync, unless a full sync is asked
+for. A full sync also removes plugins that are gone from BukGet, and updates
+metadata like the popularity, which does not change the version dates.
+
+search, find_by_name and plugin_details answer the same queries as the
+functions with the same names in pyBukGet, from the catalogue. This makes the
+plugin commands work without access to BukGet. The filters of search may use
+the '=', 'in' and 'like' actions on the slug, plugin_name, main and
+versions.checksum fields, which are indexed.
+
+"""
+
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import bukget
+
+from mcman.logic import cache, hedge
+
+# The version of the database layout. A database with another version is
+# rebuilt.
+FORMAT = 1
+# The file the catalogue is stored in
+CATALOGUE_FILE = os.path.join(cache.cache_home(), 'catalogue.sqlite')
+# How many plugins to get from BukGet in each request
+PAGE_SIZE = 500
+# The fields stored for each plugin, all the plugin commands use
+FIELDS = ('slug,plugin_name,description,popularity.monthly,website,'
+          'dbo_page,server,authors,categories,stage,main,versions.type,'
+          'versions.game_versions,versions.version,versions.hard_dependencies,'
+          'versions.download,versions.filename,versions.md5,versions.slug,'
+          'versions.date')
+
+# The columns of the fields that can be filtered on
+COLUMNS = {
+    'slug': 'slug',
+    'plugin_name': 'plugin_name',
+    'main': 'main',
+}
+# The fields that filter on the checksums of the versions
+CHECKSUM_FIELDS = ('versions.checksum', 'versions.md5')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS plugins (
+    slug TEXT PRIMARY KEY,
+    plugin_name TEXT COLLATE NOCASE,
+    main TEXT,
+    server TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plugins_plugin_name ON plugins (plugin_name);
+CREATE INDEX IF NOT EXISTS plugins_main ON plugins (main);
+CREATE TABLE IF NOT EXISTS checksums (
+    md5 TEXT NOT NULL,
+    slug TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checksums_md5 ON checksums (md5);
+CREATE INDEX IF NOT EXISTS checksums_slug ON checksums (slug);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def connect():
+    """ Open the catalogue, and create or rebuild it if needed. """
+    os.makedirs(os.path.dirname(CATALOGUE_FILE), exist_ok=True)
+    connection = sqlite3.connect(CATALOGUE_FILE, timeout=30)
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    if version != FORMAT:
+        with connection:
+            connection.executescript('DROP TABLE IF EXISTS plugins;'
+                                     'DROP TABLE IF EXISTS checksums;'
+                                     'DROP TABLE IF EXISTS meta;')
+            connection.execute('PRAGMA user_version = {}'.format(FORMAT))
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def get_meta(connection, key, default=None):
+    """ Return the value of `key` in the meta table. """
+    row = connection.execute('SELECT value FROM meta WHERE key = ?',
+                             (key,)).fetchone()
+    return row[0] if row is not None else default
+
+
+def set_meta(connection, key, value):
+    """ Set the value of `key` in the meta table. """
+    connection.execute('INSERT OR REPLACE INTO meta (key, value) '
+                       'VALUES (?, ?)', (key, str(value)))
+
+
+def store(connection, plugin):
+    """ Store the plugin dict `plugin` from BukGet in the catalogue. """
+    slug = plugin['slug']
+    connection.execute(
+        'INSERT OR REPLACE INTO plugins (slug, plugin_name, main, server, '
+        'data) VALUES (?, ?, ?, ?, ?)',
+        (slug, plugin.get('plugin_name'), plugin.get('main'),
+         plugin.get('server'), json.dumps(plugin)))
+    connection.execute('DELETE FROM checksums WHERE slug = ?', (slug,))
+    connection.executemany(
+        'INSERT INTO checksums (md5, slug) VALUES (?, ?)',
+        [(version['md5'], slug) for version in plugin.get('versions', [])
+         if version.get('md5')])
+
+
+def sync(full=False, page_size=PAGE_SIZE):
+    """ Update the catalogue from BukGet.
+
+    Only the plugins with versions newer than the last sync are fetched,
+    unless `full` is True. A full sync fetches all plugins, and removes the
+    ones that are gone from BukGet. The pages are hedged and retried like the
+    other queries to BukGet, see the hedge module.
+
+    A tuple with the amount of plugins fetched, and the amount of plugins in
+    the catalogue is returned.
+
+    """
+    with closing(connect()) as connection:
+        since = 0 if full else int(get_meta(connection, 'synced', 0))
+        newest = since
+        fetched = 0
+        start = 0
+        with connection:
+            if full:
+                connection.execute('CREATE TEMP TABLE seen '
+                                   '(slug TEXT PRIMARY KEY)')
+            api = hedge.Hedged(bukget)
+            while True:
+                page = api.search(
+                    {
+                        'field': 'versions.date',
+                        'action': '>',
+                        'value': since
+                    },
+                    fields=FIELDS, sort='slug', start=start, size=page_size)
+                for plugin in page:
+                    store(connection, plugin)
+                    if full:
+                        connection.execute('INSERT OR IGNORE INTO seen '
+                                           'VALUES (?)', (plugin['slug'],))
+                    for version in plugin.get('versions', []):
+                        newest = max(newest, version.get('date') or 0)
+                fetched += len(page)
+                if len(page) < page_size:
+                    break
+                start += page_size
+
+            if full:
+                connection.execute('DELETE FROM plugins WHERE slug NOT IN '
+                                   '(SELECT slug FROM seen)')
+                connection.execute('DELETE FROM checksums WHERE slug NOT IN '
+                                   '(SELECT slug FROM seen)')
+                connection.execute('DROP TABLE seen')
+            set_meta(connection, 'synced', newest)
+
+        total = connection.execute('SELECT COUNT(*) FROM plugins').fetchone()
+        return fetched, total[0]
+
+
+def status():
+    """ Return a tuple with the amount of plugins, and the newest version date.
+
+    The date is a unix timestamp, and is 0 if the catalogue was never synced.
+
+    """
+    with closing(connect()) as connection:
+        total = connection.execute('SELECT COUNT(*) FROM plugins').fetchone()
+        return total[0], int(get_meta(connection, 'synced', 0))
+
+
+def field_tree(fields):
+    """ Turn the comma separated `fields` into a tree of dicts.
+
+    A field is None in the tree when all of it is selected. None is returned
+    if `fields` is empty, which means everything.
+
+    """
+    if not fields:
+        return None
+    tree = dict()
+    for field in fields.split(','):
+        node = tree
+        parts = field.strip().split('.')
+        for part in parts[:-1]:
+            if node.get(part, dict()) is None:
+                break
+            node = node.setdefault(part, dict())
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def project(value, tree):
+    """ Return the parts of `value` selected by the field tree `tree`. """
+    if tree is None:
+        return value
+    if type(value) is list:
+        return [project(item, tree) for item in value]
+    if type(value) is dict:
+        return {key: project(value[key], sub) for key, sub in tree.items()
+                if key in value}
+    return value
+
+
+def sort_key(field):
+    """ Return a sort key function for the dotted `field`. """
+    def key(plugin):
+        value = plugin
+        for part in field.split('.'):
+            value = value.get(part) if type(value) is dict else None
+        # Plugins without the field are sorted first
+        return (value is not None, value if value is not None else 0)
+    return key
+
+
+def where(filters):
+    """ Translate the filters of a search to a SQL condition.
+
+    A tuple with the condition and it's parameters is returned. ValueError is
+    raised for filters the catalogue can not answer.
+
+    """
+    conditions = list()
+    parameters = list()
+    for query in filters:
+        field = query['field']
+        action = query['action']
+        value = query['value']
+
+        if field in CHECKSUM_FIELDS:
+            column = 'slug IN (SELECT slug FROM checksums WHERE md5 {})'
+        elif field in COLUMNS:
+            column = COLUMNS[field] + ' {}'
+        else:
+            raise ValueError('The catalogue can not filter on {}'
+                             .format(field))
+
+        if action == '=':
+            conditions.append(column.format('= ?'))
+            parameters.append(value)
+        elif action == 'in':
+            value = list(value)
+            if len(value) == 0:
+                conditions.append('0')
+                continue
+            conditions.append(column.format(
+                'IN ({})'.format(', '.join('?' * len(value)))))
+            parameters += value
+        elif action == 'like':
+            escaped = value.replace('\\', '\\\\').replace('%', '\\%') \
+                .replace('_', '\\_')
+            conditions.append(column.format("LIKE ? ESCAPE '\\'"))
+            parameters.append('%' + escaped + '%')
+        else:
+            raise ValueError('The catalogue can not answer the action {}'
+                             .format(action))
+
+    return ' AND '.join(conditions) or '1', parameters
+
+
+def search(*filters, fields=None, sort=None, start=0, size=None):
+    """ Search the catalogue, like bukget.search.
+
+    The filters are dicts with a field, an action and a value. The results are
+    sorted by `sort`, which is a field, prefixed with '-' for descending
+    order. The plugin dicts with only the `fields` are returned.
+
+    """
+    condition, parameters = where(filters)
+    with closing(connect()) as connection:
+        if get_meta(connection, 'synced') is None:
+            raise ValueError('The catalogue is empty, run '
+                             + '`mcman catalogue sync` first')
+        rows = connection.execute('SELECT data FROM plugins WHERE '
+                                  + condition, parameters).fetchall()
+
+    plugins = [json.loads(row[0]) for row in rows]
+    if sort:
+        plugins.sort(key=sort_key(sort.lstrip('-')),
+                     reverse=sort.startswith('-'))
+    end = None if size is None else start + size
+    tree = field_tree(fields)
+    return [project(plugin, tree) for plugin in plugins[start:end]]
+
+
+def find_by_name(server, name):
+    """ Find the slug of the plugin named `name`, like bukget.find_by_name.
+
+    The plugin name is compared without regard to case, and the slug is tried
+    as well. None is returned if no plugin matches.
+
+    """
+    with closing(connect()) as connection:
+        row = connection.execute(
+            'SELECT slug FROM plugins WHERE (plugin_name = ? OR slug = ?) '
+            'AND (server IS NULL OR server = ?) ORDER BY plugin_name = ? DESC',
+            (name, name.lower(), server, name)).fetchone()
+    return row[0] if row is not None else None
+
+
+def plugin_details(server, slug, version=None, fields=None):
+    """ Return the plugin with `slug`, like bukget.plugin_details.
+
+    If `version` is given, only that version of the plugin is returned. None
+    is returned if the plugin is not in the catalogue.
+
+    """
+    with closing(connect()) as connection:
+        row = connection.execute(
+            'SELECT data FROM plugins WHERE slug = ? '
+            'AND (server IS NULL OR server = ?)', (slug, server)).fetchone()
+    if row is None:
+        return None
+
+    plugin = json.loads(row[0])
+    if version is not None:
+        versions = plugin.get('versions', [])
+        if version.lower() == 'latest':
+            plugin['versions'] = versions[:1]
+        else:
+            plugin['versions'] = [v for v in versions
+                                  if version in (v.get('version'),
+                                                 v.get('slug'))]
+    return project(plugin, field_tree(fields))
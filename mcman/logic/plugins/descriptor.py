@@ -0,0 +1,260 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Fast reading of plugin.yml, the description file of plugin jars.
+
+A plugin jar can have thousands of entries, but only plugin.yml is needed to
+identify the plugin. read_entry memory maps the jar, and walks the central
+directory at the end of it for the entry, without creating an object for
+each entry like zipfile does. Only the central directory and the entry are
+read from disk.
+
+parse_plugin_yml reads the name, main class and version. Most plugin.yml
+files have them as simple 'key: value' lines at the top level, which are
+read directly. Anything else is parsed by libyaml if it is available, else
+by the pure Python parser of PyYAML.
+
+"""
+
+import mmap
+import re
+import struct
+import zlib
+from zipfile import BadZipFile, ZipFile
+
+import yaml
+from yaml.constructor import SafeConstructor
+from yaml.resolver import Resolver
+
+# The fastest safe YAML loader available
+SAFE_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# The keys read from plugin.yml
+KEYS = ('main', 'name', 'version')
+
+# The signatures and layouts of the zip records
+END_SIGNATURE = b'PK\x05\x06'
+END_STRUCT = struct.Struct('<4s4H2LH')
+CENTRAL_SIGNATURE = b'PK\x01\x02'
+CENTRAL_STRUCT = struct.Struct('<4s6H3L5H2L')
+LOCAL_SIGNATURE = b'PK\x03\x04'
+LOCAL_STRUCT = struct.Struct('<4s5H3L2H')
+# The end record can be followed by a comment of up to 64 KiB
+MAX_COMMENT = 0xFFFF
+# Values that mean the real value is in a zip64 record
+ZIP64_MARKER = 0xFFFFFFFF
+# The compression methods read directly
+STORED = 0
+DEFLATED = 8
+# The general purpose flag of encrypted entries
+ENCRYPTED = 0x1
+
+# A top level 'key: value' line
+LINE_PATTERN = re.compile(r'^([A-Za-z_][A-Za-z0-9_-]*)[ \t]*:(?:[ \t]+(.*))?$')
+# The first characters of values that are not simple scalars
+SPECIAL = tuple('&*!|>[{%@`"')
+
+_RESOLVER = Resolver()
+_CONSTRUCTOR = SafeConstructor()
+
+
+class Unsupported(Exception):
+
+    """ Raised when a jar must be read by zipfile instead. """
+
+    pass
+
+
+def find_entry(data, name):
+    """ Find the entry `name` in the zip file `data`.
+
+    `data` is a bytes like object with the whole zip file. A tuple of the
+    compression method, the offset of the compressed data and it's size is
+    returned, or None if there is no such entry.
+
+    BadZipFile is raised if `data` is not a zip file, and Unsupported if it
+    uses features that are not handled here.
+
+    """
+    start = max(0, len(data) - MAX_COMMENT - END_STRUCT.size)
+    end = data.rfind(END_SIGNATURE, start)
+    if end < 0 or end + END_STRUCT.size > len(data):
+        raise BadZipFile('File is not a zip file')
+    (_, disk, _, _, entries, size, offset, _) = \
+        END_STRUCT.unpack_from(data, end)
+    if disk != 0:
+        raise Unsupported('Multi disk zip files are not supported')
+    if ZIP64_MARKER in (size, offset) or entries == 0xFFFF:
+        raise Unsupported('Zip64 files are not supported')
+    # Data before the zip file, like a launcher script, moves all offsets
+    shift = end - size - offset
+    if shift < 0:
+        raise BadZipFile('Bad offset of the central directory')
+
+    encoded = name.encode()
+    position = offset + shift
+    for _ in range(entries):
+        if data[position:position + 4] != CENTRAL_SIGNATURE:
+            raise BadZipFile('Bad magic number of central directory')
+        (_, _, _, flags, method, _, _, _, compressed, _, name_length,
+         extra_length, comment_length, _, _, _, local) = \
+            CENTRAL_STRUCT.unpack_from(data, position)
+        name_start = position + CENTRAL_STRUCT.size
+        position = name_start + name_length + extra_length + comment_length
+        if data[name_start:name_start + name_length] != encoded:
+            continue
+
+        if flags & ENCRYPTED:
+            raise Unsupported('Encrypted entries are not supported')
+        if method not in (STORED, DEFLATED) \
+                or ZIP64_MARKER in (compressed, local):
+            raise Unsupported('Unsupported entry')
+        local += shift
+        if data[local:local + 4] != LOCAL_SIGNATURE:
+            raise BadZipFile('Bad magic number of local header')
+        (_, _, _, _, _, _, _, _, _, name_length, extra_length) = \
+            LOCAL_STRUCT.unpack_from(data, local)
+        start = local + LOCAL_STRUCT.size + name_length + extra_length
+        if start + compressed > len(data):
+            raise BadZipFile('Truncated entry')
+        return method, start, compressed
+
+    return None
+
+
+def read_entry(path, name):
+    """ Read the entry `name` from the zip file at `path`.
+
+    The content of the entry is returned, or None if there is no such entry.
+    BadZipFile is raised if the file is not a zip file.
+
+    """
+    with open(path, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            raise BadZipFile('File is not a zip file')
+        try:
+            found = find_entry(data, name)
+            if found is None:
+                return None
+            method, start, size = found
+            if method == STORED:
+                return data[start:start + size]
+            try:
+                return zlib.decompressobj(-zlib.MAX_WBITS).decompress(
+                    data[start:start + size])
+            except zlib.error as error:
+                raise BadZipFile('Bad compressed data: {}'.format(error))
+        except (Unsupported, struct.error):
+            pass
+        finally:
+            data.close()
+
+    # Let zipfile handle what isn't handled here
+    with ZipFile(path, 'r') as zipped:
+        if name not in zipped.namelist():
+            return None
+        return zipped.read(name)
+
+
+def parse_scalar(value):
+    """ Parse a value from a 'key: value' line.
+
+    The value is returned like PyYAML would return it. Unsupported is raised
+    if the value is not a simple single line scalar.
+
+    """
+    if value.startswith("'"):
+        if len(value) < 2 or not value.endswith("'"):
+            raise Unsupported('Multi line or commented string')
+        inner = value[1:-1]
+        if "'" in inner.replace("''", ''):
+            raise Unsupported('Unbalanced quotes')
+        return inner.replace("''", "'")
+    if value.startswith(SPECIAL) or ' #' in value or '\t#' in value \
+            or ': ' in value:
+        raise Unsupported('Not a simple scalar')
+
+    tag = _RESOLVER.resolve(yaml.ScalarNode, value, (True, False))
+    if tag == 'tag:yaml.org,2002:str':
+        return value
+    return _CONSTRUCTOR.construct_object(yaml.ScalarNode(tag, value))
+
+
+def read_lines(text):
+    """ Read the KEYS from the top level 'key: value' lines of `text`.
+
+    A dict of the keys found is returned. Unsupported is raised if one of
+    the KEYS has a value this reader doesn't handle.
+
+    """
+    found = dict()
+    current = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        if line[0] in ' \t':
+            if current is not None:
+                # The value of a key we need continues on this line
+                raise Unsupported('Multi line value')
+            continue
+        current = None
+        if line.startswith(('---', '...')):
+            raise Unsupported('Multiple documents')
+        match = LINE_PATTERN.match(line)
+        if match is None:
+            if line[0] in '-?{[':
+                raise Unsupported('Not a block mapping')
+            continue
+        key, value = match.group(1), match.group(2)
+        if key not in KEYS:
+            continue
+        value = value.strip() if value is not None else ''
+        if not value:
+            raise Unsupported('Block value')
+        found[key] = parse_scalar(value)
+        current = key
+    return found
+
+
+def parse_plugin_yml(data):
+    """ Get the main class, name and version from the plugin.yml `data`.
+
+    `data` is the bytes of the file. A tuple of the main class, name and
+    version is returned, the version is always a string. ValueError is raised
+    if the file is invalid, or if one of the keys is missing.
+
+    """
+    text = data.decode('utf-8')
+    if text.startswith('\ufeff'):
+        text = text[1:]
+
+    try:
+        yml = read_lines(text)
+    except Unsupported:
+        yml = None
+    if yml is None or any(key not in yml for key in KEYS):
+        try:
+            yml = yaml.load(text, Loader=SAFE_LOADER)
+        except yaml.YAMLError as error:
+            raise ValueError('Invalid plugin.yml: {}'.format(error))
+
+    if type(yml) is not dict or any(key not in yml for key in KEYS):
+        raise ValueError('Invalid plugin.yml')
+    return yml['main'], yml['name'], str(yml['version'])
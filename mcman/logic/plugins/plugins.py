@@ -16,26 +16,76 @@
 
 """ The backend for the mcman plugins command. """
 
+import asyncio
+import functools
+import multiprocessing
 import os
 import threading
-from queue import Queue
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, as_completed, wait)
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from math import ceil
 from zipfile import ZipFile, BadZipFile
 
 import bukget
 import yaml
 
-from mcman.logic import common
-from mcman.logic.plugins import utils
-
-
-def init(base, user_agent):
+from mcman.logic import (aio, common, hedge, httpcache, index, mirrors,
+                         progress, transport)
+from mcman.logic.plugins import catalogue, descriptor, resolver, utils
+
+# How many jars each scanning worker gets, when the amount isn't given
+JARS_PER_WORKER = 8
+# How many jars there must be to parse before a process pool is used
+PROCESS_THRESHOLD = 32
+# How the parsing processes are started. They are not forked, as a fork of
+# the threaded scanner could inherit locks held by the other threads
+PROCESS_START_METHOD = 'spawn'
+# How many jars each scanning worker may have queued at a time
+WINDOW_PER_WORKER = 2
+# How many installed plugins are looked up on BukGet in each request
+LOOKUP_BATCH = 25
+# How many lookups may be sent at once
+LOOKUP_JOBS = 2
+# The fields of the installed plugins which are looked up
+LOOKUP_FIELDS = ('slug,plugin_name,versions.hard_dependencies,versions.type,'
+                 'versions.version,versions.download,versions.filename,'
+                 'versions.md5,versions.slug')
+# The errors of a single jar, which don't stop the scan
+SCAN_ERRORS = (OSError, BadZipFile, ValueError, yaml.YAMLError)
+
+# Whether to ask the local catalogue instead of BukGet
+OFFLINE = False
+
+
+def init(base, user_agent, offline=False):
     """ Initialize the module.
 
-    This function just sets the base url and user agent for BukGet.
+    This function just sets the base url and user agent for BukGet, and makes
+    the requests go through the shared transport. `base` is a list of mirrors,
+    the fastest is used and the others are failed over to. If `offline` is
+    True the queries are answered by the local catalogue instead, and the
+    mirrors are not measured.
 
     """
-    bukget.BASE = base
+    global OFFLINE
+    OFFLINE = offline
+    if not offline:
+        bukget.BASE = mirrors.select(base)
+    httpcache.register('bukget', base)
     bukget.USER_AGENT = user_agent
+    transport.install()
+
+
+def api():
+    """ Return the module to query, bukget or the local catalogue.
+
+    The queries to BukGet are idempotent, so they are hedged and retried,
+    see the hedge module.
+
+    """
+    return catalogue if OFFLINE else hedge.Hedged(bukget)
 
 
 def search(query, size):
@@ -51,30 +101,41 @@ def search(query, size):
                  that case the bottom of the results are returned.
 
     A list with the plugin dicts from BukGet is returned. It is sorted by the
-    score system mentioned earlier.
+    score system mentioned earlier. See search_async.
+
+    """
+    return aio.run(search_async(query, size))
+
+
+async def search_async(query, size):
+    """ Search for plugins, with the name and slug searches sent at once.
+
+    See search for the parameters and the result.
 
     """
+    client = aio.Client(api())
     sorting = ('-' if size >= 0 else '')+'popularity.monthly'
-    search_results = bukget.search(
-        {
-            'field': 'plugin_name',
-            'action': 'like',
-            'value': query
-        },
-        sort=sorting,
-        fields='slug,plugin_name,description,popularity.monthly',
-        size=abs(size))
-    search_results += bukget.search(
-        {
-            'field': 'slug',
-            'action': 'like',
-            'value': query
-        },
-        sort=sorting,
-        fields='slug,plugin_name,description,popularity.monthly',
-        size=abs(size))
+    by_name, by_slug = await asyncio.gather(
+        client.search(
+            {
+                'field': 'plugin_name',
+                'action': 'like',
+                'value': query
+            },
+            sort=sorting,
+            fields='slug,plugin_name,description,popularity.monthly',
+            size=abs(size)),
+        client.search(
+            {
+                'field': 'slug',
+                'action': 'like',
+                'value': query
+            },
+            sort=sorting,
+            fields='slug,plugin_name,description,popularity.monthly',
+            size=abs(size)))
 
-    search_results = utils.remove_duplicate_plugins(search_results)
+    search_results = utils.remove_duplicate_plugins(by_name + by_slug)
 
     # Calculate scores
     results = list()
@@ -101,29 +162,64 @@ def info(server, name):
     plugin was not found.
 
     """
-    slug = bukget.find_by_name(server, name)
+    slug = api().find_by_name(server, name)
     if slug is None:
         return None
 
-    plugin = bukget.plugin_details(server, slug,
-                                   fields='website,dbo_page,'
-                                          + 'description,'
-                                          + 'versions.type,'
-                                          + 'versions.game_versions,'
-                                          + 'versions.version,'
-                                          + 'plugin_name,server,'
-                                          + 'authors,categories,'
-                                          + 'stage,slug')
+    plugin = api().plugin_details(server, slug,
+                                  fields='website,dbo_page,'
+                                         + 'description,'
+                                         + 'versions.type,'
+                                         + 'versions.game_versions,'
+                                         + 'versions.version,'
+                                         + 'plugin_name,server,'
+                                         + 'authors,categories,'
+                                         + 'stage,slug')
 
     return plugin
 
 
-def dependencies(server, plugins, v_type='Latest', deps=True):
+def lookup_dependencies(names):
+    """ Look up the plugins named `names`, for the dependency resolver. """
+    fields = ('slug,plugin_name,versions.hard_dependencies,versions.type,'
+              'versions.version,versions.download,versions.filename,'
+              'versions.md5')
+    return api().search(
+        {
+            'field': 'plugin_name',
+            'action': 'in',
+            'value': names
+        },
+        fields=fields)
+
+
+def print_cycle(names):
+    """ Tell the user about a circular dependency between `names`. """
+    print('    Circular dependency: {}'.format(' -> '.join(names)))
+
+
+def dependencies(server, plugins, v_type='Latest', deps=True,
+                 on_cycle=print_cycle):
     """ Resolve dependencies.
 
     This function will return a list of plugin dictionaries of all plugins
     depending directly, or indirectly on the plugins in `plugins`. `plugins`
-    may be a list of plugin slugs, or a single plugin slug.
+    may be a list of plugin slugs, or a single plugin slug. The plugins are
+    ordered so each comes after the plugins it depends on, see
+    resolver.resolve. `on_cycle` is called with the names of the plugins in
+    each circular dependency. See dependencies_async.
+
+    """
+    return aio.run(dependencies_async(server, plugins, v_type, deps,
+                                      on_cycle))
+
+
+async def dependencies_async(server, plugins, v_type='Latest', deps=True,
+                             on_cycle=print_cycle):
+    """ Resolve dependencies, with the name and slug searches sent at once.
+
+    See dependencies for the parameters and the result. The dependencies are
+    resolved in the executor of the event loop.
 
     """
     fields = ('slug,plugin_name,versions.hard_dependencies,versions.type,'
@@ -134,21 +230,23 @@ def dependencies(server, plugins, v_type='Latest', deps=True):
 
     plugins, versions = utils.extract_name_version(plugins)
 
-    results = bukget.search(
-        {
-            'field': 'plugin_name',
-            'action': 'in',
-            'value': plugins
-        },
-        fields=fields)
-    results += bukget.search(
-        {
-            'field': 'slug',
-            'action': 'in',
-            'value': plugins
-        },
-        fields=fields)
-    plugins = utils.remove_duplicate_plugins(results)
+    client = aio.Client(api())
+    by_name, by_slug = await asyncio.gather(
+        client.search(
+            {
+                'field': 'plugin_name',
+                'action': 'in',
+                'value': plugins
+            },
+            fields=fields),
+        client.search(
+            {
+                'field': 'slug',
+                'action': 'in',
+                'value': plugins
+            },
+            fields=fields))
+    plugins = utils.remove_duplicate_plugins(by_name + by_slug)
 
     for plugin in plugins:
         if not plugin['plugin_name'].lower() in versions:
@@ -164,58 +262,15 @@ def dependencies(server, plugins, v_type='Latest', deps=True):
             plugin['versions'] = []
 
     if deps:
-        return _dependencies(server, plugins, v_type=v_type)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(
+            resolver.resolve, plugins, lookup_dependencies, v_type,
+            on_cycle))
     else:
         return plugins
 
 
-def _dependencies(server, plugins, stack=None, v_type='Latest'):
-    """ Undocumented recursive, internal function. """
-    fields = ('slug,plugin_name,versions.hard_dependencies,versions.type,'
-              'versions.version,versions.download,versions.filename,'
-              'versions.md5')
-
-    # Sanitizing of parameters
-    if stack is None:
-        stack = plugins[:]
-    v_type = v_type.capitalize()
-
-    # Resolve all the dependencies of the plugins
-    deps = utils.extract_dependencies(plugins, v_type)
-
-    # Filter out dependencies allready in the stack and
-    # add all dependencies to the stack
-    # From this point on the stack contains all dependencies resolved so far,
-    # and dependencies contains all dependencies that are new of this level.
-    for dependency in deps:
-        for installed in stack:
-            if installed['plugin_name'] == dependency:
-                deps.remove(dependency)
-                break
-
-    # If there are any plugins whose dependencies are not in the stack
-    if len(deps) > 0:
-        search_results = bukget.search(
-            {
-                'field': 'plugin_name',
-                'action': 'in',
-                'value': deps
-            },
-            fields=fields)
-
-        for plugin in search_results:
-            for in_stack in stack:
-                if in_stack['slug'] == plugin['slug']:
-                    break
-            else:
-                stack.append(plugin)
-
-        _dependencies(server, search_results, stack, v_type)
-
-    return stack
-
-
-def download(question, frmt, plugins, skip=False):
+def download(question, frmt, plugins, skip=False, jobs=common.DEFAULT_JOBS):
     """ Download plugins.
 
     This function does the questioning, and installing of each plugin.
@@ -226,16 +281,64 @@ def download(question, frmt, plugins, skip=False):
                     parameters: total and part.
         plugins     A list of the plugins to install.
         skip        Whether to skip the confirmation.
+        jobs        How many plugins to download at once.
 
     """
     if common.ask(question, skip=skip):
-        for i in range(len(plugins)):
-            plugin = plugins[i]
-            prefix = frmt.format(total=len(plugins), part=i+1)
-            download_plugin(plugin, prefix)
+        download_plugins(plugins, frmt, jobs)
+
+
+def estimate_size(plugin):
+    """ Estimate the size of the download of `plugin`, in bytes.
+
+    BukGet does not give the size of the versions, so the size of the
+    installed version is used when the plugin is updated. None is returned
+    if it is not installed.
+
+    """
+    try:
+        return os.path.getsize(plugin['installed_file'])
+    except (KeyError, TypeError, OSError):
+        return None
+
 
+def download_plugins(plugins, frmt, jobs=common.DEFAULT_JOBS, replace=False):
+    """ Download plugins concurrently.
 
-def download_plugin(plugin, prefix=''):
+    Parameters:
+        plugins    A list of the plugins to install.
+        frmt       The format to format the prefix with. Must support two
+                   parameters: total and part.
+        jobs       How many plugins to download at once.
+        replace    Whether the plugins replace installed plugins. The plugins
+                   must have the 'installed_file' field when this is True.
+                   The installed file is removed when the new version is in
+                   place, if it was not overwritten by it.
+
+    The plugins are started largest first, by the size of their installed
+    versions, see estimate_size.
+
+    A list with whether each plugin was installed is returned.
+
+    """
+    downloads = list()
+    for i in range(len(plugins)):
+        plugin = plugins[i]
+        prefix = frmt.format(total=len(plugins), part=i+1)
+
+        def function(task, plugin=plugin):
+            """ Download one plugin in a worker. """
+            return download_plugin(plugin, task=task,
+                                   replace=(plugin['installed_file']
+                                            if replace else None))
+
+        downloads.append((prefix + common.format_name(plugin['plugin_name']),
+                          estimate_size(plugin), function))
+
+    return common.download_many(downloads, jobs)
+
+
+def download_plugin(plugin, prefix='', task=None, replace=None):
     """ Download plugin.
 
     This function takes two parameters. The first is the plugin. The plugin
@@ -245,6 +348,12 @@ def download_plugin(plugin, prefix=''):
     typically a counter on which download this it. Example:
         ( 5/20)
 
+    If a progress `task` is passed, the download reports to it instead of
+    starting it's own task. If `replace` is the path of an installed version
+    of the plugin, that file is removed after the new version is in place,
+    unless the new version was written to the same path. Whether the download
+    succeeded is returned.
+
     """
     target_folder = common.find_plugins_folder() + '/'
 
@@ -255,172 +364,488 @@ def download_plugin(plugin, prefix=''):
 
     full_name = target_folder + filename + '.' + suffix
 
-    common.download(url, destination=full_name,
-                    checksum=md5, prefix=prefix, display_name=filename)
+    if not common.download(url, destination=full_name, checksum=md5,
+                           prefix=prefix, display_name=filename, task=task):
+        return False
 
+    installed = [full_name]
     if suffix == 'zip':
-        print(' '*len(prefix) + 'Unzipping...', end=' ')
-        unzip_plugin(full_name, target_folder)
+        installed = unzip_plugin(full_name, target_folder)
         os.remove(full_name)
-        print('Success')
 
+    if replace is not None and os.path.exists(replace):
+        installed = [os.path.abspath(path) for path in installed]
+        if os.path.abspath(replace) not in installed:
+            os.remove(replace)
+    return True
 
-def unzip_plugin(target_file, target_folder):
-    """ Unzip a plugin that is packaged in a zip. """
+
+def unzip_plugin(target_file, target_folder, jobs=common.DEFAULT_JOBS):
+    """ Unzip a plugin that is packaged in a zip.
+
+    All jars in the zip are extracted to `target_folder`, keeping their path
+    within the zip. The members of the zip are only scanned once, and the jars
+    are streamed to disk in chunks. When there are several jars, up to `jobs`
+    of them are extracted at once. The progress is reported to an unzip task.
+
+    A list of the paths of the extracted jars is returned.
+
+    """
     with ZipFile(target_file, 'r') as zipped:
-        folders = [x for x in zipped.namelist()
-                   if x.endswith('/')]
-        jars = [x for x in zipped.namelist()
-                if x.endswith('.jar')]
-
-        strip_folder = False
-        if len(jars) == 0 and len(folders) > 0:
-            folder = folders[0]
-            # All jars in folder
-            jars = [x for x in zipped.namelist()
-                    if x.endswith('.jar')
-                    and x.startswith(folder)]
-            strip_folder = folder
+        jars = [info for info in zipped.infolist()
+                if info.filename.endswith('.jar')]
+        destinations = [target_folder + info.filename for info in jars]
 
-        for jar in jars:
-            destination = target_folder
-            if strip_folder:
-                destination += jar.split(strip_folder, 1)[1]
+        task = progress.start('unzip', os.path.basename(target_file),
+                              sum(info.file_size for info in jars))
+        try:
+            if len(jars) > 1 and jobs > 1:
+                with ThreadPoolExecutor(min(jobs, len(jars))) as executor:
+                    futures = [executor.submit(common.extract_file, zipped,
+                                               info, destination, task)
+                               for info, destination
+                               in zip(jars, destinations)]
+                    for future in futures:
+                        future.result()
             else:
-                destination += jar
+                for info, destination in zip(jars, destinations):
+                    common.extract_file(zipped, info, destination, task)
+        except (OSError, BadZipFile) as error:
+            task.finish(False, 'Error: {}'.format(error))
+            raise
+        task.finish()
 
-            common.extract_file(zipped, jar, destination)
+    return destinations
 
 
-def parse_installed_plugins_worker(jar_queue, result_queue):
-    """ Worker function of list_plugins.
+def scan_workers(jars, workers=None):
+    """ Return how many workers to scan `jars` jars with.
 
-    This function takes jars in the `jar_queue`, calculates the checksum,
-    and extracts the main class, name and version and push this data to the
-    `result_queue`.
+    `workers` is returned if it is given, else one worker for each
+    JARS_PER_WORKER jars, but no more than the amount of CPUs.
 
     """
-    while not jar_queue.empty():
-        jar = jar_queue.get()
+    if workers is not None and workers > 0:
+        return workers
+    return max(1, min(os.cpu_count() or 1, ceil(jars / JARS_PER_WORKER)))
+
+
+def read_plugin_yml(jar):
+    """ Read the main class, name and version from the plugin.yml of `jar`.
 
-        checksum = common.checksum_file(jar)
+    A tuple of them is returned, or None if the jar has no plugin.yml.
+    BadZipFile is raised if the jar can't be read, and ValueError if the
+    plugin.yml is invalid. This function is run in the worker processes of
+    scan_installed_plugins. See the descriptor module for how it is read.
+
+    """
+    data = descriptor.read_entry(jar, 'plugin.yml')
+    if data is None:
+        return None
+    return descriptor.parse_plugin_yml(data)
 
+
+def parser_executor(jars, workers):
+    """ Return a process pool to parse `jars` jars with, or None.
+
+    Parsing YAML is pure Python, and holds the GIL, so a process pool is used
+    when there are enough jars to make up for it's start up time. The
+    processes are started with PROCESS_START_METHOD. Else, or if processes
+    can't be started like that on this system or this version of Python, None
+    is returned, and the jars are parsed by the scanning threads.
+
+    """
+    if jars >= PROCESS_THRESHOLD and workers > 1:
         try:
-            with ZipFile(jar, 'r') as zipped:
-                if 'plugin.yml' not in zipped.namelist():
-                    continue
+            context = multiprocessing.get_context(PROCESS_START_METHOD)
+            return ProcessPoolExecutor(workers, mp_context=context)
+        except (OSError, NotImplementedError, ValueError, TypeError):
+            # TypeError is raised by Python 3.6 and older, without mp_context
+            pass
+    return None
 
-                yml = yaml.load(zipped.read('plugin.yml').decode())
-                plugin_name = yml['name']
-                main = yml['main']
-                version = str(yml['version'])
 
-                result_queue.put((checksum, main, plugin_name, version, jar))
-        except BadZipFile:
-            print("    Could not read '{}'.".format(jar))
+def parse_installed_plugin(jar):
+    """ Get the information about the installed plugin `jar`.
 
-        jar_queue.task_done()
+    The information is read from the index if the jar hasn't changed, else the
+    checksum is calculated, and the main class, name and version are
+    extracted from plugin.yml and stored in the index.
 
+    A tuple like the ones from parse_installed_plugins is returned, or None if
+    the jar is not a plugin. BadZipFile is raised if the jar can't be read.
 
-def parse_installed_plugins(workers=4):
-    """ Parse installed plugins for some information.
+    """
+    key, entry = index.lookup(jar)
+    if entry is None or 'main' not in entry:
+        info = read_plugin_yml(jar) or (None, None, None)
+        entry = common.digest_file(jar, index.DIGESTS)
+        entry.update(main=info[0], name=info[1], version=info[2])
+        index.store(jar, key, **entry)
+
+    if entry['main'] is None:
+        return None
+    return (entry['md5'], entry['main'], entry['name'], entry['version'], jar)
 
-    The information is returned in a tuple like this:
+
+def scan_jar(jar, parser, cancelled):
+    """ Hash `jar` and read it's plugin.yml.
+
+    This function is run in the scanning threads. The plugin.yml is parsed by
+    `parser` if it is a process pool, while the jar is hashed. If the pool is
+    broken, for example because a process was killed, the plugin.yml is
+    parsed in this thread instead. Nothing is done if the `cancelled` event is
+    set.
+
+    A tuple of the digests, main class, name and version is returned. The
+    digests are a dict like the one from index.digests, the last three are
+    None if the jar is not a plugin.
+
+    """
+    if cancelled.is_set():
+        return None
+    future = None
+    if parser is not None:
+        try:
+            future = parser.submit(read_plugin_yml, jar)
+        except BrokenProcessPool:
+            pass
+    digests = common.digest_file(jar, index.DIGESTS)
+    try:
+        info = future.result() if future is not None else read_plugin_yml(jar)
+    except BrokenProcessPool:
+        info = read_plugin_yml(jar)
+    return (digests, ) + (info or (None, None, None))
+
+
+def print_scan_error(jar, error):
+    """ Tell the user that `jar` could not be read. """
+    print("    Could not read '{}'.".format(jar))
+
+
+def scan_changed_plugins(changed, workers, on_error):
+    """ Scan the `changed` jars, and yield them as they are done.
+
+    `changed` is a list of (path, fingerprint) tuples from the index. See
+    scan_installed_plugins for the rest.
+
+    """
+    workers = scan_workers(len(changed), workers)
+    window = workers * WINDOW_PER_WORKER
+    parser = parser_executor(len(changed), workers)
+    scanner = ThreadPoolExecutor(workers)
+    cancelled = threading.Event()
+    queued = iter(changed)
+    running = dict()
+    try:
+        while True:
+            for jar, key in islice(queued, window - len(running)):
+                future = scanner.submit(scan_jar, jar, parser, cancelled)
+                running[future] = (jar, key)
+            if len(running) == 0:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                jar, key = running.pop(future)
+                try:
+                    digests, main, name, version = future.result()
+                except SCAN_ERRORS as error:
+                    on_error(jar, error)
+                    continue
+                index.store(jar, key, main=main, name=name, version=version,
+                            **digests)
+                if main is not None:
+                    yield (digests['md5'], main, name, version, jar)
+    finally:
+        # Stop the jars that haven't started, and wait for the rest
+        cancelled.set()
+        for future in running:
+            future.cancel()
+        scanner.shutdown()
+        if parser is not None:
+            parser.shutdown()
+
+
+def scan_installed_plugins(workers=None, on_error=print_scan_error,
+                           folder=None):
+    """ Scan the installed plugins, and yield information as each is done.
+
+    The information is yielded in tuples like this, in the order the jars are
+    done:
         (jar checksum, main class, plugin name, plugin version, jar path)
 
-    These tuples are put in a set.
+    Unchanged jars are not read, their information is taken from the index,
+    and they are yielded first. The other jars are scanned by `workers`
+    threads, which defaults to the value from scan_workers. At most
+    WINDOW_PER_WORKER jars per worker are queued at a time, so very large
+    plugin folders use little memory. The plugin.yml files are parsed by the
+    process pool from parser_executor, if there is one.
+
+    Jars that can't be read are passed to on_error(jar, error), and skipped.
+    If the generator is closed early the jars that aren't started are
+    cancelled. The index is saved when the generator is done or closed.
+
+    The jars in `folder` are scanned, it defaults to the plugins folder of the
+    server in the current folder.
 
     """
-    folder = common.find_plugins_folder() + '/'
+    if folder is None:
+        folder = common.find_plugins_folder()
+    folder += '/'
     jars = [folder + f for f in os.listdir(folder)
             if os.path.isfile(folder + f) and f.endswith('.jar')]
 
-    jar_queue = Queue()
-    for jar in jars:
-        jar_queue.put(jar)
+    changed = list()
+    try:
+        for jar in jars:
+            try:
+                key, entry = index.lookup(jar)
+            except OSError as error:
+                on_error(jar, error)
+                continue
+            if entry is None or 'main' not in entry:
+                changed.append((jar, key))
+            elif entry['main'] is not None:
+                yield (entry['md5'], entry['main'], entry['name'],
+                       entry['version'], jar)
+
+        if len(changed) > 0:
+            yield from scan_changed_plugins(changed, workers, on_error)
+    finally:
+        index.save()
+
+
+def parse_installed_plugins(workers=None):
+    """ Parse installed plugins for some information.
 
-    result_queue = Queue(len(jars))
+    The information is returned in a tuple like this:
+        (jar checksum, main class, plugin name, plugin version, jar path)
 
-    threads = list()
-    for _ in range(workers):
-        thread = threading.Thread(target=parse_installed_plugins_worker,
-                                  args=(jar_queue, result_queue))
-        thread.daemon = True
-        thread.start()
-        threads.append(thread)
+    These tuples are put in a set. See scan_installed_plugins for how the
+    jars are scanned.
 
-    # Wait for all jars to be claimed
-    jar_queue.join()
+    """
+    return set(scan_installed_plugins(workers))
 
-    # Wait for all threads to finish
-    for thread in threads:
-        thread.join()
 
-    plugins = set()
-    while not result_queue.empty():
-        plugins.add(result_queue.get())
+def match_installed(installed, results):
+    """ Pair the `installed` plugins with the plugin dicts in `results`.
 
-    return plugins
+    The plugin dicts are indexed by the checksums of their versions, their
+    name and their main class, and each installed plugin is matched by it's
+    checksum, then it's name and then it's main class.
 
+    A dict from the index of each matched plugin in `installed` to it's
+    plugin dict is returned.
 
-def list_plugins(workers=4):
-    """ List installed plugins.
+    """
+    by_checksum = dict()
+    by_name = dict()
+    by_main = dict()
+    for plugin in results:
+        for version in plugin.get('versions', []):
+            if version.get('md5'):
+                by_checksum.setdefault(version['md5'], plugin)
+        by_name.setdefault(plugin['plugin_name'].lower(), plugin)
+        if plugin.get('main'):
+            by_main.setdefault(plugin['main'], plugin)
+
+    matches = dict()
+    for i, record in enumerate(installed):
+        plugin = by_checksum.get(record[0])
+        if plugin is None:
+            plugin = by_name.get(record[2].lower())
+        if plugin is None:
+            plugin = by_main.get(record[1])
+        if plugin is not None:
+            matches[i] = plugin
+    return matches
+
+
+def lookup_installed(installed, fields):
+    """ Look up the `installed` plugins on BukGet.
+
+    `installed` is a list of tuples from scan_installed_plugins. The plugins
+    are searched for by checksum first. The ones that were not found are then
+    searched for by main class and by name, with both searches sent at once.
+    `fields` are the fields to get from BukGet, the main class is always
+    added.
+
+    Returns a list of plugin dicts, where installed_version and
+    installed_file are added from the installed plugin that was matched. See
+    lookup_installed_async.
 
-    Returns a list of plugin dicts with basic information about the plugin and
-    it's versions. Two additional fields exists in these dicts;
-    installed_version and installed_file.
+    """
+    return aio.run(lookup_installed_async(installed, fields))
+
+
+async def lookup_installed_async(installed, fields):
+    """ Look up the `installed` plugins on BukGet.
+
+    See lookup_installed for the parameters and the result.
 
     """
-    fields = ('slug,plugin_name,versions.hard_dependencies,versions.type,'
-              'versions.version,versions.download,versions.filename,'
-              'versions.md5,versions.slug')
+    installed = list(installed)
+    matches = await find_installed_async(installed, fields)
+
+    found = list()
+    slugs = set()
+    for i in sorted(matches):
+        plugin = matches[i]
+        if plugin['slug'] in slugs:
+            continue
+        slugs.add(plugin['slug'])
+        plugin['installed_version'] = installed[i][3]
+        plugin['installed_file'] = installed[i][4]
+        found.append(plugin)
+    return found
 
-    plugins = parse_installed_plugins(workers)
-    if plugins == []:
-        return []
 
-    results = bukget.search(
+async def find_installed_async(installed, fields):
+    """ Find the plugin dict of each of the `installed` plugins on BukGet.
+
+    See lookup_installed for the parameters. A dict from the index of each
+    plugin in `installed` that was found to it's plugin dict is returned,
+    like from match_installed. Several installed plugins can be matched with
+    the same plugin dict.
+
+    """
+    if 'main' not in fields.split(','):
+        fields += ',main'
+
+    client = aio.Client(api())
+    results = await client.search(
         {
             'field': 'versions.checksum',
             'action': 'in',
-            'value': [plugin[0] for plugin in plugins]
+            'value': [plugin[0] for plugin in installed]
         },
         fields=fields)
+    matches = match_installed(installed, results)
+
+    unmatched = [record for i, record in enumerate(installed)
+                 if i not in matches]
+    if len(unmatched) > 0:
+        by_main, by_name = await asyncio.gather(
+            client.search(
+                {
+                    'field': 'main',
+                    'action': 'in',
+                    'value': [plugin[1] for plugin in unmatched]
+                },
+                fields=fields),
+            client.search(
+                {
+                    'field': 'plugin_name',
+                    'action': 'in',
+                    'value': [plugin[2] for plugin in unmatched]
+                },
+                fields=fields))
+        fallback = by_main + by_name
+
+        unmatched_indexes = [i for i in range(len(installed))
+                             if i not in matches]
+        for i, plugin in match_installed(unmatched, fallback).items():
+            matches[unmatched_indexes[i]] = plugin
+    return matches
+
+
+def lookup_checksums(installed, fields):
+    """ Find the plugin dict of each of the `installed` plugins on BukGet.
+
+    See lookup_installed for the parameters. Unlike lookup_installed, every
+    installed plugin that is found is kept, also when several are versions of
+    the same plugin. A dict from the checksum of each of them to it's plugin
+    dict is returned, the plugin dicts are not changed.
 
-    if len(results) < len(plugins):
-        results += bukget.search(
-            {
-                'field': 'main',
-                'action': 'in',
-                'value': [plugin[1] for plugin in plugins]
-            },
-            fields=fields)
+    """
+    installed = list(installed)
+    matches = aio.run(find_installed_async(installed, fields))
+    return {installed[i][0]: plugin for i, plugin in matches.items()}
 
-    if len(results) < len(plugins):
-        results += bukget.search(
-            {
-                'field': 'plugin_name',
-                'action': 'in',
-                'value': [plugin[2] for plugin in plugins]
-            },
-            fields=fields)
 
-    results = utils.remove_duplicate_plugins(results)
+def lookup_batches(installed, lookup, batch_size=LOOKUP_BATCH):
+    """ Run `lookup` on batches of `installed`, while it is being scanned.
 
-    for plugin in results:
-        i_plugin = None
-        for installed in plugins:
-            if installed[2] == plugin['plugin_name']:
-                plugin['installed_version'] = installed[3]
-                plugin['installed_file'] = installed[4]
-                i_plugin = installed
+    `installed` is an iterable of tuples like the ones from
+    scan_installed_plugins. `lookup` is called with a list of up to
+    `batch_size` of them, in LOOKUP_JOBS threads, as soon as the batch is
+    scanned. The results of the lookups are yielded as each is done, also
+    while the rest are still being scanned.
+
+    """
+    with ThreadPoolExecutor(LOOKUP_JOBS) as executor:
+        lookups = set()
+        batch = list()
+        for record in installed:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                lookups.add(executor.submit(lookup, batch))
+                batch = list()
+            if len(lookups) > 0:
+                done, lookups = wait(lookups, timeout=0)
+                for future in done:
+                    yield future.result()
+        if len(batch) > 0:
+            lookups.add(executor.submit(lookup, batch))
+
+        for future in as_completed(lookups):
+            yield future.result()
+
+
+def lookup_plugins(installed, batch_size=LOOKUP_BATCH):
+    """ Look up installed plugins on BukGet, while they are being scanned.
+
+    `installed` is an iterable of tuples like the ones from
+    scan_installed_plugins. The plugins are looked up in batches of
+    `batch_size` as they come, so the lookups overlap with the scan, and the
+    results are merged as each lookup is done. See lookup_installed for the
+    plugin dicts returned, each plugin is only returned once.
+
+    """
+    results = list()
+    slugs = set()
+    lookup = functools.partial(lookup_installed, fields=LOOKUP_FIELDS)
+    for found in lookup_batches(installed, lookup, batch_size):
+        for plugin in found:
+            if plugin['slug'] not in slugs:
+                slugs.add(plugin['slug'])
+                results.append(plugin)
+    return results
+
+
+def lookup_plugin_checksums(installed, batch_size=LOOKUP_BATCH):
+    """ Look up installed plugins on BukGet by checksum, while scanning.
 
-        if i_plugin is not None:
-            plugins.remove(i_plugin)
+    This is like lookup_plugins, but a dict from the checksum of each
+    installed plugin that was found to it's plugin dict is returned, see
+    lookup_checksums. Use this to pair the results with the installed
+    plugins, as there can be several installed versions of one plugin.
 
+    """
+    results = dict()
+    lookup = functools.partial(lookup_checksums, fields=LOOKUP_FIELDS)
+    for found in lookup_batches(installed, lookup, batch_size):
+        results.update(found)
     return results
 
 
+def list_plugins(workers=None, batch_size=LOOKUP_BATCH):
+    """ List installed plugins.
+
+    Returns a list of plugin dicts with basic information about the plugin and
+    it's versions. Two additional fields exists in these dicts;
+    installed_version and installed_file.
+
+    The installed plugins are looked up on BukGet in batches of `batch_size`
+    while the rest are still being scanned, see lookup_plugins. `workers` is
+    passed to scan_installed_plugins.
+
+    """
+    return lookup_plugins(scan_installed_plugins(workers), batch_size)
+
+
 def find_versions(plugins):
     """ Get plugin dictionaries from BukGet only with the version.
 
@@ -432,7 +857,7 @@ def find_versions(plugins):
     fields = ('versions.slug,versions.md5,versions.download,versions.filename,'
               'plugin_name,slug')
 
-    results = bukget.search(
+    results = api().search(
         {
             'field': 'slug',
             'action': 'in',
@@ -0,0 +1,207 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Resolving the dependencies of plugins.
+
+The dependency graph is built breadth first. All the dependencies on one
+level of the graph that are not known yet are looked up with a single query,
+and the graph is then sorted so that each plugin comes after the plugins it
+depends on. Circular dependencies are reported, and broken where they close.
+
+The plugins that are looked up are remembered by their slug and the version
+type, so a subgraph that was resolved once is not looked up again in the same
+run.
+
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+
+from mcman.logic.plugins import utils
+
+# The dependency names of looked up plugins, by (slug, version type)
+_RESOLVED = dict()
+# The looked up plugins, by slug
+_PLUGINS = dict()
+# The slugs of the looked up plugins, by lower case plugin name
+_SLUGS = dict()
+_LOCK = threading.Lock()
+
+# The states of a plugin while sorting
+_VISITING = 1
+_DONE = 2
+
+
+def clear():
+    """ Forget the plugins that have been looked up. """
+    with _LOCK:
+        _RESOLVED.clear()
+        _PLUGINS.clear()
+        _SLUGS.clear()
+
+
+def dependency_names(plugin, v_type, remembered=True):
+    """ Return the names of the plugins `plugin` depends on.
+
+    If `remembered` is True the plugin was looked up, and the names are
+    remembered for the next time. Plugins given to resolve may have their
+    versions narrowed down, so their names are not remembered.
+
+    """
+    key = (plugin['slug'], v_type)
+    if not remembered:
+        return utils.extract_dependencies(plugin, v_type)
+    with _LOCK:
+        names = _RESOLVED.get(key)
+    if names is None:
+        names = utils.extract_dependencies(plugin, v_type)
+        with _LOCK:
+            _RESOLVED[key] = names
+    return names
+
+
+def remember(plugin):
+    """ Remember the looked up `plugin`. """
+    with _LOCK:
+        _PLUGINS[plugin['slug']] = copy.deepcopy(plugin)
+        _SLUGS[plugin['plugin_name'].lower()] = plugin['slug']
+
+
+def recall(name):
+    """ Return a copy of the remembered plugin named `name`, or None. """
+    with _LOCK:
+        plugin = _PLUGINS.get(_SLUGS.get(name.lower()))
+        return copy.deepcopy(plugin) if plugin is not None else None
+
+
+def build_graph(plugins, lookup, v_type):
+    """ Build the dependency graph of `plugins`.
+
+    `lookup` is called with a list of plugin names, and returns the plugin
+    dicts of the ones that exist. It is called once for each level of the
+    graph that has unknown plugins. Dependencies that don't exist are
+    ignored.
+
+    A tuple of an ordered dict of plugins by slug, and a dict with the slugs
+    each plugin depends on, is returned.
+
+    """
+    nodes = OrderedDict()
+    slugs = dict()
+
+    def add(plugin):
+        """ Add `plugin` to the graph, return whether it is new. """
+        if plugin['slug'] in nodes:
+            return False
+        nodes[plugin['slug']] = plugin
+        slugs[plugin['plugin_name'].lower()] = plugin['slug']
+        return True
+
+    frontier = [plugin for plugin in plugins if add(plugin)]
+    given = set(nodes)
+    requested = set()
+    while len(frontier) > 0:
+        level = list()
+        missing = list()
+        for plugin in frontier:
+            for name in dependency_names(plugin, v_type,
+                                         plugin['slug'] not in given):
+                key = name.lower()
+                if key in slugs or key in requested:
+                    continue
+                remembered = recall(key)
+                if remembered is not None:
+                    if add(remembered):
+                        level.append(remembered)
+                    continue
+                requested.add(key)
+                missing.append(name)
+
+        if len(missing) > 0:
+            for plugin in lookup(missing):
+                remember(plugin)
+                if add(plugin):
+                    level.append(plugin)
+        frontier = level
+
+    edges = dict()
+    for slug, plugin in nodes.items():
+        edges[slug] = list()
+        for name in dependency_names(plugin, v_type, slug not in given):
+            dependency = slugs.get(name.lower())
+            if dependency is not None and dependency != slug \
+                    and dependency not in edges[slug]:
+                edges[slug].append(dependency)
+    return nodes, edges
+
+
+def topological_order(nodes, edges, on_cycle=None):
+    """ Sort the plugins so each comes after the plugins it depends on.
+
+    `nodes` and `edges` are like the ones from build_graph. When a circular
+    dependency is found `on_cycle` is called with the names of the plugins in
+    the cycle, with the first one repeated at the end. The dependency that
+    closes the cycle is ignored.
+
+    The sorted list of plugin dicts is returned.
+
+    """
+    order = list()
+    state = dict()
+    for root in nodes:
+        if root in state:
+            continue
+        state[root] = _VISITING
+        stack = [(root, iter(edges[root]))]
+        while len(stack) > 0:
+            slug, dependencies = stack[-1]
+            for dependency in dependencies:
+                if dependency not in state:
+                    state[dependency] = _VISITING
+                    stack.append((dependency, iter(edges[dependency])))
+                    break
+                if state[dependency] == _VISITING and on_cycle is not None:
+                    path = [entry[0] for entry in stack]
+                    cycle = path[path.index(dependency):] + [dependency]
+                    on_cycle([nodes[entry]['plugin_name']
+                              for entry in cycle])
+            else:
+                stack.pop()
+                state[slug] = _DONE
+                order.append(nodes[slug])
+    return order
+
+
+def resolve(plugins, lookup, v_type='Latest', on_cycle=None):
+    """ Resolve the dependencies of `plugins`.
+
+    Four parameters are accepted:
+        plugins            The plugin dicts to resolve the dependencies of.
+        lookup             A function which looks up a list of plugin names,
+                           see build_graph.
+        v_type='Latest'    The type of the versions to use the dependencies
+                           of.
+        on_cycle=None      A function called with the names of the plugins
+                           in each circular dependency.
+
+    The plugins and all their direct and indirect dependencies are returned,
+    with each plugin after the plugins it depends on.
+
+    """
+    v_type = v_type.capitalize()
+    nodes, edges = build_graph(plugins, lookup, v_type)
+    return topological_order(nodes, edges, on_cycle)
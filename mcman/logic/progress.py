@@ -0,0 +1,377 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Progress events for downloads, checksums and unzips.
+
+Long running tasks are started with start(), which returns a Task. The task
+is updated with the amount of bytes done, and finished with whether it
+succeeded. Each of these events is passed to the current renderer, which is
+set up by init().
+
+The renderers are:
+    tty     One progress bar line per active task, redrawn at a fixed frame
+            rate. This is the default when stdout is a terminal.
+    plain   One line when a task finishes. This is the default when stdout is
+            not a terminal, for example in cron logs.
+    json    One JSON object per line on stderr for each event, with the bytes
+            done, the rate, the ETA and the time elapsed.
+    none    Nothing at all.
+
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from math import ceil
+
+# The renderers that can be passed to init
+MODES = ('auto', 'tty', 'plain', 'json', 'none')
+# How many times a second the tty renderer redraws
+FRAME_RATE = 10
+# How many seconds between each progress event from the json renderer
+JSON_INTERVAL = 1.0
+
+_RENDERER = None
+
+
+class Task(object):
+
+    """ A long running task, like a download.
+
+    The task reports it's events to the renderer. It is safe to update a task
+    from another thread than the one that started it.
+
+    """
+
+    def __init__(self, renderer, kind, name, total=-1):
+        """ Initialize and start the task.
+
+        Four parameters are accepted:
+            renderer    The renderer to report to.
+            kind        What kind of task this is. For example 'download',
+                        'checksum' or 'unzip'.
+            name        The name to display for the task.
+            total=-1    The total amount of bytes, or -1 if it is not known.
+
+        """
+        self.renderer = renderer
+        self.kind = kind
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.success = None
+        self.message = None
+        self.lock = threading.Lock()
+
+        self.renderer.start(self)
+
+    def update(self, done, total=None):
+        """ Update how many bytes are done, and optionally the total. """
+        if total is not None:
+            self.total = total
+        self.done = done
+        self.renderer.update(self)
+
+    def advance(self, amount):
+        """ Add `amount` bytes to how many are done.
+
+        This is safe to call from multiple threads working on the same task.
+
+        """
+        with self.lock:
+            self.done += amount
+        self.renderer.update(self)
+
+    def reporthook(self, count, blocksize, totalsize):
+        """ Update the task, with the same signature as urlretrieve's hook.
+        """
+        self.update(count * blocksize, totalsize)
+
+    def finish(self, success=True, message=None):
+        """ Finish the task.
+
+        The message is displayed after the name, it defaults to 'Success' or
+        'Failed'.
+
+        """
+        self.finished = time.monotonic()
+        self.success = success
+        if message is None:
+            message = 'Success' if success else 'Failed'
+        self.message = message
+        self.renderer.finish(self)
+
+    def elapsed(self):
+        """ Return how many seconds the task has been running. """
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    def rate(self):
+        """ Return the average rate in bytes per second. """
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return self.done / elapsed
+
+    def eta(self):
+        """ Return the estimated seconds left, or None if it is unknown. """
+        rate = self.rate()
+        if self.total < 0 or rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def percent(self):
+        """ Return how many percent of the task is done. """
+        if self.total <= 0:
+            return 100 if self.finished is not None else 0
+        return max(min(ceil(self.done * 100 / self.total), 100), 0)
+
+
+class Renderer(object):
+
+    """ A renderer which ignores all events.
+
+    This is the base for the other renderers.
+
+    """
+
+    def __init__(self, stream=None):
+        """ Initialize the renderer, which writes to `stream`. """
+        self.stream = stream if stream is not None else sys.stdout
+        self.lock = threading.Lock()
+
+    def start(self, task):
+        """ Called when `task` is started. """
+        pass
+
+    def update(self, task):
+        """ Called when `task` is updated. """
+        pass
+
+    def finish(self, task):
+        """ Called when `task` is finished. """
+        pass
+
+
+class PlainRenderer(Renderer):
+
+    """ A renderer which writes one line when a task is finished. """
+
+    def finish(self, task):
+        """ Write the name and message of the task. """
+        with self.lock:
+            self.stream.write('{} - {}\n'.format(task.name, task.message))
+            self.stream.flush()
+
+
+class TTYRenderer(Renderer):
+
+    """ A renderer with one progress bar line for each active task.
+
+    Finished tasks are written as a line above the progress bars, and the
+    progress bars are redrawn below. Updates redraw at most FRAME_RATE times a
+    second.
+
+    """
+
+    def __init__(self, stream=None, width=80, frame_rate=FRAME_RATE):
+        """ Initialize the renderer.
+
+        Up to three parameters are accepted:
+            stream=None               The stream to write to. Defaults to
+                                      sys.stdout.
+            width=80                  The width of the terminal.
+            frame_rate=FRAME_RATE     The maximum redraws per second.
+
+        """
+        Renderer.__init__(self, stream)
+        self.width = width
+        self.interval = 1 / frame_rate
+        self.tasks = OrderedDict()
+        self.drawn = 0
+        self.last_draw = 0
+
+    def start(self, task):
+        """ Add a line for the task. """
+        with self.lock:
+            self.tasks[id(task)] = task
+            self.draw()
+
+    def update(self, task):
+        """ Redraw, if it is time for a new frame. """
+        with self.lock:
+            if time.monotonic() - self.last_draw >= self.interval:
+                self.draw()
+
+    def finish(self, task):
+        """ Remove the line of the task, and write it's message above. """
+        with self.lock:
+            self.tasks.pop(id(task), None)
+            self.draw('{} - {}'.format(task.name, task.message))
+
+    def draw(self, message=None):
+        """ Redraw the progress bars, and write the message above them.
+
+        The lock must be held when this is called.
+
+        """
+        text = ''
+        if self.drawn > 0:
+            # Move to the start of the first drawn line
+            text += '\x1b[{}F'.format(self.drawn)
+        if message is not None:
+            text += '\x1b[2K' + message + '\n'
+        for task in self.tasks.values():
+            text += '\x1b[2K' + format_progress_bar(self.width, task.name,
+                                                    task.percent()) + '\n'
+        # Clear the lines left over from the last draw
+        text += '\x1b[J'
+        self.drawn = len(self.tasks)
+        self.last_draw = time.monotonic()
+
+        self.stream.write(text)
+        self.stream.flush()
+
+
+class JSONRenderer(Renderer):
+
+    """ A renderer which writes each event as a line of JSON.
+
+    Progress events are written at most once every JSON_INTERVAL seconds for
+    each task. The start and finish events are always written.
+
+    """
+
+    def __init__(self, stream=None, interval=JSON_INTERVAL):
+        """ Initialize the renderer, which writes to `stream`.
+
+        The stream defaults to sys.stderr, so the events are kept apart from
+        the normal output.
+
+        """
+        Renderer.__init__(self, stream if stream is not None else sys.stderr)
+        self.interval = interval
+        self.last_event = dict()
+
+    def start(self, task):
+        """ Write a start event. """
+        self.write('start', task)
+
+    def update(self, task):
+        """ Write a progress event, if it is time for one. """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_event.get(id(task), 0) < self.interval:
+                return
+            self.last_event[id(task)] = now
+        self.write('progress', task)
+
+    def finish(self, task):
+        """ Write a finish event. """
+        with self.lock:
+            self.last_event.pop(id(task), None)
+        self.write('finish', task)
+
+    def write(self, event, task):
+        """ Write the event for the task. """
+        total = task.total if task.total >= 0 else None
+        eta = task.eta()
+        data = OrderedDict([
+            ('event', event),
+            ('kind', task.kind),
+            ('name', task.name),
+            ('time', round(time.time(), 3)),
+            ('bytes', task.done),
+            ('total', total),
+            ('elapsed', round(task.elapsed(), 3)),
+            ('rate', round(task.rate(), 1)),
+            ('eta', round(eta, 3) if eta is not None else None),
+        ])
+        if event == 'finish':
+            data['success'] = task.success
+            data['message'] = task.message
+
+        line = json.dumps(data) + '\n'
+        with self.lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+
+def format_progress_bar(width, prefix, percent):
+    """ Format a progress bar line, without any line ending.
+
+    The prefix takes the left half of the width, and the bar with the percent
+    takes the right half.
+
+    """
+    left = ceil(width/2)
+    right = width-left
+    net_bar_size = right-8
+    char_size = net_bar_size/100
+    frmt = '{{prefix:<{}}}[{{bar_left}}{{bar_right}}] {{prc}}%'.format(left)
+
+    fill_size = int(char_size*percent)
+    empty_size = net_bar_size-fill_size
+    return frmt.format(prefix=prefix,
+                       bar_left=('='*(fill_size-1)+'>' if percent < 100
+                                 else '='*fill_size),
+                       bar_right=' '*empty_size,
+                       prc=percent)
+
+
+def init(mode='auto', width=80):
+    """ Set up the renderer.
+
+    Two parameters are accepted:
+        mode='auto'    One of MODES. 'auto' selects 'tty' if stdout is a
+                       terminal, else 'plain'.
+        width=80       The width of the terminal, used by the tty renderer.
+
+    """
+    global _RENDERER
+    if mode == 'auto':
+        mode = 'tty' if sys.stdout.isatty() else 'plain'
+
+    if mode == 'tty':
+        _RENDERER = TTYRenderer(width=width)
+    elif mode == 'plain':
+        _RENDERER = PlainRenderer()
+    elif mode == 'json':
+        _RENDERER = JSONRenderer()
+    elif mode == 'none':
+        _RENDERER = Renderer()
+    else:
+        raise ValueError('Unknown progress mode: {}'.format(mode))
+
+
+def renderer():
+    """ Return the current renderer, and set up the default if needed. """
+    if _RENDERER is None:
+        init()
+    return _RENDERER
+
+
+def start(kind, name, total=-1):
+    """ Start a task, and return it.
+
+    See Task for the parameters.
+
+    """
+    return Task(renderer(), kind, name, total)
@@ -0,0 +1,132 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Bandwidth shaping for downloads.
+
+All downloads in one mcman process share a token bucket, which is filled with
+RATE bytes every second. Each chunk that is downloaded takes tokens from the
+bucket, and the download waits when the bucket is empty. An optional bucket
+for each host limits how much is downloaded from a single host.
+
+The buckets may go into debt, so a chunk is never split. The waiting is done
+after the tokens are taken, which keeps the order fair between the threads.
+
+"""
+
+import threading
+import time
+
+# How many seconds of tokens a bucket can hold, which is the largest burst
+BURST = 0.5
+
+# The rate limit of all downloads, in bytes per second. 0 means no limit.
+RATE = 0
+# The rate limit of the downloads from each host. 0 means no limit.
+HOST_RATE = 0
+
+_GLOBAL = None
+_HOSTS = dict()
+_LOCK = threading.Lock()
+
+
+class TokenBucket(object):
+
+    """ A thread safe token bucket, where each token is one byte. """
+
+    def __init__(self, rate, burst=BURST):
+        """ Initialize the bucket.
+
+        Two parameters are accepted:
+            rate          How many tokens the bucket is filled with each
+                          second.
+            burst=BURST   How many seconds of tokens the bucket can hold.
+
+        """
+        self.rate = rate
+        self.capacity = max(rate * burst, 1)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """ Take `amount` tokens from the bucket.
+
+        The bucket may go into debt. The seconds to wait before the tokens are
+        available is returned.
+
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def consume(self, amount):
+        """ Take `amount` tokens, and wait until they are available. """
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def init(rate=0, host_rate=0):
+    """ Set the rate limits.
+
+    Two parameters are accepted:
+        rate=0         The limit of all downloads, in bytes per second.
+        host_rate=0    The limit of the downloads from each host, in bytes
+                       per second.
+
+    A limit of 0 means no limit.
+
+    """
+    global RATE, HOST_RATE, _GLOBAL
+    with _LOCK:
+        RATE = rate
+        HOST_RATE = host_rate
+        _GLOBAL = TokenBucket(rate) if rate > 0 else None
+        _HOSTS.clear()
+
+
+def host_bucket(host):
+    """ Return the bucket of `host`, or None if there is no host limit. """
+    if HOST_RATE <= 0 or host is None:
+        return None
+    with _LOCK:
+        bucket = _HOSTS.get(host)
+        if bucket is None:
+            bucket = _HOSTS[host] = TokenBucket(HOST_RATE)
+        return bucket
+
+
+def throttle(host, amount):
+    """ Wait until `amount` bytes from `host` fit in the rate limits.
+
+    This returns at once if there are no limits.
+
+    """
+    delay = 0
+    bucket = host_bucket(host)
+    if bucket is not None:
+        delay = bucket.reserve(amount)
+    bucket = _GLOBAL
+    if bucket is not None:
+        delay = max(delay, bucket.reserve(amount))
+    if delay > 0:
+        time.sleep(delay)
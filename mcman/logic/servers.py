@@ -16,21 +16,27 @@
 
 """ The backend for the mcman servers command. """
 
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import spacegdn
 
-from mcman.logic import common
+from mcman.logic import aio, common, httpcache, index, mirrors, transport
 
 
 def init(base, user_agent):
     """ Initialize this module.
 
-    This function will just set the base url and user agent for SpaceGDN.
+    This function will just set the base url and user agent for SpaceGDN, and
+    make the requests go through the shared transport. `base` is a list of
+    mirrors, the fastest is used and the others are failed over to.
 
     """
-    spacegdn.BASE = base
+    spacegdn.BASE = mirrors.select(base)
+    httpcache.register('spacegdn', base)
     spacegdn.USER_AGENT = user_agent
+    transport.install()
 
 
 def jars():
@@ -171,28 +177,53 @@ def get_roots(build):
     """ Get the roots(server, channel, version and build) of this build.
 
     The returned value is a tuple of the server name, channel name, version
-    name and build number.
+    name and build number. See get_roots_async.
 
     """
-    server = spacegdn.jars(build['jar_id'])[0]['name']
-    channel = spacegdn.channels(build['jar_id'],
-                                build['channel_id'])[0]['name']
-    version = spacegdn.versions(build['jar_id'], build['channel_id'],
-                                build['version_id'])[0]['version']
-    build = build['build']
+    return aio.run(get_roots_async(build))
 
-    return server, channel, version, build
+
+async def get_roots_async(build):
+    """ Get the roots of this build, with the three queries sent at once.
+
+    See get_roots for the result.
+
+    """
+    client = aio.Client(spacegdn)
+    jars, channels, versions = await asyncio.gather(
+        client.jars(build['jar_id']),
+        client.channels(build['jar_id'], build['channel_id']),
+        client.versions(build['jar_id'], build['channel_id'],
+                        build['version_id']))
+
+    return (jars[0]['name'], channels[0]['name'], versions[0]['version'],
+            build['build'])
 
 
 def find_latest_build(build_list):
-    """ Find the latest build in a list of builds. """
+    """ Find the latest build in a list of builds.
+
+    See find_latest_build_async.
+
+    """
+    return aio.run(find_latest_build_async(build_list))
+
+
+async def find_latest_build_async(build_list):
+    """ Find the latest build, with the channel and version queries at once.
+
+    A tuple of the channel name, version name and build dict is returned.
+
+    """
     build_list.sort(key=lambda build: build['build'], reverse=True)
     build = build_list[0]
 
-    channel = spacegdn.channels(channel=build['channel_id'])[0]['name']
-    version = spacegdn.versions(version=build['version_id'])[0]['version']
+    client = aio.Client(spacegdn)
+    channels, versions = await asyncio.gather(
+        client.channels(channel=build['channel_id']),
+        client.versions(version=build['version_id']))
 
-    return channel, version, build
+    return channels[0]['name'], versions[0]['version'], build
 
 
 def find_newest(server, channel):
@@ -209,30 +240,55 @@ def find_newest(server, channel):
     return version, build['build']
 
 
-def list_servers():
+def builds_by_checksum(checksums, jobs=common.DEFAULT_JOBS):
+    """ Find the builds of several checksums.
+
+    SpaceGDN takes one checksum per query, so each distinct checksum is
+    looked up once, and up to `jobs` queries are sent at once. A dict from
+    each checksum to it's build is returned, without the checksums that were
+    not found.
+
+    """
+    checksums = list(set(checksums))
+    with ThreadPoolExecutor(max(1, jobs)) as executor:
+        builds = list(executor.map(build_by_checksum, checksums))
+    return {checksum: build for checksum, build in zip(checksums, builds)
+            if build is not None}
+
+
+def list_servers(jobs=common.DEFAULT_JOBS):
     """ List servers in the current dir.
 
-    Returned is a dictionary from jar file(relative path) to id
+    Returned is a dictionary from jar file(relative path) to id. The checksums
+    of unchanged jars are taken from the index, the rest are calculated by
+    `jobs` threads, and the builds are found with builds_by_checksum.
 
     """
-    files = dict()
+    jars = [file for file in os.listdir() if file.endswith('.jar')]
+
+    with ThreadPoolExecutor(max(1, jobs)) as executor:
+        checksums = list(executor.map(index.checksum, jars))
+    index.save()
+
+    builds = builds_by_checksum(checksums, jobs)
+    return {jar: builds[checksum]['id']
+            for jar, checksum in zip(jars, checksums) if checksum in builds}
 
-    for file in os.listdir():
-        if not file.endswith('.jar'):
-            continue
-        checksum = common.checksum_file(file)
-        build = build_by_checksum(checksum)
-        if build is not None:
-            files[file] = build['id']
 
-    return files
+def find_servers(servers, jobs=common.DEFAULT_JOBS):
+    """ Get builds by ids.
 
+    Each distinct id is looked up once, with up to `jobs` queries at once.
+    The builds are returned in the order of `servers`, without the ones that
+    were not found.
 
-def find_servers(servers):
-    """ Get builds by ids. """
-    build_list = list()
-    for build in servers:
+    """
+    def find_build(build):
+        """ Find the build with the id `build`. """
         results = spacegdn.builds(build=build)
-        if len(results) > 0:
-            build_list.append(results[0])
-    return build_list
+        return results[0] if len(results) > 0 else None
+
+    ids = list(set(servers))
+    with ThreadPoolExecutor(max(1, jobs)) as executor:
+        found = dict(zip(ids, executor.map(find_build, ids)))
+    return [found[build] for build in servers if found[build] is not None]
@@ -0,0 +1,513 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The shared HTTP transport of mcman.
+
+All HTTP traffic in mcman goes through this module. It keeps idle connections
+open, and reuses them for the next request to the same host. Requests that
+don't ask for a specific encoding, or a range, are sent with
+'Accept-Encoding: gzip', and the responses are decompressed transparently.
+
+Mirrors of a service are registered as a group of base urls, in order of
+preference. A request to one of them that fails to connect, times out or gets
+a server error is sent again to the next mirror in the group, and the failed
+mirror is moved to the end of the group. When every mirror failed, the
+request has used up it's retries, and the error is marked as failed over, so
+the callers don't retry it again, see failed_over.
+
+Each request has a connect timeout and a read timeout, so a server that stops
+responding can't hang mcman. An overall deadline can be set with
+set_deadline, after which new requests fail with DeadlineExceeded, and the
+timeouts of requests are cut to the time that is left.
+
+Responses from the APIs are answered from the response cache in the
+httpcache module, before they get to the mirrors.
+
+pyBukGet and pySpaceGDN use urlopen from urllib.request, so install() makes
+the opener of this module the global one.
+
+"""
+
+import gzip
+import random
+import socket
+import threading
+import time
+from http.client import (HTTPConnection, HTTPSConnection, HTTPResponse,
+                         HTTPException)
+from io import BytesIO
+from urllib.error import HTTPError, URLError
+from urllib.request import (HTTPHandler, HTTPSHandler, Request, build_opener,
+                            install_opener)
+from urllib.response import addinfourl
+
+from mcman.logic import httpcache
+
+# How many idle connections to keep for each host
+MAX_IDLE = 4
+# The seconds to wait for a connection to be made
+CONNECT_TIMEOUT = 10
+# The seconds to wait for data from a connection
+READ_TIMEOUT = 30
+# The first and the longest delay in seconds between retries, see backoff
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 10
+
+# Idle connections, by (scheme, host)
+_IDLE = dict()
+# Groups of mirror base urls, each in order of preference
+_MIRRORS = list()
+_LOCK = threading.Lock()
+_OPENER = None
+# The time.monotonic() all requests must be done by, or None
+_DEADLINE = None
+
+
+def init(connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+         deadline=None):
+    """ Set the timeouts, and the deadline.
+
+    Up to three parameters are accepted:
+        connect_timeout=CONNECT_TIMEOUT    The seconds to wait for a
+                                           connection to be made.
+        read_timeout=READ_TIMEOUT          The seconds to wait for data.
+        deadline=None                      The seconds from now all requests
+                                           must be done in, or None.
+
+    """
+    global CONNECT_TIMEOUT, READ_TIMEOUT
+    CONNECT_TIMEOUT = connect_timeout
+    READ_TIMEOUT = read_timeout
+    set_deadline(deadline)
+
+
+class DeadlineExceeded(socket.timeout):
+
+    """ Raised when a request is made after the deadline. """
+
+    pass
+
+
+def set_deadline(seconds):
+    """ Make all requests fail `seconds` from now. None removes the deadline.
+    """
+    global _DEADLINE
+    _DEADLINE = time.monotonic() + seconds if seconds else None
+
+
+def remaining():
+    """ Return the seconds left until the deadline, or None if there is none.
+    """
+    if _DEADLINE is None:
+        return None
+    return _DEADLINE - time.monotonic()
+
+
+def check_deadline():
+    """ Raise DeadlineExceeded if the deadline has passed. """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded('The deadline was exceeded')
+
+
+def timeouts(timeout):
+    """ Return the connect and read timeouts of a request.
+
+    `timeout` is the timeout given to the request. If it is the default, or
+    None, CONNECT_TIMEOUT and READ_TIMEOUT are used, else it is used for
+    both. The timeouts are cut to the time left until the deadline, and
+    DeadlineExceeded is raised if it has passed.
+
+    """
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT or timeout is None:
+        connect, read = CONNECT_TIMEOUT, READ_TIMEOUT
+    else:
+        connect = read = timeout
+    check_deadline()
+    left = remaining()
+    if left is not None:
+        connect = min(connect, left)
+        read = min(read, left)
+    return connect, read
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """ Sleep before retry number `attempt`, counting from 0.
+
+    The delay is random between 0 and `base` * 2 ** `attempt`, at most `cap`,
+    so clients that fail at the same time don't retry at the same time. The
+    delay is cut to the time left until the deadline.
+
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    left = remaining()
+    if left is not None:
+        delay = max(min(delay, left), 0)
+    time.sleep(delay)
+
+
+class TimeoutConnectionMixin(object):
+
+    """ A connection with a separate timeout for reads after connecting. """
+
+    read_timeout = None
+
+    def connect(self):
+        """ Connect, and then switch to the read timeout. """
+        super().connect()
+        if self.read_timeout is not None:
+            self.sock.settimeout(self.read_timeout)
+
+
+class TimeoutHTTPConnection(TimeoutConnectionMixin, HTTPConnection):
+
+    """ A http connection with a read timeout. """
+
+    pass
+
+
+class TimeoutHTTPSConnection(TimeoutConnectionMixin, HTTPSConnection):
+
+    """ A https connection with a read timeout. """
+
+    pass
+
+
+class PooledResponse(HTTPResponse):
+
+    """ A response which gives it's connection back to the pool.
+
+    The connection is given back when the response is read to the end. If the
+    response is closed before that, the connection is closed too, as there is
+    unread data left on it.
+
+    """
+
+    release = None
+
+    def close(self):
+        """ Close the response. """
+        if self.fp is not None and self.length != 0:
+            # Closed before the whole body was read
+            self.will_close = True
+        HTTPResponse.close(self)
+
+    def _close_conn(self):
+        """ Close the stream, and release the connection. """
+        HTTPResponse._close_conn(self)
+        release, self.release = self.release, None
+        if release is not None:
+            release(not self.will_close)
+
+
+def acquire(scheme, host, timeout):
+    """ Get a connection to `host`.
+
+    An idle connection is reused if there is one, else a new connection is
+    created. The timeouts of the connection are set from `timeout`, see
+    timeouts. A tuple of the connection and whether it was reused is
+    returned.
+
+    """
+    connect, read = timeouts(timeout)
+
+    with _LOCK:
+        idle = _IDLE.get((scheme, host))
+        connection = idle.pop() if idle else None
+
+    if connection is not None:
+        connection.timeout = connect
+        connection.read_timeout = read
+        try:
+            if connection.sock is not None:
+                connection.sock.settimeout(read)
+        except OSError:
+            # The socket is broken, a new one is opened by the next request
+            connection.close()
+        return connection, True
+
+    if scheme == 'https':
+        connection = TimeoutHTTPSConnection(host, timeout=connect)
+    else:
+        connection = TimeoutHTTPConnection(host, timeout=connect)
+    connection.read_timeout = read
+    connection.response_class = PooledResponse
+    return connection, False
+
+
+def release(scheme, host, connection, reusable=True):
+    """ Give a connection back to the pool.
+
+    The connection is closed instead if it is not reusable, or the pool for
+    the host is full.
+
+    """
+    if reusable and connection.sock is not None:
+        with _LOCK:
+            idle = _IDLE.setdefault((scheme, host), list())
+            if len(idle) < MAX_IDLE:
+                idle.append(connection)
+                return
+    connection.close()
+
+
+def close_all():
+    """ Close all idle connections. """
+    with _LOCK:
+        connections = [c for idle in _IDLE.values() for c in idle]
+        _IDLE.clear()
+    for connection in connections:
+        connection.close()
+
+
+class PooledHandlerMixin(object):
+
+    """ The parts shared by the pooled HTTP and HTTPS handlers. """
+
+    def pooled_open(self, req, scheme):
+        """ Send the request on a pooled connection.
+
+        A request that fails on a reused connection is sent again on a new
+        connection, as the server may have closed the idle connection.
+
+        """
+        host = req.host
+        if not host:
+            raise URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({key: value for key, value in req.headers.items()
+                        if key not in headers})
+        headers = {key.title(): value for key, value in headers.items()}
+
+        while True:
+            connection, reused = acquire(scheme, host, req.timeout)
+            try:
+                connection.request(req.get_method(), req.selector, req.data,
+                                   headers)
+                response = connection.getresponse()
+            except (ConnectionError, HTTPException) as error:
+                connection.close()
+                if reused:
+                    continue
+                raise URLError(error)
+            except OSError as error:
+                connection.close()
+                raise URLError(error)
+            break
+
+        response.release = lambda reusable: release(scheme, host, connection,
+                                                    reusable)
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        return response
+
+    def pooled_request(self, req):
+        """ Ask for gzip, unless an encoding or a range is requested. """
+        if not req.has_header('Accept-encoding') \
+                and not req.has_header('Range'):
+            req.add_unredirected_header('Accept-Encoding', 'gzip')
+        return req
+
+    def pooled_response(self, req, response):
+        """ Decompress gzipped responses. """
+        encoding = response.headers.get('Content-Encoding', '')
+        if encoding.lower() != 'gzip':
+            return response
+
+        try:
+            data = gzip.decompress(response.read())
+        except (OSError, EOFError) as error:
+            raise URLError(error)
+        finally:
+            response.close()
+
+        headers = response.headers
+        del headers['Content-Encoding']
+        del headers['Content-Length']
+        headers['Content-Length'] = str(len(data))
+
+        result = addinfourl(BytesIO(data), headers, response.url,
+                            response.status)
+        result.msg = response.msg
+        return result
+
+
+class PooledHTTPHandler(PooledHandlerMixin, HTTPHandler):
+
+    """ A urllib handler for http with pooled connections. """
+
+    def http_open(self, req):
+        """ Open a http request. """
+        return self.pooled_open(req, 'http')
+
+    def http_request(self, req):
+        """ Prepare a http request. """
+        return self.pooled_request(HTTPHandler.http_request(self, req))
+
+    def http_response(self, req, response):
+        """ Process a http response. """
+        return self.pooled_response(req, response)
+
+
+class PooledHTTPSHandler(PooledHandlerMixin, HTTPSHandler):
+
+    """ A urllib handler for https with pooled connections. """
+
+    def https_open(self, req):
+        """ Open a https request. """
+        if req._tunnel_host:
+            # Requests through a proxy tunnel are not pooled
+            return HTTPSHandler.https_open(self, req)
+        return self.pooled_open(req, 'https')
+
+    def https_request(self, req):
+        """ Prepare a https request. """
+        return self.pooled_request(HTTPSHandler.https_request(self, req))
+
+    def https_response(self, req, response):
+        """ Process a https response. """
+        return self.pooled_response(req, response)
+
+
+def add_mirrors(bases):
+    """ Register the base urls in `bases` as mirrors of each other.
+
+    The first base is preferred. A group with the same bases is replaced.
+
+    """
+    bases = list(bases)
+    with _LOCK:
+        _MIRRORS[:] = [group for group in _MIRRORS
+                       if set(group) != set(bases)]
+        if len(bases) > 1:
+            _MIRRORS.append(bases)
+
+
+def clear_mirrors():
+    """ Forget all mirrors. """
+    with _LOCK:
+        del _MIRRORS[:]
+
+
+def alternatives(url):
+    """ Return the urls to try for `url`, in order of preference.
+
+    A list of (base, url) tuples is returned, with one for each mirror of the
+    base url of `url`. If `url` is not on a mirror, the list has just one
+    tuple, where the base is None.
+
+    """
+    with _LOCK:
+        for group in _MIRRORS:
+            for base in group:
+                if url.startswith(base):
+                    path = url[len(base):]
+                    return [(mirror, mirror + path) for mirror in group]
+    return [(None, url)]
+
+
+def demote(base):
+    """ Move the mirror `base` to the end of it's group. """
+    with _LOCK:
+        for group in _MIRRORS:
+            if base in group:
+                group.remove(base)
+                group.append(base)
+
+
+def failed_over(error):
+    """ Return whether `error` was raised after trying every mirror. """
+    return getattr(error, 'failed_over', False)
+
+
+class FailoverOpener(object):
+
+    """ An opener which sends failed requests to the next mirror.
+
+    It wraps an OpenerDirector, and has the same open method, so it can be
+    installed as the global opener of urllib.
+
+    """
+
+    def __init__(self, director):
+        """ Initialize the opener, which opens requests with `director`. """
+        self.director = director
+
+    def open(self, fullurl, data=None,
+             timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        """ Open `fullurl`, trying each mirror until one responds. """
+        if isinstance(fullurl, Request):
+            url = fullurl.full_url
+        else:
+            url = fullurl
+        candidates = alternatives(url)
+        if len(candidates) == 1:
+            return self.director.open(fullurl, data, timeout)
+
+        error = None
+        for base, candidate in candidates:
+            if isinstance(fullurl, Request):
+                request = Request(candidate, data=fullurl.data,
+                                  headers=dict(fullurl.header_items()),
+                                  method=fullurl.get_method())
+            else:
+                request = candidate
+            try:
+                return self.director.open(request, data, timeout)
+            except DeadlineExceeded:
+                raise
+            except (OSError, HTTPException) as caught:
+                if isinstance(caught, HTTPError) and caught.code < 500:
+                    # The mirror works, the request is wrong
+                    raise
+                error = caught
+                demote(base)
+        error.failed_over = True
+        raise error
+
+
+def opener():
+    """ Return the opener of this module, and create it if needed. """
+    global _OPENER
+    if _OPENER is None:
+        _OPENER = httpcache.CachingOpener(FailoverOpener(
+            build_opener(PooledHTTPHandler, PooledHTTPSHandler)))
+    return _OPENER
+
+
+def install():
+    """ Make the opener of this module the global opener of urllib.
+
+    After this urlopen, and therefore pyBukGet and pySpaceGDN, uses the
+    pooled connections.
+
+    """
+    install_opener(opener())
+
+
+def open(url, headers=None, data=None, method=None,
+         timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    """ Open an url through the shared transport.
+
+    `url` may be a string or a Request. The other arguments are only used
+    when it is a string. The response is returned, like from urlopen.
+
+    """
+    if not isinstance(url, Request):
+        url = Request(url, data=data, headers=headers or dict(),
+                      method=method)
+    return opener().open(url, timeout=timeout)
@@ -0,0 +1,502 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The backend for the mcman watch command.
+
+The watch command keeps the state of the installed plugins and server jars in
+memory, and serves it as JSON over HTTP. The plugins folder and the server
+folder are watched for changes, and only the jars that changed are read
+again, through the index.
+
+The plugins and builds found on BukGet and SpaceGDN are looked up again when
+they have been kept for as long as the responses are fresh in httpcache, so
+new versions show up without any jar changing.
+
+Changes are found with inotify on Linux, through ctypes. On other systems,
+or if inotify can't be used, the folders are polled instead. Polling only
+lists a folder when it's modification time changes, else it just stats the
+known jars.
+
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import threading
+import time
+from http.client import HTTPException
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.error import URLError
+
+from mcman.logic import httpcache, index, servers
+from mcman.logic.plugins import plugins, utils
+
+# The default seconds between each poll
+POLL_INTERVAL = 2.0
+# How long to wait for more events after the first one, in seconds
+SETTLE_TIME = 0.2
+# The least seconds between the lookups of expired checksums
+LOOKUP_RETRY = 60.0
+
+# The inotify flags, from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+# Events after which the whole folders must be scanned again
+RESCAN_MASK = IN_Q_OVERFLOW | IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_STRUCT = struct.Struct('iIII')
+
+# The errors from BukGet and SpaceGDN, which are retried on the next change
+LOOKUP_ERRORS = (URLError, HTTPException, OSError, ValueError, KeyError)
+
+
+def list_jars(folder):
+    """ Return the paths of the jars in `folder`. """
+    return [os.path.join(folder, name) for name in os.listdir(folder)
+            if name.endswith('.jar')
+            and os.path.isfile(os.path.join(folder, name))]
+
+
+class PollingWatcher(object):
+
+    """ A watcher which polls the folders for changed jars. """
+
+    def __init__(self, folders, interval=POLL_INTERVAL):
+        """ Start watching the `folders`, polling every `interval` seconds.
+        """
+        self.folders = list(folders)
+        self.interval = interval
+        self.listed = dict()
+        self.known = dict()
+        self.poll()
+
+    def fingerprint(self, path):
+        """ Return the fingerprint of `path`, or None if it is gone. """
+        try:
+            return index.fingerprint(path)
+        except OSError:
+            return None
+
+    def poll(self):
+        """ Look for changes, and return the paths of the changed jars. """
+        changed = set()
+        for folder in self.folders:
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                continue
+            if self.listed.get(folder) != mtime:
+                self.listed[folder] = mtime
+                for path in list_jars(folder):
+                    self.known.setdefault(path, None)
+
+        for path, old in list(self.known.items()):
+            new = self.fingerprint(path)
+            if new != old:
+                changed.add(path)
+            if new is None:
+                del self.known[path]
+            else:
+                self.known[path] = new
+        return changed
+
+    def wait(self, timeout=None):
+        """ Wait for changes.
+
+        A set of the paths of the jars that changed is returned. It is empty
+        if nothing changed within `timeout` seconds.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.poll()
+            if len(changed) > 0:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        """ Stop watching. """
+        pass
+
+
+class InotifyWatcher(object):
+
+    """ A watcher which uses inotify to find changed jars. """
+
+    def __init__(self, folders):
+        """ Start watching the `folders`.
+
+        OSError is raised if inotify can't be used.
+
+        """
+        name = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(name or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.libc = libc
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.paths = set(folders)
+        self.folders = dict()
+        try:
+            self.add_watches()
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def add_watches(self):
+        """ Watch the folders, again if they were moved or recreated. """
+        self.folders.clear()
+        for folder in self.paths:
+            descriptor = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(folder), WATCH_MASK)
+            if descriptor < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch failed',
+                              folder)
+            self.folders[descriptor] = folder
+
+    def read_events(self):
+        """ Read the pending events.
+
+        A set of the changed jars is returned, or None if all folders must be
+        scanned again.
+
+        """
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, _, length = \
+                    EVENT_STRUCT.unpack_from(data, offset)
+                offset += EVENT_STRUCT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & RESCAN_MASK:
+                    changed = None
+                elif changed is not None and name.endswith(b'.jar') \
+                        and descriptor in self.folders:
+                    changed.add(os.path.join(self.folders[descriptor],
+                                             os.fsdecode(name)))
+
+    def wait(self, timeout=None):
+        """ Wait for changes.
+
+        A set of the paths of the jars that changed is returned, or None if
+        all the folders must be scanned again. The set is empty if nothing
+        changed within `timeout` seconds.
+
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        # Let a burst of events, like an update of all plugins, settle
+        time.sleep(SETTLE_TIME)
+        changed = self.read_events()
+        if changed is None:
+            try:
+                self.add_watches()
+            except OSError:
+                # The folder is gone, the next scan finds no jars in it
+                pass
+        return changed
+
+    def close(self):
+        """ Stop watching. """
+        os.close(self.fd)
+
+
+def watcher(folders, poll=False, interval=POLL_INTERVAL):
+    """ Return a watcher for `folders`.
+
+    An InotifyWatcher is used if possible, unless `poll` is True, else a
+    PollingWatcher polling every `interval` seconds.
+
+    """
+    if not poll:
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(folders, interval)
+
+
+class State(object):
+
+    """ The installed plugins and server jars, kept in memory. """
+
+    def __init__(self, plugins_folder, servers_folder, v_type='release'):
+        """ Initialize the state.
+
+        Three parameters are accepted:
+            plugins_folder    The folder with the plugins.
+            servers_folder    The folder with the server jars.
+            v_type            The type of versions to compare the installed
+                              plugins with.
+
+        """
+        self.plugins_folder = os.path.normpath(plugins_folder)
+        self.servers_folder = os.path.normpath(servers_folder)
+        self.v_type = v_type
+        self.lock = threading.Lock()
+        # Path to the tuple from parse_installed_plugin
+        self.plugins = dict()
+        # Path to checksum
+        self.servers = dict()
+        # Checksums to a tuple of when the lookup expires, and the plugin dict
+        # from BukGet or the build from SpaceGDN
+        self.found_plugins = dict()
+        self.found_builds = dict()
+        self.updated = None
+
+    def refresh(self, paths=None):
+        """ Read the jars in `paths` again, or all jars if it is None. """
+        if paths is None:
+            paths = set(self.plugins) | set(self.servers)
+            paths.update(list_jars(self.plugins_folder))
+            paths.update(list_jars(self.servers_folder))
+
+        plugin_updates = dict()
+        server_updates = dict()
+        for path in paths:
+            folder = os.path.dirname(path) or '.'
+            if os.path.normpath(folder) == self.plugins_folder:
+                plugin_updates[path] = self.read_plugin(path)
+            if os.path.normpath(folder) == self.servers_folder:
+                server_updates[path] = self.read_server(path)
+        index.save()
+
+        self.look_up(plugin_updates, server_updates)
+
+        with self.lock:
+            for updates, state in ((plugin_updates, self.plugins),
+                                   (server_updates, self.servers)):
+                for path, value in updates.items():
+                    if value is None:
+                        state.pop(path, None)
+                    else:
+                        state[path] = value
+            self.updated = time.time()
+            self.forget_removed()
+
+    def forget_removed(self):
+        """ Forget the lookups of the checksums no jar has any more.
+
+        This must be called with the lock held.
+
+        """
+        checksums = set(record[0] for record in self.plugins.values())
+        for checksum in set(self.found_plugins) - checksums:
+            del self.found_plugins[checksum]
+        checksums = set(self.servers.values())
+        for checksum in set(self.found_builds) - checksums:
+            del self.found_builds[checksum]
+
+    def read_plugin(self, path):
+        """ Return the tuple of the plugin at `path`, or None. """
+        try:
+            return plugins.parse_installed_plugin(path)
+        except plugins.SCAN_ERRORS:
+            return None
+
+    def read_server(self, path):
+        """ Return the checksum of the server jar at `path`, or None. """
+        try:
+            return index.checksum(path)
+        except OSError:
+            return None
+
+    def look_up(self, plugin_updates, server_updates):
+        """ Look up the new and expired checksums on BukGet and SpaceGDN.
+
+        Checksums that are already looked up are skipped until the lookup
+        expires. Failed lookups are retried on the next change.
+
+        """
+        now = time.time()
+        with self.lock:
+            known_plugins = list(self.plugins.values())
+            known_servers = list(self.servers.values())
+
+        records = dict()
+        for record in list(plugin_updates.values()) + known_plugins:
+            if record is not None \
+                    and self.found_plugins.get(record[0], (0,))[0] <= now:
+                records.setdefault(record[0], record)
+        if len(records) > 0:
+            try:
+                found = plugins.lookup_plugin_checksums(records.values())
+            except LOOKUP_ERRORS as error:
+                print('Could not look up plugins: {}'.format(error))
+            else:
+                expires = now + httpcache.ttl('bukget', 'search')
+                for checksum in records:
+                    self.found_plugins[checksum] = (expires,
+                                                    found.get(checksum))
+
+        checksums = set(
+            checksum
+            for checksum in list(server_updates.values()) + known_servers
+            if checksum is not None
+            and self.found_builds.get(checksum, (0,))[0] <= now)
+        if len(checksums) > 0:
+            try:
+                found = servers.builds_by_checksum(checksums)
+            except LOOKUP_ERRORS as error:
+                print('Could not look up servers: {}'.format(error))
+            else:
+                expires = now + httpcache.ttl('spacegdn', 'builds')
+                for checksum in checksums:
+                    self.found_builds[checksum] = (expires,
+                                                   found.get(checksum))
+
+    def next_expiry(self):
+        """ Return when the first lookup expires, or None if none are kept. """
+        expiries = [expires for expires, _ in
+                    list(self.found_plugins.values())
+                    + list(self.found_builds.values())]
+        return min(expiries) if len(expiries) > 0 else None
+
+    def snapshot(self):
+        """ Return the state as a dict which can be serialized to JSON. """
+        with self.lock:
+            installed = sorted(self.plugins.items())
+            jars = sorted(self.servers.items())
+            updated = self.updated
+
+        result = {'updated': updated, 'plugins': list(), 'servers': list()}
+        for path, (md5, main, name, version, _) in installed:
+            entry = {'file': path, 'name': name, 'main': main,
+                     'version': version, 'md5': md5, 'slug': None,
+                     'newest': None, 'outdated': None}
+            plugin = self.found_plugins.get(md5, (0, None))[1]
+            if plugin is not None:
+                entry['slug'] = plugin['slug']
+                newest = utils.select_newest_version(plugin, self.v_type)
+                if newest is not None:
+                    entry['newest'] = newest['version']
+                    entry['outdated'] = newest['version'] > version
+            result['plugins'].append(entry)
+
+        for path, md5 in jars:
+            build = self.found_builds.get(md5, (0, None))[1]
+            result['servers'].append({
+                'file': path, 'md5': md5,
+                'build': build['id'] if build is not None else None})
+        return result
+
+
+class StateHandler(BaseHTTPRequestHandler):
+
+    """ Serves the state of the server it belongs to as JSON.
+
+    The paths are:
+        /           The whole state.
+        /plugins    Only the plugins.
+        /servers    Only the server jars.
+
+    """
+
+    def do_GET(self):
+        """ Serve the state. """
+        state = self.server.state.snapshot()
+        path = self.path.split('?')[0].rstrip('/')
+        if path in ('', '/state'):
+            body = state
+        elif path in ('/plugins', '/servers'):
+            body = state[path[1:]]
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        """ Don't log each request. """
+        pass
+
+
+class StateServer(ThreadingMixIn, HTTPServer):
+
+    """ A threaded HTTP server with the state to serve. """
+
+    daemon_threads = True
+
+    def __init__(self, address, state):
+        """ Serve `state` on the (host, port) `address`. """
+        HTTPServer.__init__(self, address, StateHandler)
+        self.state = state
+
+
+def serve(state, address):
+    """ Serve `state` on `address` in a background thread.
+
+    The server is returned, call shutdown() on it to stop it.
+
+    """
+    server = StateServer(address, state)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def watch(state, watch_for):
+    """ Keep `state` up to date with the changes from `watch_for`.
+
+    This runs until it is interrupted. `watch_for` is a watcher from watcher.
+    When a lookup of `state` expires, the expired lookups are done again,
+    at most once every LOOKUP_RETRY seconds.
+
+    """
+    while True:
+        timeout = None
+        expiry = state.next_expiry()
+        if expiry is not None:
+            timeout = max(expiry - time.time(), LOOKUP_RETRY)
+        changed = watch_for.wait(timeout)
+        if changed is None or len(changed) > 0:
+            state.refresh(changed)
+        elif expiry is not None and expiry <= time.time():
+            state.refresh(set())
@@ -24,6 +24,12 @@ from mcman.commands.plugins import PluginsCommand
 from mcman.commands.servers import ServersCommand
 from mcman.commands.import_cmd import ImportCommand
 from mcman.commands.export import ExportCommand
+from mcman.commands.cache import CacheCommand
+from mcman.commands.catalogue import CatalogueCommand
+from mcman.commands.fleet import FleetCommand
+from mcman.commands.watch import WatchCommand
+from mcman.logic import (cache, common, httpcache, index, mirrors, progress,
+                         ratelimit, transport, watch)
 
 
 def negative(argument):
@@ -50,6 +56,9 @@ def setup_import_command(sub_parsers, parent):
         'destination', default='./', nargs='?',
         help='the destination folder. defaults to ./')
 
+    add_base_url_argument(parser)
+    add_spacegdn_url_argument(parser)
+
     return parser
 
 
@@ -76,6 +85,48 @@ def setup_export_command(sub_parsers, parent):
         '--quiet', action='store_true',
         help="don't print anything other than the result")
 
+    add_base_url_argument(parser)
+    add_spacegdn_url_argument(parser)
+
+    return parser
+
+
+def setup_cache_commands(sub_parsers, parent):
+    """ Setup the commands and subcommands for cache. """
+    # The cache command parser
+    parser = sub_parsers.add_parser(
+        'cache', aliases=['c'],
+        help='manage the download cache',
+        description='Show statistics about, and prune the cache of '
+                    + 'downloaded plugins and server jars, and the cache of '
+                    + 'responses from BukGet and SpaceGDN.',
+        parents=[parent])
+    parser.set_defaults(command=CacheCommand)
+
+    # The cache sub commands
+    sub_parsers = parser.add_subparsers(title='subcommands')
+    # stats, sub command of cache
+    stats_parser = sub_parsers.add_parser(
+        'stats', aliases=['s'],
+        help='show statistics about the cache',
+        description='Show how many files the cache holds, and their size, '
+                    + 'and how often the response cache was hit.',
+        parents=[parent])
+    stats_parser.set_defaults(subcommand='stats')
+    # prune, sub command of cache
+    prune_parser = sub_parsers.add_parser(
+        'prune', aliases=['p'],
+        help='remove the least recently used files',
+        description='Remove the least recently used files until the cache '
+                    + 'fits within the limit, and responses older than a '
+                    + 'week.',
+        parents=[parent])
+    prune_parser.set_defaults(subcommand='prune')
+    prune_parser.add_argument(
+        'to', metavar='size', nargs='?',
+        help='the size to prune to, for example 500M. defaults to the cache '
+             + 'limit')
+
     return parser
 
 
@@ -87,8 +138,10 @@ def setup_server_commands(sub_parsers, parent):
     # Base URL
     sub_parent.add_argument(
         '--base-url', metavar='base-url',
+        type=mirrors.parse_urls,
         default='http://spacegdn.totokaka.io/v1/',
-        help='the base URL to use for SpaceGDN')
+        help='the base URL to use for SpaceGDN. Several mirrors can be '
+             + 'separated by commas, the fastest is used')
 
     # The server command parser
     parser = sub_parsers.add_parser(
@@ -174,35 +227,69 @@ def setup_server_commands(sub_parsers, parent):
     return parser
 
 
-def setup_plugin_commands(sub_parsers, parent):
-    """ Setup the commands and subcommands for plugin. """
-    # The parent parser for plugin and it's sub commands
-    sub_parent = argparse.ArgumentParser(add_help=False, parents=[parent])
-
-    # Base URL
-    sub_parent.add_argument(
+def add_base_url_argument(parser):
+    """ Add the argument for the base URL of BukGet to `parser`. """
+    parser.add_argument(
         '--base-url', default='http://api.bukget.org/3/',
-        help='the base URL to use for BukGet')
-    sub_parent.add_argument(
-        '--server', default='bukkit',
-        help='the server to get plugins for. This is sent to BukGet, '
-             + 'and will affect what plugins you can download')
-    sub_parent.add_argument(
+        type=mirrors.parse_urls,
+        help='the base URL to use for BukGet. Several mirrors can be '
+             + 'separated by commas, the fastest is used')
+
+
+def add_spacegdn_url_argument(parser):
+    """ Add the argument for the base URL of SpaceGDN to `parser`.
+
+    It is for commands which use both BukGet and SpaceGDN, so --base-url is
+    the one of BukGet.
+
+    """
+    parser.add_argument(
+        '--spacegdn-url', metavar='base-url',
+        type=mirrors.parse_urls,
+        default='http://spacegdn.totokaka.io/v1/',
+        help='the base URL to use for SpaceGDN. Several mirrors can be '
+             + 'separated by commas, the fastest is used')
+
+
+def add_bukget_arguments(parser):
+    """ Add the arguments for BukGet and plugin versions to `parser`. """
+    add_base_url_argument(parser)
+    parser.add_argument(
+        '--offline', action='store_true',
+        help='answer the queries about plugins from the local catalogue, '
+             + 'instead of asking BukGet. see `mcman catalogue sync`')
+    parser.add_argument(
         '--beta', action='store_const', dest='version', const='beta',
         help="find latest beta version, instead of latest release for "
              + "plugins where a version isn't specified.")
-    sub_parent.add_argument(
+    parser.add_argument(
         '--alpha', action='store_const', dest='version', const='alpha',
         help="find latest alpha version, instead of latest release for "
              + "plugins where a version isn't specified.")
-    sub_parent.add_argument(
+    parser.add_argument(
         '--latest', action='store_const', dest='version', const='latest',
         help="find latest version, no matter type, instead of latest release "
              + "for plugins where a version isn't specified.")
+    parser.set_defaults(version='release')
+
+
+def setup_plugin_commands(sub_parsers, parent):
+    """ Setup the commands and subcommands for plugin. """
+    # The parent parser for plugin and it's sub commands
+    sub_parent = argparse.ArgumentParser(add_help=False, parents=[parent])
+
+    add_bukget_arguments(sub_parent)
+    sub_parent.add_argument(
+        '--server', default='bukkit',
+        help='the server to get plugins for. This is sent to BukGet, '
+             + 'and will affect what plugins you can download')
     sub_parent.add_argument(
         '--no-resolve-dependencies', action='store_false',
         dest='resolve_dependencies', help='do not resolve dependencies')
-    sub_parent.set_defaults(version='release')
+    sub_parent.add_argument(
+        '-j', '--jobs', metavar='N', type=int, default=common.DEFAULT_JOBS,
+        help='how many plugins to download at once. defaults to {}'
+             .format(common.DEFAULT_JOBS))
 
     # The plugin command parser
     parser = sub_parsers.add_parser(
@@ -272,6 +359,114 @@ def setup_plugin_commands(sub_parsers, parent):
     return parser
 
 
+def setup_watch_command(sub_parsers, parent):
+    """ Setup the command for watch. """
+    # The watch command parser
+    parser = sub_parsers.add_parser(
+        'watch', aliases=['w'],
+        help='watch the server, and serve what is installed',
+        description='Watch the plugins and server jars for changes, and '
+                    + 'serve what is installed, and what is outdated, as '
+                    + 'JSON over HTTP.',
+        parents=[parent])
+    parser.set_defaults(command=WatchCommand)
+
+    add_bukget_arguments(parser)
+    add_spacegdn_url_argument(parser)
+    parser.add_argument(
+        '--host', default='127.0.0.1',
+        help='the address to serve on. defaults to 127.0.0.1')
+    parser.add_argument(
+        '--port', type=int, default=8765,
+        help='the port to serve on. defaults to 8765')
+    parser.add_argument(
+        '--poll', action='store_true',
+        help='poll the folders for changes, instead of using inotify')
+    parser.add_argument(
+        '--interval', metavar='seconds', type=float,
+        default=watch.POLL_INTERVAL,
+        help='the seconds between each poll. defaults to {}'
+             .format(watch.POLL_INTERVAL))
+
+    return parser
+
+
+def setup_fleet_commands(sub_parsers, parent):
+    """ Setup the commands and subcommands for fleet. """
+    # The parent parser for fleet and it's sub commands
+    sub_parent = argparse.ArgumentParser(add_help=False, parents=[parent])
+
+    add_bukget_arguments(sub_parent)
+    sub_parent.add_argument(
+        '-j', '--jobs', metavar='N', type=int, default=common.DEFAULT_JOBS,
+        help='how many servers to scan at once. defaults to {}'
+             .format(common.DEFAULT_JOBS))
+
+    # The fleet command parser
+    parser = sub_parsers.add_parser(
+        'fleet', aliases=['f'],
+        help='manage the plugins of several servers',
+        description='Scan the plugins of several servers on this host at '
+                    + 'once.',
+        parents=[sub_parent])
+    parser.set_defaults(command=FleetCommand)
+
+    # The fleet sub commands
+    sub_parsers = parser.add_subparsers(title='subcommands')
+    # scan, sub command of fleet
+    scan_parser = sub_parsers.add_parser(
+        'scan', aliases=['s'],
+        help='find outdated plugins on several servers',
+        description='Scan the plugins of all the servers, look up each '
+                    + 'distinct jar on BukGet once, and list the outdated '
+                    + 'plugins and the servers they are on.',
+        parents=[sub_parent])
+    scan_parser.set_defaults(subcommand='scan')
+    scan_parser.add_argument(
+        'roots', metavar='folder', nargs='+',
+        help='the folders of the servers')
+
+    return parser
+
+
+def setup_catalogue_commands(sub_parsers, parent):
+    """ Setup the commands and subcommands for catalogue. """
+    # The catalogue command parser
+    parser = sub_parsers.add_parser(
+        'catalogue', aliases=['cat'],
+        help='manage the local catalogue of plugins',
+        description='Keep a local copy of the plugin metadata on BukGet, so '
+                    + 'the plugin commands work with --offline.',
+        parents=[parent])
+    parser.set_defaults(command=CatalogueCommand)
+
+    # The catalogue sub commands
+    sub_parsers = parser.add_subparsers(title='subcommands')
+    # sync, sub command of catalogue
+    sync_parser = sub_parsers.add_parser(
+        'sync', aliases=['s'],
+        help='update the catalogue from BukGet',
+        description='Fetch the plugins updated since the last sync from '
+                    + 'BukGet, and store them in the catalogue.',
+        parents=[parent])
+    sync_parser.set_defaults(subcommand='sync')
+    add_base_url_argument(sync_parser)
+    sync_parser.add_argument(
+        '--full', action='store_true',
+        help='fetch all plugins, and remove the ones that are gone from '
+             + 'BukGet')
+    # status, sub command of catalogue
+    status_parser = sub_parsers.add_parser(
+        'status', aliases=['st'],
+        help='show how many plugins the catalogue has',
+        description='Show how many plugins the catalogue has, and the date '
+                    + 'of the newest version.',
+        parents=[parent])
+    status_parser.set_defaults(subcommand='status')
+
+    return parser
+
+
 def setup_parse_command():
     """ Setup commands, and parse them. """
     # Parent parser
@@ -312,6 +507,87 @@ def setup_parse_command():
         '--no-confirm',
         action='store_true',
         help='do not wait for confirmation, just continue')
+    parent.add_argument(
+        '--progress',
+        choices=progress.MODES,
+        default='auto',
+        help='how to show the progress of downloads, checksums and unzips. '
+             + '"json" writes one JSON object per event to stderr. defaults '
+             + 'to "tty" in a terminal, else "plain"')
+    parent.add_argument(
+        '--limit-rate',
+        metavar='size',
+        type=common.parse_size,
+        default=0,
+        help='the total download rate limit per second, shared by all '
+             + 'downloads, for example 20M. defaults to no limit')
+    parent.add_argument(
+        '--limit-rate-per-host',
+        metavar='size',
+        type=common.parse_size,
+        default=0,
+        help='the download rate limit per second for each host. defaults '
+             + 'to no limit')
+    parent.add_argument(
+        '--connect-timeout',
+        metavar='seconds',
+        type=float,
+        default=transport.CONNECT_TIMEOUT,
+        help='how long to wait for a connection to a server. defaults to '
+             + '{}'.format(transport.CONNECT_TIMEOUT))
+    parent.add_argument(
+        '--read-timeout',
+        metavar='seconds',
+        type=float,
+        default=transport.READ_TIMEOUT,
+        help='how long to wait for data from a server. defaults to '
+             + '{}'.format(transport.READ_TIMEOUT))
+    parent.add_argument(
+        '--deadline',
+        metavar='seconds',
+        type=float,
+        help='give up on requests after this many seconds of the command. '
+             + 'defaults to no deadline')
+    parent.add_argument(
+        '--scan-workers',
+        metavar='workers',
+        type=int,
+        help='how many workers hash and parse the installed plugins. '
+             + 'defaults to one per 8 jars, up to the amount of CPUs')
+    parent.add_argument(
+        '--rescan',
+        action='store_true',
+        help='hash and parse all installed jars again, instead of using the '
+             + 'results saved in the index')
+    parent.add_argument(
+        '--no-cache',
+        action='store_false',
+        dest='response_cache',
+        help='always ask BukGet and SpaceGDN, instead of using the cached '
+             + 'responses')
+    parent.add_argument(
+        '--refresh',
+        action='store_true',
+        help='revalidate the cached responses from BukGet and SpaceGDN, '
+             + 'even if they are fresh')
+    parent.add_argument(
+        '--cache-dir',
+        metavar='folder',
+        help='the folder to cache downloaded files in. defaults to {}'
+             .format(cache.default_folder()))
+    parent.add_argument(
+        '--cache-limit',
+        metavar='size',
+        type=common.parse_size,
+        default=cache.DEFAULT_LIMIT,
+        help='the size limit of the download cache, for example 500M. '
+             + '0 disables the cache. defaults to 1G')
+    parent.add_argument(
+        '--no-hardlinks',
+        action='store_false',
+        dest='hardlinks',
+        help='copy files to and from the download cache instead of hard '
+             + 'linking them')
 
     # The top level command
     parser = argparse.ArgumentParser(
@@ -322,18 +598,27 @@ def setup_parse_command():
     # The sub commands, plugin and server
     sub_parsers = parser.add_subparsers(title='subcommands')
 
-    server_parser = setup_server_commands(sub_parsers, parent)
-    plugin_parser = setup_plugin_commands(sub_parsers, parent)
+    # The commands with sub commands, and their parsers
+    command_parsers = dict()
+    command_parsers[ServersCommand] = setup_server_commands(sub_parsers,
+                                                            parent)
+    command_parsers[PluginsCommand] = setup_plugin_commands(sub_parsers,
+                                                            parent)
+    command_parsers[CacheCommand] = setup_cache_commands(sub_parsers, parent)
+    command_parsers[FleetCommand] = setup_fleet_commands(sub_parsers, parent)
+    command_parsers[CatalogueCommand] = setup_catalogue_commands(sub_parsers,
+                                                                 parent)
 
     setup_import_command(sub_parsers, parent)
     setup_export_command(sub_parsers, parent)
+    setup_watch_command(sub_parsers, parent)
 
-    return server_parser, plugin_parser, parser
+    return command_parsers, parser
 
 
 def main():
     """ Main function. """
-    server_parser, plugin_parser, parser = setup_parse_command()
+    command_parsers, parser = setup_parse_command()
 
     args = parser.parse_args()
 
@@ -341,18 +626,27 @@ def main():
         print('Version: {}'.format(mcman.__version__))
     elif 'command' not in args:
         parser.print_help()
-    elif 'subcommand' not in args and not (args.command == ExportCommand
-                                           or args.command == ImportCommand):
-        if args.command is PluginsCommand:
-            plugin_parser.print_help()
-        elif args.command is ServersCommand:
-            server_parser.print_help()
+    elif 'subcommand' not in args and args.command in command_parsers:
+        command_parsers[args.command].print_help()
     else:
         if 'ignored' in args and args.ignored is None:
             args.ignored = []
 
+        cache.init(args.cache_dir, args.cache_limit, args.hardlinks)
+        progress.init(args.progress, common.get_term_width())
+        ratelimit.init(args.limit_rate, args.limit_rate_per_host)
+        transport.init(args.connect_timeout, args.read_timeout,
+                       args.deadline)
+        index.init(args.rescan)
+        httpcache.init(args.response_cache, args.refresh)
+
         try:
             args.command(args)
         except KeyboardInterrupt:
             print()
             return
+        except transport.DeadlineExceeded as error:
+            print('Error: {}'.format(error))
+            sys.exit(1)
+        finally:
+            httpcache.save_totals()
@@ -37,6 +37,7 @@ setup(
     packages=['mcman', 'mcman.commands', 'mcman.logic',
               'mcman.logic.plugins'],
     scripts=["bin/mcman"],
+    python_requires='>=3.5',
     install_requires=['PyYAML>=3.10',
                       'pyBukGet>=2.3',
                       'pySpaceGDN>=0.2'],
@@ -50,8 +51,7 @@ setup(
         'Operating System :: Unix',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.5',
         'Topic :: System :: Systems Administration',
         'Topic :: Utilities',
     ],
@@ -0,0 +1,67 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.aio. """
+import asyncio
+import threading
+import types
+from unittest import TestCase
+
+from mcman.logic import aio
+
+
+class TestClient(TestCase):
+
+    """ Tests for aio.Client and aio.run. """
+
+    def test_gather(self):
+        """ Test that gathered queries are sent at the same time. """
+        barrier = threading.Barrier(3, timeout=5)
+
+        def search(value, size=None):
+            barrier.wait()
+            return [value] * size
+
+        client = aio.Client(types.SimpleNamespace(search=search))
+
+        async def main():
+            return await asyncio.gather(*[client.search(n, size=2)
+                                          for n in range(3)])
+
+        self.assertEqual(aio.run(main()), [[0, 0], [1, 1], [2, 2]])
+
+    def test_attributes(self):
+        """ Test that other attributes are passed through. """
+        client = aio.Client(types.SimpleNamespace(BASE='http://api/'))
+        self.assertEqual(client.BASE, 'http://api/')
+
+    def test_errors(self):
+        """ Test that errors are raised from run. """
+        def broken():
+            raise ValueError('Broken')
+
+        client = aio.Client(types.SimpleNamespace(broken=broken))
+        with self.assertRaises(ValueError):
+            aio.run(client.broken())
+
+    def test_shared_executor(self):
+        """ Test that the calls share the threads of one executor. """
+        client = aio.Client(types.SimpleNamespace(
+            thread=threading.current_thread))
+
+        threads = {aio.run(client.thread()) for _ in range(20)}
+        self.assertLessEqual(len(threads), aio.MAX_WORKERS)
+        self.assertIs(aio.executor(), aio.executor())
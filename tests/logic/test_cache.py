@@ -0,0 +1,152 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.cache. """
+from mcman.logic import cache, index
+from unittest import TestCase
+import hashlib
+import os
+import shutil
+
+
+class TestCache(TestCase):
+
+    """ Test the download cache. """
+
+    def setUp(self):
+        """ Set up. """
+        self.folder = '/tmp/test_cache/'
+        os.makedirs(self.folder)
+        cache.init(self.folder + 'blobs', 100)
+
+    def tearDown(self):
+        """ Tear down. """
+        cache.init(None, 0)
+        shutil.rmtree(self.folder)
+
+    def make_file(self, name, size):
+        """ Create a file with random content, and return it's checksum. """
+        content = os.urandom(size)
+        with open(self.folder + name, 'wb') as file:
+            file.write(content)
+        return hashlib.md5(content).hexdigest()
+
+    def test_store_install(self):
+        """ Test storing a file, and installing it again. """
+        checksum = self.make_file('first.jar', 10)
+        cache.store(self.folder + 'first.jar', checksum)
+        assert cache.lookup(checksum) is not None
+
+        assert cache.install(checksum, self.folder + 'second.jar')
+        with open(self.folder + 'second.jar', 'rb') as file:
+            assert hashlib.md5(file.read()).hexdigest() == checksum
+
+    def test_hard_links(self):
+        """ Test that installed files share the blob when linking. """
+        checksum = self.make_file('first.jar', 10)
+        cache.store(self.folder + 'first.jar', checksum)
+        cache.install(checksum, self.folder + 'second.jar')
+        blob = os.stat(cache.blob_path(checksum))
+        assert os.stat(self.folder + 'first.jar').st_ino == blob.st_ino
+        assert os.stat(self.folder + 'second.jar').st_ino == blob.st_ino
+
+    def test_copies(self):
+        """ Test that files are copied when linking is disabled. """
+        cache.init(self.folder + 'blobs', 100, link=False)
+        checksum = self.make_file('first.jar', 10)
+        cache.store(self.folder + 'first.jar', checksum)
+        cache.install(checksum, self.folder + 'second.jar')
+        blob = os.stat(cache.blob_path(checksum))
+        assert os.stat(self.folder + 'second.jar').st_ino != blob.st_ino
+
+    def test_miss(self):
+        """ Test installing a file that is not cached. """
+        assert not cache.install('0' * 32, self.folder + 'missing.jar')
+        assert not os.path.exists(self.folder + 'missing.jar')
+
+    def test_invalid_checksum(self):
+        """ Test that checksums that aren't MD5 are not used as paths. """
+        assert cache.blob_path('../../etc/passwd') is None
+        assert cache.lookup('../../etc/passwd') is None
+
+    def test_lru_eviction(self):
+        """ Test that the least recently used files are removed first. """
+        first = self.make_file('first.jar', 40)
+        second = self.make_file('second.jar', 40)
+        cache.store(self.folder + 'first.jar', first)
+        cache.store(self.folder + 'second.jar', second)
+        os.utime(cache.blob_path(first) + cache.USED_SUFFIX, (1, 1))
+        os.utime(cache.blob_path(second) + cache.USED_SUFFIX, (2, 2))
+
+        # Use the first, so the second is the least recently used
+        cache.lookup(first)
+        third = self.make_file('third.jar', 40)
+        cache.store(self.folder + 'third.jar', third)
+
+        assert cache.lookup(first) is not None
+        assert cache.lookup(second) is None
+        assert cache.lookup(third) is not None
+        assert cache.stats() == (2, 80)
+
+    def test_linked_fingerprint(self):
+        """ Test that using a blob does not change it's installed links. """
+        cache.init(self.folder + 'blobs', 100, link=True)
+        checksum = self.make_file('first.jar', 10)
+        cache.store(self.folder + 'first.jar', checksum)
+        before = index.fingerprint(self.folder + 'first.jar')
+
+        os.utime(cache.blob_path(checksum) + cache.USED_SUFFIX, (1, 1))
+        assert cache.install(checksum, self.folder + 'second.jar')
+        assert index.fingerprint(self.folder + 'first.jar') == before
+        assert cache.blobs()[0][0] > 1
+
+    def test_links_writable(self):
+        """ Test that storing a file does not change it's permissions. """
+        cache.init(self.folder + 'blobs', 100, link=True)
+        checksum = self.make_file('first.jar', 10)
+        os.chmod(self.folder + 'first.jar', 0o644)
+        cache.store(self.folder + 'first.jar', checksum)
+        assert os.stat(self.folder + 'first.jar').st_mode & 0o777 == 0o644
+
+    def test_corrupted(self):
+        """ Test that a blob which was changed is not installed. """
+        cache.init(self.folder + 'blobs', 100, link=True)
+        checksum = self.make_file('first.jar', 10)
+        cache.store(self.folder + 'first.jar', checksum)
+        with open(self.folder + 'first.jar', 'r+b') as file:
+            file.write(b'changed')
+
+        assert not cache.install(checksum, self.folder + 'second.jar')
+        assert not os.path.exists(self.folder + 'second.jar')
+        assert cache.lookup(checksum) is None
+        assert cache.stats() == (0, 0)
+
+    def test_prune(self):
+        """ Test pruning the cache to a given size. """
+        cache.store(self.folder + 'first.jar',
+                    self.make_file('first.jar', 40))
+        cache.store(self.folder + 'second.jar',
+                    self.make_file('second.jar', 40))
+        assert cache.prune(50) == (1, 40)
+        assert cache.stats() == (1, 40)
+
+    def test_disabled(self):
+        """ Test that nothing is cached when the cache is disabled. """
+        cache.init(self.folder + 'blobs', 0)
+        checksum = self.make_file('first.jar', 10)
+        cache.store(self.folder + 'first.jar', checksum)
+        assert cache.lookup(checksum) is None
+        assert cache.stats() == (0, 0)
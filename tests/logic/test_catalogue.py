@@ -0,0 +1,156 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.plugins.catalogue. """
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from urllib.error import URLError
+
+from mcman.logic.plugins import catalogue, plugins
+
+PLUGINS = [{
+    'slug': 'worldedit',
+    'plugin_name': 'WorldEdit',
+    'main': 'com.sk89q.worldedit.bukkit.WorldEditPlugin',
+    'server': 'bukkit',
+    'popularity': {'monthly': 100},
+    'versions': [{'version': '6.0', 'type': 'Release', 'md5': 'a' * 32,
+                  'date': 200},
+                 {'version': '5.9', 'type': 'Release', 'md5': 'b' * 32,
+                  'date': 100}],
+}, {
+    'slug': 'worldguard',
+    'plugin_name': 'WorldGuard',
+    'main': 'com.sk89q.worldguard.bukkit.WorldGuardPlugin',
+    'server': 'bukkit',
+    'popularity': {'monthly': 50},
+    'versions': [{'version': '6.0', 'type': 'Release', 'md5': 'c' * 32,
+                  'date': 150, 'hard_dependencies': ['WorldEdit']}],
+}, {
+    'slug': 'essentials',
+    'plugin_name': 'Essentials',
+    'main': 'com.earth2me.essentials.Essentials',
+    'server': 'bukkit',
+    'popularity': {'monthly': 500},
+    'versions': [{'version': '2.13', 'type': 'Release', 'md5': 'd' * 32,
+                  'date': 50}],
+}]
+for plugin in PLUGINS:
+    for version in plugin['versions']:
+        version.setdefault('hard_dependencies', [])
+
+
+def fake_bukget_search(query, fields, sort, start, size):
+    """ Page through PLUGINS with versions newer than the query. """
+    found = [plugin for plugin in PLUGINS
+             if any(version['date'] > query['value']
+                    for version in plugin['versions'])]
+    found.sort(key=lambda plugin: plugin['slug'])
+    return found[start:start + size]
+
+
+class TestCatalogue(TestCase):
+
+    """ Tests for the catalogue. """
+
+    def setUp(self):
+        """ Store the catalogue in a temporary folder, and sync it. """
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        path = os.path.join(self.folder.name, 'catalogue.sqlite')
+        patcher = patch('mcman.logic.plugins.catalogue.CATALOGUE_FILE', path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with patch('bukget.search', side_effect=fake_bukget_search):
+            self.assertEqual(catalogue.sync(page_size=2), (3, 3))
+
+    def test_incremental(self):
+        """ Test that a sync only asks for plugins with new versions. """
+        with patch('bukget.search', return_value=[]) as search:
+            self.assertEqual(catalogue.sync(), (0, 3))
+        self.assertEqual(search.call_args[0][0]['value'], 200)
+        self.assertEqual(catalogue.status(), (3, 200))
+
+    @patch('mcman.logic.transport.backoff')
+    def test_retried(self, backoff):
+        """ Test that a page which fails is asked for again. """
+        with patch('bukget.search',
+                   side_effect=[URLError('Down'), []]) as search:
+            self.assertEqual(catalogue.sync(), (0, 3))
+        self.assertEqual(search.call_count, 2)
+
+    def test_full(self):
+        """ Test that a full sync removes plugins gone from BukGet. """
+        with patch('bukget.search', return_value=PLUGINS[:1]) as search:
+            self.assertEqual(catalogue.sync(full=True), (1, 1))
+        self.assertEqual(search.call_args[0][0]['value'], 0)
+        self.assertEqual(catalogue.search({'field': 'versions.checksum',
+                                           'action': 'in',
+                                           'value': ['c' * 32]}), [])
+
+    def test_filters(self):
+        """ Test the in, like and = actions. """
+        def slugs(*filters):
+            return sorted(plugin['slug']
+                          for plugin in catalogue.search(*filters))
+
+        self.assertEqual(slugs({'field': 'versions.checksum', 'action': 'in',
+                                'value': ['b' * 32, 'd' * 32]}),
+                         ['essentials', 'worldedit'])
+        self.assertEqual(slugs({'field': 'plugin_name', 'action': 'like',
+                                'value': 'world'}),
+                         ['worldedit', 'worldguard'])
+        self.assertEqual(slugs({'field': 'plugin_name', 'action': 'in',
+                                'value': ['worldguard']}), ['worldguard'])
+        self.assertEqual(slugs({'field': 'main', 'action': '=',
+                                'value': PLUGINS[2]['main']}),
+                         ['essentials'])
+        with self.assertRaises(ValueError):
+            slugs({'field': 'description', 'action': 'like', 'value': 'x'})
+
+    def test_fields_and_sort(self):
+        """ Test that only the fields asked for are returned, sorted. """
+        results = catalogue.search(
+            {'field': 'plugin_name', 'action': 'like', 'value': 'e'},
+            fields='slug,versions.version', sort='-popularity.monthly',
+            size=2)
+        self.assertEqual(results, [
+            {'slug': 'essentials', 'versions': [{'version': '2.13'}]},
+            {'slug': 'worldedit', 'versions': [{'version': '6.0'},
+                                               {'version': '5.9'}]},
+        ])
+
+    def test_details(self):
+        """ Test find_by_name and plugin_details. """
+        self.assertEqual(catalogue.find_by_name('bukkit', 'worldedit'),
+                         'worldedit')
+        self.assertIsNone(catalogue.find_by_name('bukkit', 'missing'))
+        details = catalogue.plugin_details('bukkit', 'worldedit', '5.9',
+                                           fields='versions.md5')
+        self.assertEqual(details, {'versions': [{'md5': 'b' * 32}]})
+
+    def test_offline(self):
+        """ Test that the plugins module asks the catalogue when offline. """
+        plugins.init(None, None, offline=True)
+        self.addCleanup(plugins.init, None, None)
+        with patch('bukget.search') as search:
+            found = plugins.dependencies('bukkit', 'WorldGuard')
+        search.assert_not_called()
+        self.assertEqual(sorted(plugin['slug'] for plugin in found),
+                         ['worldedit', 'worldguard'])
@@ -15,11 +15,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """ Tests for mcman.backend.common. """
-from mcman.logic import common
+from mcman.logic import cache, common, progress, transport
 from unittest.mock import MagicMock, patch
 from unittest import TestCase
 from zipfile import ZipFile
+from io import BytesIO
+from urllib.error import ContentTooShortError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import hashlib
 import os
+import threading
 import shutil
 
 
@@ -45,6 +50,26 @@ class TestChecksumFile(TestCase):
         md5 = common.checksum_file(self.path)
         assert md5 == self.md5
 
+    def test_multiple_chunks(self):
+        """ Test with a file larger than one chunk. """
+        content = os.urandom(common.CHUNK_SIZE * 2 + 1)
+        md5 = common.checksum_file(BytesIO(content))
+        assert md5 == hashlib.md5(content).hexdigest()
+
+
+def test_digest_file():
+    """ Test that common.digest_file reads the file once for all digests. """
+    content = os.urandom(common.CHUNK_SIZE * 2 + 1)
+    file = BytesIO(content)
+    task = MagicMock()
+    with patch.object(file, 'read', wraps=file.read) as read:
+        digests = common.digest_file(file, ('md5', 'sha1', 'sha256'), task)
+    assert digests == {name: hashlib.new(name, content).hexdigest()
+                       for name in ('md5', 'sha1', 'sha256')}
+    assert read.call_count == 4
+    assert sum(call[0][0] for call in task.advance.call_args_list) == \
+        len(content)
+
 
 class TestExctractFile(TestCase):
 
@@ -83,6 +108,15 @@ class TestExctractFile(TestCase):
         with open(self.test_folder + 'herp/bar/baz.txt', 'r') as file:
             assert file.readline() == 'baz\n'
 
+    def test_extract_zip_info(self):
+        """ Test common.extract_file with a ZipInfo. """
+        info = self.zipfile.getinfo('herp/derp.txt')
+        common.extract_file(self.zipfile, info,
+                            self.test_folder + 'herp/derp.txt')
+        with open(self.test_folder + 'herp/derp.txt', 'r') as file:
+            assert file.readline() == 'derp\n'
+        assert not os.path.exists(self.test_folder + 'herp/derp.txt.part')
+
     def test_extract_sub_folder(self):
         """ Test common.extract_file with folder in subfolder. """
         common.extract_file(self.zipfile, 'herp/bar/',
@@ -98,62 +132,47 @@ class TestDownload(TestCase):
     def setUp(self):
         self.url = 'http://herp.derp.foo/bar.baz'
         self.filename = 'bar.baz'
-        self.reporthook = 42
+        self.task = MagicMock()
         self.prefix = 'Prefix'
         self.removed = False
         self.checksum = 'HerpDerpFooBarBaz'
         self.display_name = 'Displayed'
 
-        @patch('mcman.logic.common.checksum_file', self.fake_checksum_file)
-        @patch('mcman.logic.common.create_progress_bar',
-               self.fake_create_progressbar)
-        @patch('mcman.logic.common.get_term_width',
-               MagicMock(return_value=80))
-        @patch('builtins.print', self.fake_print)
-        @patch('mcman.logic.common.urlretrieve', self.fake_urlretrieve)
-        @patch('os.remove', self.fake_remove)
+        @patch('mcman.logic.progress.start', self.fake_start)
+        @patch('mcman.logic.common.retrieve', self.fake_retrieve)
         def test(checksum, destination=self.filename, prefix=self.prefix,
                  display_name=self.display_name):
-            common.download(self.url, destination=destination,
-                            checksum=checksum, prefix=prefix,
-                            display_name=display_name)
+            return common.download(self.url, destination=destination,
+                                   checksum=checksum, prefix=prefix,
+                                   display_name=display_name)
 
         self.test = test
 
-    def fake_urlretrieve(self, url, filename=None, reporthook=None):
+    def fake_retrieve(self, url, destination, reporthook=None,
+                      checksum=None):
         assert url == self.url
-        assert filename == self.filename
-        assert reporthook == self.reporthook
-
-    def fake_checksum_file(self, file):
+        assert destination == self.filename
+        assert reporthook == self.task.reporthook
+        if checksum != self.checksum:
+            self.removed = True
         return self.checksum
 
-    def fake_create_progressbar(self, prefix=None, width=80):
-        assert self.prefix + self.display_name == prefix
-        return self.reporthook
-
-    def fake_print(self, *value, sep=' ', end='\n'):
-        value = [str(v) for v in value]
-        sep = str(sep)
-        end = str(end)
-        if hasattr(self, 'line'):
-            if not self.line.endswith('\n'):
-                self.line += sep.join(value) + end
-                return
-        self.line = sep.join(value) + end
-
-    def fake_remove(self, file):
-        self.removed = True
+    def fake_start(self, kind, name, total=-1):
+        assert kind == 'download'
+        assert self.prefix + self.display_name == name
+        return self.task
 
     def test_download_success(self):
         """ Test common.download with successful checksum. """
-        self.test(self.checksum)
-        assert self.line.endswith('Success\n')
+        assert self.test(self.checksum)
+        self.task.finish.assert_called_once_with(True, None)
 
     def test_download_fail(self):
         """ Test common.download with unsuccessful checksum. """
-        self.test('SomethingFalse')
+        assert not self.test('SomethingFalse')
         assert self.removed
+        self.task.finish.assert_called_once_with(False,
+                                                 common.CHECKSUM_MISMATCH)
 
     def test_download_no_displayname(self):
         """ Test common.download without a display_name. """
@@ -167,6 +186,237 @@ class TestDownload(TestCase):
         self.test(self.checksum, destination=None, display_name=None)
 
 
+class FakeResponse(BytesIO):
+
+    """ A fake response from urlopen. """
+
+    def __init__(self, content, length=None):
+        BytesIO.__init__(self, content)
+        if length is None:
+            length = len(content)
+        self.status = 200
+        self.headers = {'Content-Length': str(length)}
+
+
+class TestRetrieve(TestCase):
+
+    """ Test common.retrieve. """
+
+    def setUp(self):
+        self.destination = '/tmp/test_retrieve.bin'
+        self.content = os.urandom(common.CHUNK_SIZE * 3 + 42)
+        self.calls = list()
+
+    def tearDown(self):
+        if os.path.exists(self.destination):
+            os.remove(self.destination)
+        common.remove_part(self.destination + '.part')
+
+    def reporthook(self, count, blocksize, totalsize):
+        self.calls.append((count, blocksize, totalsize))
+
+    def test_retrieve(self):
+        """ Test that the file is written and checksummed. """
+        response = FakeResponse(self.content)
+        with patch('mcman.logic.transport.open',
+                   MagicMock(return_value=response)):
+            checksum = common.retrieve('http://herp/derp', self.destination,
+                                       self.reporthook)
+        assert checksum == hashlib.md5(self.content).hexdigest()
+        with open(self.destination, 'rb') as file:
+            assert file.read() == self.content
+        assert len(self.calls) == 5
+        assert self.calls[-1] == (len(self.content), 1, len(self.content))
+        assert not os.path.exists(self.destination + '.part')
+
+    def test_retrieve_wrong_checksum(self):
+        """ Test that a file with the wrong checksum isn't moved into place.
+        """
+        with open(self.destination, 'wb') as file:
+            file.write(b'The old file')
+        response = FakeResponse(self.content)
+        with patch('mcman.logic.transport.open',
+                   MagicMock(return_value=response)):
+            checksum = common.retrieve('http://herp/derp', self.destination,
+                                       checksum='0' * 32)
+        assert checksum == hashlib.md5(self.content).hexdigest()
+        with open(self.destination, 'rb') as file:
+            assert file.read() == b'The old file'
+        assert not os.path.exists(self.destination + '.part')
+
+    def test_retrieve_too_short(self):
+        """ Test that a truncated download raises an exception. """
+        response = FakeResponse(self.content, len(self.content) + 1)
+        with patch('mcman.logic.transport.open',
+                   MagicMock(return_value=response)):
+            self.assertRaises(ContentTooShortError, common.retrieve,
+                              'http://herp/derp', self.destination,
+                              retries=1)
+        assert os.path.exists(self.destination + '.part')
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+
+    """ A HTTP handler that cuts the connection in the middle of the file.
+
+    The handler supports Range and If-Range requests. The content, ETag and
+    how many requests to cut is set on the server.
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        content = server.content
+        start = 0
+        status = 200
+
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header is not None \
+                and (if_range is None or if_range == server.etag):
+            start = int(range_header.split('=')[1].split('-')[0])
+            status = 206
+
+        self.send_response(status)
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(content) - start))
+        if status == 206:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(content) - 1, len(content)))
+        self.end_headers()
+
+        if server.cuts > 0:
+            server.cuts -= 1
+            middle = start + (len(content) - start) // 2
+            self.wfile.write(content[start:middle])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(content[start:])
+
+
+class TestResume(TestCase):
+
+    """ Test resuming of downloads with common.retrieve. """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        self.server.content = os.urandom(common.CHUNK_SIZE * 4)
+        self.server.etag = '"first"'
+        self.server.cuts = 1
+        self.server.requests = list()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.url = 'http://127.0.0.1:{}/server.jar'.format(
+            self.server.server_address[1])
+        self.destination = '/tmp/test_resume.jar'
+        self.md5 = hashlib.md5(self.server.content).hexdigest()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        transport.close_all()
+        if os.path.exists(self.destination):
+            os.remove(self.destination)
+        common.remove_part(self.destination + '.part')
+
+    def test_resume_after_cut(self):
+        """ Test that a cut download is continued with a Range request. """
+        checksum = common.retrieve(self.url, self.destination)
+        assert checksum == self.md5
+        with open(self.destination, 'rb') as file:
+            assert file.read() == self.server.content
+
+        assert len(self.server.requests) == 2
+        middle = len(self.server.content) // 2
+        assert self.server.requests[1]['Range'] == 'bytes={}-'.format(middle)
+        assert self.server.requests[1]['If-Range'] == '"first"'
+        assert not os.path.exists(self.destination + '.part')
+
+    def test_resume_next_run(self):
+        """ Test that the .part file is continued by the next download. """
+        self.server.cuts = 3
+        self.assertRaises(Exception, common.retrieve, self.url,
+                          self.destination, retries=3)
+        assert os.path.exists(self.destination + '.part')
+
+        self.server.cuts = 0
+        checksum = common.retrieve(self.url, self.destination)
+        assert checksum == self.md5
+        assert 'Range' in self.server.requests[-1]
+
+    def test_changed_remote_file(self):
+        """ Test that a changed remote file is downloaded from the start. """
+        self.assertRaises(Exception, common.retrieve, self.url,
+                          self.destination, retries=1)
+
+        self.server.content = os.urandom(common.CHUNK_SIZE * 4)
+        self.server.etag = '"second"'
+        checksum = common.retrieve(self.url, self.destination)
+        assert checksum == hashlib.md5(self.server.content).hexdigest()
+        with open(self.destination, 'rb') as file:
+            assert file.read() == self.server.content
+
+
+class TestDownloadMany(TestCase):
+
+    """ Test common.download_many. """
+
+    def setUp(self):
+        self.sizes = {'small': 10, 'large': 1000, 'medium': 100}
+        self.started = list()
+
+    def function(self, name, result):
+        def download(task):
+            self.started.append(name)
+            task.reporthook(1, 50, 100)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return download
+
+    def run_downloads(self, downloads, jobs):
+        with patch('mcman.logic.progress._RENDERER', progress.Renderer()):
+            return common.download_many(downloads, jobs)
+
+    def test_largest_first(self):
+        """ Test that the largest files are downloaded first. """
+        downloads = [(name, self.sizes[name], self.function(name, True))
+                     for name in ('small', 'large', 'medium')]
+        results = self.run_downloads(downloads, 1)
+        assert results == [True, True, True]
+        assert self.started == ['large', 'medium', 'small']
+
+    def test_unknown_sizes(self):
+        """ Test that files of unknown size are started last, in order. """
+        downloads = [(name, self.sizes.get(name), self.function(name, True))
+                     for name in ('first', 'small', 'second', 'large')]
+        self.run_downloads(downloads, 1)
+        assert self.started == ['large', 'small', 'first', 'second']
+
+    def test_failure_isolated(self):
+        """ Test that failing downloads don't affect the others. """
+        downloads = [('small', 10, self.function('small', False)),
+                     ('large', 1000, self.function('large', True)),
+                     ('medium', 100,
+                      self.function('medium', OSError('Broken')))]
+        results = self.run_downloads(downloads, 3)
+        assert results == [False, True, False]
+        assert sorted(self.started) == ['large', 'medium', 'small']
+
+    def test_empty(self):
+        """ Test common.download_many without any downloads. """
+        assert common.download_many([]) == []
+
+
 def test_levenshtein():
     """ Test common.levenshtein. """
     assert common.levenshtein('herp', 'herpderp') == 4
@@ -194,6 +444,64 @@ def test_list_names():
                              last_separator=' + ') == 'one; two + three'
 
 
+def test_parse_size():
+    """ Test common.parse_size. """
+    assert common.parse_size('42') == 42
+    assert common.parse_size('20M') == 20 * 1024 ** 2
+    assert common.parse_size('1.5k') == 1536
+    assert common.parse_size('2GiB') == 2 * 1024 ** 3
+    try:
+        common.parse_size('lots')
+    except ValueError:
+        assert True
+    else:
+        assert False
+
+
+def test_format_size():
+    """ Test common.format_size. """
+    assert common.format_size(42) == '42 B'
+    assert common.format_size(1536) == '1.5 KiB'
+    assert common.format_size(20 * 1024 ** 2) == '20.0 MiB'
+
+
+class TestDownloadCache(TestCase):
+
+    """ Test common.download with the cache. """
+
+    def setUp(self):
+        self.folder = '/tmp/test_download_cache/'
+        os.makedirs(self.folder)
+        cache.init(self.folder + 'blobs')
+        self.content = b'The content of the jar'
+        self.checksum = hashlib.md5(self.content).hexdigest()
+
+    def tearDown(self):
+        cache.init(None, 0)
+        shutil.rmtree(self.folder)
+
+    def fake_retrieve(self, url, destination, reporthook=None,
+                      checksum=None):
+        with open(destination, 'wb') as file:
+            file.write(self.content)
+        return self.checksum
+
+    def test_download_cached(self):
+        """ Test that a downloaded file is installed from the cache. """
+        task = MagicMock()
+        with patch('mcman.logic.common.retrieve', self.fake_retrieve):
+            assert common.download('http://herp/derp.jar',
+                                   self.folder + 'first.jar',
+                                   checksum=self.checksum, task=task)
+        with patch('mcman.logic.common.retrieve',
+                   MagicMock(side_effect=AssertionError)):
+            assert common.download('http://herp/derp.jar',
+                                   self.folder + 'second.jar',
+                                   checksum=self.checksum, task=task)
+        with open(self.folder + 'second.jar', 'rb') as file:
+            assert file.read() == self.content
+
+
 def test_replace_last():
     """ Test common.replace_last. """
     assert common.replace_last('aaa', 'a', 'b') == 'aab'
@@ -236,5 +544,3 @@ def test_get_term_width_success():
 def test_get_term_width_exception():
     """ Test common.get_term_width with (emulated) failure. """
     assert common.get_term_width() == 80
-
-# TODO - Unit tests for create_progressbar
@@ -0,0 +1,128 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.plugins.descriptor. """
+from unittest import TestCase
+from unittest.mock import patch
+from zipfile import BadZipFile, ZipFile, ZIP_BZIP2, ZIP_DEFLATED, ZIP_STORED
+import os
+import shutil
+
+import yaml
+
+from mcman.logic.plugins import descriptor
+
+
+class TestReadEntry(TestCase):
+
+    """ Test descriptor.read_entry. """
+
+    def setUp(self):
+        """ Set up. """
+        self.folder = '/tmp/test_read_entry/'
+        os.makedirs(self.folder)
+        self.path = self.folder + 'plugin.jar'
+
+    def tearDown(self):
+        """ Tear down. """
+        shutil.rmtree(self.folder)
+
+    def write(self, compression=ZIP_DEFLATED, prefix=b''):
+        """ Write a jar with many entries and a plugin.yml. """
+        with open(self.path, 'wb') as file:
+            file.write(prefix)
+            with ZipFile(file, 'w', compression) as zipped:
+                for number in range(100):
+                    zipped.writestr('a/Class{}.class'.format(number),
+                                    os.urandom(100))
+                zipped.writestr('plugin.yml', 'name: Herp\n' * 100)
+                zipped.comment = b'A comment'
+
+    def test_compression(self):
+        """ Test stored and deflated entries. """
+        for compression in (ZIP_STORED, ZIP_DEFLATED):
+            self.write(compression)
+            assert descriptor.read_entry(self.path, 'plugin.yml') == \
+                b'name: Herp\n' * 100
+
+    def test_prefix(self):
+        """ Test a zip file with data before it. """
+        self.write(prefix=b'#!/bin/sh\nexec java -jar "$0"\n')
+        assert descriptor.read_entry(self.path, 'plugin.yml') == \
+            b'name: Herp\n' * 100
+
+    def test_missing(self):
+        """ Test a zip file without the entry. """
+        self.write()
+        assert descriptor.read_entry(self.path, 'bungee.yml') is None
+
+    def test_fallback(self):
+        """ Test that unsupported compression is read by zipfile. """
+        self.write(ZIP_BZIP2)
+        with patch('mcman.logic.plugins.descriptor.ZipFile',
+                   wraps=ZipFile) as zip_file:
+            assert descriptor.read_entry(self.path, 'plugin.yml') == \
+                b'name: Herp\n' * 100
+        assert zip_file.called
+
+    def test_not_a_zip(self):
+        """ Test files which are not zip files. """
+        for content in (b'', b'Not a zip file' * 100):
+            with open(self.path, 'wb') as file:
+                file.write(content)
+            with self.assertRaises(BadZipFile):
+                descriptor.read_entry(self.path, 'plugin.yml')
+
+
+# plugin.yml files, and whether the line reader handles them
+PLUGIN_YMLS = [
+    ('name: Herp\nmain: herp.Herp\nversion: 1.0\n', True),
+    ('# A comment\nname: "Herp"\r\nmain: herp.Herp # Main class\n'
+     'version: 1.10\ncommands:\n  herp:\n    usage: /<command>\n', False),
+    ("name: 'It''s'\nmain: a.B\nversion: 1.2.3-SNAPSHOT\nauthors: [a, b]\n",
+     True),
+    ('name: yes\nmain: a.B\nversion: 010\n', True),
+    ('name: Herp\nmain: a.B\nversion: 1.0\nname: Derp\n', True),
+    ('name: Herp\n  Derp\nmain: a.B\nversion: 2\n', False),
+    ('name: Herp\nmain: a.B\nversion: >\n  1.0\n', False),
+    ('---\nname: Herp\nmain: a.B\nversion: 1\n', False),
+    ('{name: Herp, main: a.B, version: 3}\n', False),
+]
+
+
+def test_parse_plugin_yml():
+    """ Test that parse_plugin_yml gives the same results as PyYAML. """
+    for text, fast in PLUGIN_YMLS:
+        yml = yaml.safe_load(text)
+        expected = (yml['main'], yml['name'], str(yml['version']))
+        assert descriptor.parse_plugin_yml(text.encode()) == expected, text
+        with patch('yaml.load') as load:
+            try:
+                descriptor.parse_plugin_yml(text.encode())
+            except ValueError:
+                pass
+        assert load.called != fast, text
+
+
+def test_parse_invalid():
+    """ Test invalid plugin.yml files. """
+    for text in ('name: [Herp\n', 'name: Herp\nmain: a.B\n', '- a\n- b\n'):
+        try:
+            descriptor.parse_plugin_yml(text.encode())
+        except ValueError:
+            pass
+        else:
+            assert False, text
@@ -0,0 +1,101 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.fleet. """
+from unittest import TestCase
+from unittest.mock import patch
+from zipfile import ZipFile
+import os
+import shutil
+
+from mcman.logic import fleet, index
+
+PLUGIN_YML = 'name: {}\nmain: a.{}\nversion: "{}"\n'
+
+
+def fake_lookup(query, fields):
+    """ Find the plugins by checksum on a fake BukGet. """
+    if query['field'] != 'versions.checksum':
+        return []
+    fake_lookup.queries.append(query['value'])
+    return [{'slug': name.lower(), 'plugin_name': name,
+             'versions': [{'version': '2.0', 'type': 'Release'}]}
+            for name in ('Herp', 'Derp')]
+
+
+class TestFleet(TestCase):
+
+    """ Tests for mcman.logic.fleet. """
+
+    def setUp(self):
+        """ Set up three servers, with some of the same plugins. """
+        self.folder = '/tmp/test_fleet/'
+        servers = {'a': [('Herp', '1.0'), ('Derp', '2.0')],
+                   'b': [('Herp', '1.0')],
+                   'c': [('Herp', '1.5')]}
+        self.roots = list()
+        for server, installed in servers.items():
+            root = self.folder + server
+            os.makedirs(root + '/plugins')
+            for name, version in installed:
+                with ZipFile('{}/plugins/{}.jar'.format(root, name),
+                             'w') as zipped:
+                    zipped.writestr('plugin.yml', PLUGIN_YML.format(
+                        name, name, version))
+            self.roots.append(root)
+
+        patcher = patch('mcman.logic.index.INDEX_FILE',
+                        self.folder + 'index.json')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        index.init(rescan=True)
+        self.addCleanup(index.init)
+        fake_lookup.queries = list()
+
+    def tearDown(self):
+        """ Tear down. """
+        shutil.rmtree(self.folder)
+
+    def test_scan(self):
+        """ Test that all the servers are scanned. """
+        scans = fleet.scan(self.roots, jobs=2)
+        assert sorted(len(found) for found in scans.values()) == [1, 1, 2]
+        # Herp 1.0 is installed twice
+        assert len(fleet.unique_jars(scans)) == 3
+
+    @patch('bukget.search', side_effect=fake_lookup)
+    def test_outdated(self, fake_search):
+        """ Test the report, and that each jar is looked up once. """
+        report = fleet.outdated(fleet.scan(self.roots))
+        assert report == [
+            ('Herp', '1.0', '2.0', [self.folder + 'a', self.folder + 'b']),
+            ('Herp', '1.5', '2.0', [self.folder + 'c'])]
+        assert sum(len(query) for query in fake_lookup.queries) == 3
+
+    @patch('bukget.search')
+    def test_outdated_by_checksum(self, fake_search):
+        """ Test that the plugins are paired by checksum, not by name. """
+        scans = fleet.scan(self.roots)
+        checksums = {record[3]: record[0] for record in
+                     fleet.unique_jars(scans) if record[2] == 'Herp'}
+        fake_search.return_value = [
+            {'slug': 'herp', 'plugin_name': 'HerpPlugin',
+             'versions': [{'version': '2.0', 'type': 'Release',
+                           'md5': checksum}
+                          for checksum in checksums.values()]}]
+        report = fleet.outdated(scans)
+        assert [(name, version) for name, version, _, _ in report] == [
+            ('Herp', '1.0'), ('Herp', '1.5')]
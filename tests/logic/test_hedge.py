@@ -0,0 +1,138 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.hedge. """
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from urllib.error import HTTPError, URLError
+
+from mcman.logic import hedge, httpcache
+
+
+class TestHedge(TestCase):
+
+    """ Tests for hedge.call. """
+
+    def setUp(self):
+        """ Forget the latencies, and don't sleep between retries. """
+        patchers = [patch('mcman.logic.hedge._LATENCIES', dict()),
+                    patch('mcman.logic.transport.backoff')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_delay(self):
+        """ Test that the delay is the 95th percentile of the latencies. """
+        self.assertEqual(hedge.delay('kind'), hedge.DEFAULT_DELAY)
+        for latency in range(1, 101):
+            hedge.record('kind', latency / 100)
+        self.assertEqual(hedge.delay('kind'), 0.96)
+
+    def test_cache_hits_not_recorded(self):
+        """ Test that queries answered from the cache don't count. """
+        def cached():
+            httpcache.count_thread('hits')
+            return 'cached'
+
+        def sent():
+            httpcache.count_thread('sent')
+            return 'sent'
+
+        self.assertEqual(hedge.call('kind', cached), 'cached')
+        self.assertNotIn('kind', hedge._LATENCIES)
+        self.assertEqual(hedge.call('kind', sent), 'sent')
+        self.assertEqual(len(hedge._LATENCIES['kind']), 1)
+
+    @patch('mcman.logic.hedge.DEFAULT_DELAY', 0.05)
+    def test_hedged(self):
+        """ Test that a slow query is sent again, and the first answer used.
+        """
+        calls = list()
+        first_call = threading.Event()
+
+        def query(value):
+            calls.append(value)
+            if not first_call.is_set():
+                first_call.set()
+                time.sleep(1)
+                return 'slow'
+            return 'fast'
+
+        started = time.monotonic()
+        self.assertEqual(hedge.call('kind', query, 'x'), 'fast')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(calls, ['x', 'x'])
+
+    def test_retried(self):
+        """ Test that transient errors are retried, and others are not. """
+        errors = [URLError('Down'), HTTPError('url', 503, 'Busy', {}, None)]
+
+        def flaky():
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+
+        self.assertEqual(hedge.call('kind', flaky), 'ok')
+
+        def missing():
+            missing.calls += 1
+            raise HTTPError('url', 404, 'Not Found', {}, None)
+        missing.calls = 0
+
+        with self.assertRaises(HTTPError):
+            hedge.call('kind', missing)
+        self.assertEqual(missing.calls, 1)
+
+    @patch('mcman.logic.hedge.DEFAULT_DELAY', 0.05)
+    def test_retries_not_hedged(self):
+        """ Test that only the first attempt of a query is hedged. """
+        calls = list()
+
+        def slow_after_error():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise URLError('Down')
+            time.sleep(0.2)
+            return 'ok'
+
+        self.assertEqual(hedge.call('kind', slow_after_error), 'ok')
+        self.assertEqual(len(calls), 2)
+
+        def failed_over():
+            failed_over.calls += 1
+            error = URLError('All mirrors are down')
+            error.failed_over = True
+            raise error
+        failed_over.calls = 0
+
+        with self.assertRaises(URLError):
+            hedge.call('kind', failed_over)
+        self.assertEqual(failed_over.calls, 1)
+
+    def test_wrapper(self):
+        """ Test that Hedged calls the functions of the module. """
+        class Module(object):
+            BASE = 'http://api/'
+
+            @staticmethod
+            def search(value, size=1):
+                return [value] * size
+
+        wrapped = hedge.Hedged(Module)
+        self.assertEqual(wrapped.BASE, 'http://api/')
+        self.assertEqual(wrapped.search('a', size=2), ['a', 'a'])
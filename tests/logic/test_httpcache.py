@@ -0,0 +1,165 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.httpcache. """
+import json
+import tempfile
+from email.message import Message
+from io import BytesIO
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from urllib.error import HTTPError
+from urllib.response import addinfourl
+
+from mcman.logic import httpcache
+
+
+def response(body, headers=None, status=200):
+    """ Create a response with `body` and `headers`. """
+    message = Message()
+    for name, value in (headers or dict()).items():
+        message[name] = value
+    return addinfourl(BytesIO(body), message, 'http://api/', status)
+
+
+class TestNormalize(TestCase):
+
+    """ Tests for httpcache.normalize. """
+
+    def setUp(self):
+        """ Register a service with two mirrors. """
+        httpcache.register('test', ['http://a/api/', 'http://b/api/'])
+        self.addCleanup(httpcache._SERVICES.pop, 'test')
+
+    def test_mirrors(self):
+        """ Test that the same query on two mirrors has the same key. """
+        self.assertEqual(httpcache.normalize('http://a/api/plugins?x=1'),
+                         httpcache.normalize('http://b/api/plugins?x=1'))
+
+    def test_order(self):
+        """ Test that the order of the parameters does not matter. """
+        first = httpcache.normalize('http://a/api/search?a=1&b=2',
+                                    b'size=5&fields=name')
+        second = httpcache.normalize('http://a/api/search?b=2&a=1',
+                                     'fields=name&size=5')
+        self.assertEqual(first, second)
+        self.assertEqual(first[:2], ('test', 'search'))
+
+    def test_not_cached(self):
+        """ Test that other urls, and the base url, are not cached. """
+        self.assertIsNone(httpcache.normalize('http://c/api/plugins'))
+        self.assertIsNone(httpcache.normalize('http://a/api/'))
+
+
+class TestCachingOpener(TestCase):
+
+    """ Tests for httpcache.CachingOpener. """
+
+    def setUp(self):
+        """ Store the responses in a temporary folder. """
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        for name, value in (('FOLDER', self.folder.name), ('ENABLED', True),
+                            ('REFRESH', False),
+                            ('_COUNTERS', {'hits': 0, 'revalidated': 0,
+                                           'misses': 0})):
+            patcher = patch('mcman.logic.httpcache.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        httpcache.register('spacegdn', 'http://api/')
+        self.addCleanup(httpcache._SERVICES.pop, 'spacegdn')
+
+        self.inner = MagicMock()
+        self.opener = httpcache.CachingOpener(self.inner)
+
+    def test_hit(self):
+        """ Test that a fresh response is served from the cache. """
+        self.inner.open.return_value = response(b'[1]')
+        first = self.opener.open('http://api/jars?a=1')
+        second = self.opener.open('http://api/jars?a=1')
+
+        self.assertEqual(first.read(), b'[1]')
+        self.assertEqual(second.read(), b'[1]')
+        self.assertEqual(self.inner.open.call_count, 1)
+        self.assertEqual(httpcache.counters(),
+                         {'hits': 1, 'revalidated': 0, 'misses': 1})
+
+    def test_thread_counters(self):
+        """ Test that the hits and requests of this thread are counted. """
+        self.inner.open.return_value = response(b'[1]')
+        hits, sent = httpcache.thread_counters()
+        self.opener.open('http://api/jars?a=1')
+        self.assertEqual(httpcache.thread_counters(), (hits, sent + 1))
+        self.opener.open('http://api/jars?a=1')
+        self.assertEqual(httpcache.thread_counters(), (hits + 1, sent + 1))
+
+    def test_expired(self):
+        """ Test that a stale response is revalidated with it's ETag. """
+        self.inner.open.return_value = response(b'[1]', {'ETag': '"v1"'})
+        self.opener.open('http://api/builds')
+
+        self.inner.open.side_effect = HTTPError('http://api/builds', 304,
+                                                'Not Modified', Message(),
+                                                BytesIO())
+        later = httpcache.time.time() + httpcache.ttl('spacegdn', 'builds')
+        with patch('time.time', return_value=later + 1):
+            result = self.opener.open('http://api/builds')
+
+        self.assertEqual(result.read(), b'[1]')
+        request = self.inner.open.call_args[0][0]
+        self.assertEqual(request.get_header('If-none-match'), '"v1"')
+        self.assertEqual(httpcache.counters()['revalidated'], 1)
+
+    def test_refresh(self):
+        """ Test that REFRESH sends fresh responses to the server again. """
+        self.inner.open.return_value = response(b'[1]')
+        self.opener.open('http://api/jars')
+        self.inner.open.return_value = response(b'[2]')
+        with patch('mcman.logic.httpcache.REFRESH', True):
+            result = self.opener.open('http://api/jars')
+
+        self.assertEqual(result.read(), b'[2]')
+        self.assertEqual(self.opener.open('http://api/jars').read(), b'[2]')
+
+    def test_disabled(self):
+        """ Test that nothing is cached when the cache is disabled. """
+        self.inner.open.side_effect = lambda *args: response(b'[1]')
+        with patch('mcman.logic.httpcache.ENABLED', False):
+            self.opener.open('http://api/jars')
+            self.opener.open('http://api/jars')
+        self.assertEqual(self.inner.open.call_count, 2)
+        self.assertEqual(httpcache.stats()[0], 0)
+
+    def test_errors(self):
+        """ Test that errors are not cached. """
+        self.inner.open.side_effect = HTTPError('http://api/jars', 404,
+                                                'Not Found', Message(),
+                                                BytesIO())
+        with self.assertRaises(HTTPError):
+            self.opener.open('http://api/jars')
+        self.assertEqual(httpcache.stats()[0], 0)
+
+    def test_totals(self):
+        """ Test that the counters are added to the saved totals. """
+        self.inner.open.return_value = response(b'[1]')
+        self.opener.open('http://api/jars')
+        self.opener.open('http://api/jars')
+        httpcache.save_totals()
+        httpcache.save_totals()
+
+        with open(self.folder.name + '/counters.json') as file:
+            self.assertEqual(json.load(file),
+                             {'hits': 1, 'revalidated': 0, 'misses': 1})
@@ -0,0 +1,128 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.index. """
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from zipfile import ZipFile
+
+from mcman.logic import index
+from mcman.logic.plugins import plugins
+
+
+class TestIndex(TestCase):
+
+    """ Tests for mcman.logic.index. """
+
+    def setUp(self):
+        """ Store the index and a jar in a temporary folder. """
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.index_file = os.path.join(self.folder.name, 'index.json')
+        patcher = patch('mcman.logic.index.INDEX_FILE', self.index_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        index.init()
+        self.addCleanup(index.init)
+
+        self.jar = os.path.join(self.folder.name, 'Herp.jar')
+        with ZipFile(self.jar, 'w') as zipped:
+            zipped.writestr('plugin.yml',
+                            'name: Herp\nmain: herp.Herp\nversion: 1.0\n')
+
+    def test_checksum_cached(self):
+        """ Test that an unchanged file is not hashed again. """
+        md5 = index.checksum(self.jar)
+        index.save()
+        index.init()
+
+        with patch('mcman.logic.common.digest_file') as digest_file:
+            self.assertEqual(index.checksum(self.jar), md5)
+            self.assertEqual(len(index.digests(self.jar)['sha256']), 64)
+        digest_file.assert_not_called()
+
+    def test_changed(self):
+        """ Test that a changed file is hashed again. """
+        index.checksum(self.jar)
+        with open(self.jar, 'ab') as file:
+            file.write(b'more')
+
+        key, entry = index.lookup(self.jar)
+        self.assertIsNone(entry)
+        self.assertEqual(key[1], os.path.getsize(self.jar))
+
+    def test_rescan(self):
+        """ Test that the index is ignored with rescan. """
+        index.checksum(self.jar)
+        index.save()
+        index.init(rescan=True)
+        self.assertIsNone(index.lookup(self.jar)[1])
+
+    def test_rescan_once(self):
+        """ Test that a rescan reads each jar only once per run. """
+        key, _ = index.lookup(self.jar)
+        index.store(self.jar, key, main='old.Main', md5='0' * 32)
+        index.save()
+        index.init(rescan=True)
+
+        checksum = index.checksum(self.jar)
+        with patch('mcman.logic.common.digest_file') as digest_file:
+            self.assertEqual(index.checksum(self.jar), checksum)
+        digest_file.assert_not_called()
+        # The fields from the earlier run are not kept
+        self.assertNotIn('main', index.lookup(self.jar)[1])
+
+    def test_integrity(self):
+        """ Test that a tampered index is discarded. """
+        index.checksum(self.jar)
+        index.save()
+        with open(self.index_file, 'r') as file:
+            data = json.load(file)
+        entry = data['entries'][os.path.abspath(self.jar)]
+        entry['md5'] = '0' * 32
+        with open(self.index_file, 'w') as file:
+            json.dump(data, file)
+
+        index.init()
+        self.assertIsNone(index.lookup(self.jar)[1])
+
+    def test_damaged(self):
+        """ Test that a damaged index file is discarded. """
+        with open(self.index_file, 'w') as file:
+            file.write('{"format": 1, "entr')
+        self.assertIsNone(index.lookup(self.jar)[1])
+
+    def test_parse_installed_plugin(self):
+        """ Test that plugin.yml is only parsed once. """
+        first = plugins.parse_installed_plugin(self.jar)
+        self.assertEqual(first[1:], ('herp.Herp', 'Herp', '1.0', self.jar))
+
+        with patch('mcman.logic.plugins.plugins.ZipFile') as zip_file:
+            self.assertEqual(plugins.parse_installed_plugin(self.jar), first)
+        zip_file.assert_not_called()
+
+    def test_not_a_plugin(self):
+        """ Test that jars without plugin.yml are remembered too. """
+        with ZipFile(self.jar, 'w') as zipped:
+            zipped.writestr('library.txt', 'Not a plugin')
+        self.assertIsNone(plugins.parse_installed_plugin(self.jar))
+
+        with patch('mcman.logic.plugins.plugins.ZipFile') as zip_file:
+            self.assertIsNone(plugins.parse_installed_plugin(self.jar))
+        zip_file.assert_not_called()
@@ -0,0 +1,120 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.mirrors. """
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from urllib.error import HTTPError, URLError
+
+from mcman.logic import mirrors, transport
+
+
+class TestRank(TestCase):
+
+    """ Tests for mirrors.rank. """
+
+    def setUp(self):
+        """ Save the ranking in a temporary folder. """
+        self.folder = tempfile.TemporaryDirectory()
+        ranking_file = os.path.join(self.folder.name, 'mirrors.json')
+        patcher = patch('mcman.logic.mirrors.RANKING_FILE', ranking_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.folder.cleanup)
+
+    @patch('mcman.logic.mirrors.probe')
+    def test_rank(self, probe):
+        """ Test that the mirrors are sorted by latency. """
+        latencies = {'http://a/': 0.3, 'http://b/': None, 'http://c/': 0.1}
+        probe.side_effect = latencies.get
+
+        ranked = mirrors.rank(['http://a/', 'http://b/', 'http://c/'])
+        self.assertEqual(ranked, ['http://c/', 'http://a/', 'http://b/'])
+
+    @patch('mcman.logic.mirrors.probe', return_value=0.1)
+    def test_remembered(self, probe):
+        """ Test that the measurements are reused between runs. """
+        mirrors.rank(['http://a/', 'http://b/'])
+        self.assertEqual(probe.call_count, 2)
+        mirrors.rank(['http://a/', 'http://b/'])
+        self.assertEqual(probe.call_count, 2)
+
+        with patch('time.time', return_value=2 ** 40):
+            mirrors.rank(['http://a/', 'http://b/'])
+        self.assertEqual(probe.call_count, 4)
+
+    @patch('mcman.logic.mirrors.probe')
+    def test_select_single(self, probe):
+        """ Test that a single url isn't measured. """
+        self.assertEqual(mirrors.select(['http://a/']), 'http://a/')
+        probe.assert_not_called()
+
+
+def test_parse_urls():
+    """ Test mirrors.parse_urls. """
+    assert mirrors.parse_urls('http://a/') == ['http://a/']
+    assert mirrors.parse_urls('http://a/, http://b/,') == ['http://a/',
+                                                          'http://b/']
+
+
+class TestFailover(TestCase):
+
+    """ Tests for the failover of transport. """
+
+    def setUp(self):
+        """ Register two mirrors. """
+        transport.add_mirrors(['http://a/v1/', 'http://b/v1/'])
+        self.addCleanup(transport.clear_mirrors)
+
+    def test_alternatives(self):
+        """ Test transport.alternatives. """
+        self.assertEqual(transport.alternatives('http://b/v1/jars'),
+                         [('http://a/v1/', 'http://a/v1/jars'),
+                          ('http://b/v1/', 'http://b/v1/jars')])
+        self.assertEqual(transport.alternatives('http://c/jars'),
+                         [(None, 'http://c/jars')])
+
+    def test_fail_over(self):
+        """ Test that a failed mirror is demoted, and the next is used. """
+        opened = list()
+
+        def fake_open(request, data, timeout):
+            """ Fail for mirror a. """
+            opened.append(request)
+            if request.startswith('http://a/'):
+                raise URLError('timed out')
+            return 'response'
+
+        opener = transport.FailoverOpener(None)
+        with patch.object(opener, 'director') as director:
+            director.open.side_effect = fake_open
+            self.assertEqual(opener.open('http://a/v1/jars'), 'response')
+            self.assertEqual(opener.open('http://a/v1/jars'), 'response')
+
+        self.assertEqual(opened, ['http://a/v1/jars', 'http://b/v1/jars',
+                                  'http://b/v1/jars'])
+
+    def test_client_error(self):
+        """ Test that a client error is not failed over. """
+        opener = transport.FailoverOpener(None)
+        error = HTTPError('http://a/v1/x', 404, 'Not Found', dict(), None)
+        with patch.object(opener, 'director') as director:
+            director.open.side_effect = error
+            with self.assertRaises(HTTPError):
+                opener.open('http://a/v1/x')
+        self.assertEqual(director.open.call_count, 1)
@@ -15,9 +15,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """ Tests for mcman.backend.plugins. """
+from concurrent.futures.process import BrokenProcessPool
+from mcman.logic import index
 from mcman.logic.plugins import plugins, utils
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 from unittest import TestCase
+from zipfile import BadZipFile, ZipFile
+import os
+import shutil
+import tempfile
+import threading
+import time
 
 
 @patch('mcman.logic.plugins.plugins.bukget')
@@ -82,3 +90,277 @@ def test_info_plugin_not_found(fake_find_slug):
     plugins.init(None, None)
     plugin = plugins.info('herp', 'derp')
     assert plugin is None
+
+
+def fake_lookup(query, fields):
+    """ Find the plugins with the checksums 'md5-<name>' on a fake BukGet. """
+    if query['field'] != 'versions.checksum':
+        return []
+    return [{'slug': md5[4:].lower(), 'plugin_name': md5[4:]}
+            for md5 in query['value'] if md5 != 'md5-Unknown']
+
+
+@patch('bukget.search', side_effect=fake_lookup)
+@patch('mcman.logic.plugins.plugins.scan_installed_plugins')
+def test_list_plugins(fake_scan, fake_search):
+    """ Test that plugins.list_plugins looks up the plugins in batches. """
+    names = ['P{}'.format(n) for n in range(5)] + ['Unknown', 'P0']
+    fake_scan.return_value = iter(
+        ('md5-' + name, 'main.' + name, name, '1.0', name + '.jar')
+        for name in names)
+
+    result = plugins.list_plugins(batch_size=2)
+
+    assert sorted(plugin['slug'] for plugin in result) == \
+        ['p{}'.format(n) for n in range(5)]
+    for plugin in result:
+        assert plugin['installed_file'] == plugin['plugin_name'] + '.jar'
+    batches = [call[0][0]['value'] for call in fake_search.call_args_list
+               if call[0][0]['field'] == 'versions.checksum']
+    assert sorted(len(batch) for batch in batches) == [1, 2, 2, 2]
+
+
+def test_lookup_batches():
+    """ Test that lookups are merged while the scan is still running. """
+    looked_up = threading.Event()
+    scanned = list()
+
+    def scan():
+        """ Scan four jars, the last two after the first lookup is done. """
+        for number in range(4):
+            if number == 2:
+                assert looked_up.wait(5)
+                time.sleep(0.1)
+            scanned.append(number)
+            yield number
+
+    def lookup(batch):
+        """ Look up a batch. """
+        if batch == [0, 1]:
+            looked_up.set()
+        return batch
+
+    results = plugins.lookup_batches(scan(), lookup, batch_size=2)
+    assert next(results) == [0, 1]
+    assert len(scanned) < 4
+    assert list(results) == [[2, 3]]
+
+
+def fake_fallback(query, fields):
+    """ Find plugins by checksum, main class or name on a fake BukGet. """
+    plugins = [
+        {'slug': 'a', 'plugin_name': 'A', 'main': 'main.A',
+         'versions': [{'md5': 'md5-A'}]},
+        {'slug': 'b', 'plugin_name': 'Bee', 'main': 'main.B', 'versions': []},
+        {'slug': 'c', 'plugin_name': 'C', 'main': 'main.C', 'versions': []},
+    ]
+    field = {'versions.checksum': lambda plugin: plugin['versions'][0]['md5']
+             if plugin['versions'] else None,
+             'main': lambda plugin: plugin['main'],
+             'plugin_name': lambda plugin: plugin['plugin_name']}
+    return [plugin for plugin in plugins
+            if field[query['field']](plugin) in query['value']]
+
+
+@patch('bukget.search', side_effect=fake_fallback)
+def test_lookup_installed(fake_search):
+    """ Test that the fallbacks only ask for the unmatched plugins. """
+    plugins.init(None, None)
+    installed = [('md5-A', 'main.A', 'A', '1.0', 'A.jar'),
+                 ('md5-B', 'main.B', 'B', '2.0', 'B.jar'),
+                 ('md5-C', 'main.X', 'C', '3.0', 'C.jar'),
+                 ('md5-D', 'main.D', 'D', '4.0', 'D.jar')]
+
+    result = plugins.lookup_installed(installed, 'slug,plugin_name')
+
+    assert [(plugin['slug'], plugin['installed_file'])
+            for plugin in result] == [('a', 'A.jar'), ('b', 'B.jar'),
+                                      ('c', 'C.jar')]
+    queries = {call[0][0]['field']: call[0][0]['value']
+               for call in fake_search.call_args_list}
+    assert queries['main'] == ['main.B', 'main.X', 'main.D']
+    assert queries['plugin_name'] == ['B', 'C', 'D']
+    assert fake_search.call_args[1]['fields'] == 'slug,plugin_name,main'
+
+
+@patch('bukget.search', side_effect=fake_fallback)
+def test_lookup_checksums(fake_search):
+    """ Test that every installed version of a plugin is kept. """
+    plugins.init(None, None)
+    installed = [('md5-A', 'main.A', 'A', '1.0', 'A.jar'),
+                 ('md5-A2', 'main.A', 'A', '0.9', 'old/A.jar'),
+                 ('md5-D', 'main.D', 'D', '4.0', 'D.jar')]
+
+    result = plugins.lookup_checksums(installed, 'slug,plugin_name')
+
+    assert {checksum: plugin['slug'] for checksum, plugin
+            in result.items()} == {'md5-A': 'a', 'md5-A2': 'a'}
+    assert 'installed_file' not in result['md5-A']
+
+
+class TestUnzipPlugin(TestCase):
+
+    """ Test plugins.unzip_plugin. """
+
+    def setUp(self):
+        """ Set up. """
+        self.folder = '/tmp/test_unzip_plugin/'
+        os.makedirs(self.folder)
+        self.jars = {'First.jar': os.urandom(1000),
+                     'lib/Second.jar': os.urandom(100000),
+                     'lib/Third.jar': b''}
+        with ZipFile(self.folder + 'bundle.zip', 'w') as zipped:
+            zipped.writestr('README.txt', 'Read me!')
+            zipped.writestr('lib/', '')
+            for name, content in self.jars.items():
+                zipped.writestr(name, content)
+
+    def tearDown(self):
+        """ Tear down. """
+        shutil.rmtree(self.folder)
+
+    def check(self, extracted):
+        """ Check that the jars, and only the jars were extracted. """
+        assert sorted(extracted) == sorted(self.folder + 'plugins/' + name
+                                           for name in self.jars)
+        for name, content in self.jars.items():
+            with open(self.folder + 'plugins/' + name, 'rb') as file:
+                assert file.read() == content
+        assert not os.path.exists(self.folder + 'plugins/README.txt')
+
+    def test_unzip(self):
+        """ Test unzipping with several jars at once. """
+        self.check(plugins.unzip_plugin(self.folder + 'bundle.zip',
+                                        self.folder + 'plugins/', jobs=4))
+
+    def test_unzip_serial(self):
+        """ Test unzipping one jar at a time. """
+        self.check(plugins.unzip_plugin(self.folder + 'bundle.zip',
+                                        self.folder + 'plugins/', jobs=1))
+
+
+class TestParseInstalledPlugins(TestCase):
+
+    """ Test plugins.parse_installed_plugins. """
+
+    def setUp(self):
+        """ Set up a plugins folder with some plugins and a library. """
+        self.folder = '/tmp/test_parse_installed_plugins/'
+        os.makedirs(self.folder + 'plugins')
+        for number in range(5):
+            with ZipFile(self.folder + 'plugins/P{}.jar'.format(number),
+                         'w') as zipped:
+                zipped.writestr('plugin.yml',
+                                'name: P{0}\nmain: p.P{0}\nversion: {0}\n'
+                                .format(number))
+        with ZipFile(self.folder + 'plugins/Library.jar', 'w') as zipped:
+            zipped.writestr('library.txt', 'Not a plugin')
+        with open(self.folder + 'plugins/Broken.jar', 'wb') as file:
+            file.write(b'Not a zip file')
+
+        patchers = [
+            patch('mcman.logic.common.find_plugins_folder',
+                  return_value=self.folder + 'plugins'),
+            patch('mcman.logic.index.INDEX_FILE', self.folder + 'index.json')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        index.init(rescan=True)
+        self.addCleanup(index.init)
+
+    def tearDown(self):
+        """ Tear down. """
+        shutil.rmtree(self.folder)
+
+    def check(self, found):
+        """ Check that all plugins, and only the plugins were found. """
+        assert sorted(plugin[2:] for plugin in found) == [
+            ('P{}'.format(n), str(n), self.folder + 'plugins/P{}.jar'
+             .format(n)) for n in range(5)]
+
+    @patch('mcman.logic.plugins.plugins.PROCESS_THRESHOLD', 2)
+    def test_processes(self):
+        """ Test parsing in a process pool. """
+        self.check(plugins.parse_installed_plugins(workers=2))
+
+    @patch('mcman.logic.plugins.plugins.PROCESS_THRESHOLD', 2)
+    def test_broken_processes(self):
+        """ Test that the jars are parsed in threads if the pool breaks. """
+        parser = Mock()
+        parser.submit.return_value.result.side_effect = BrokenProcessPool
+        with patch('mcman.logic.plugins.plugins.parser_executor',
+                   return_value=parser):
+            self.check(plugins.parse_installed_plugins(workers=2))
+        assert parser.submit.called
+        parser.shutdown.assert_called_once_with()
+
+        index.init(rescan=True)
+        parser.submit.side_effect = BrokenProcessPool
+        with patch('mcman.logic.plugins.plugins.parser_executor',
+                   return_value=parser):
+            self.check(plugins.parse_installed_plugins(workers=2))
+
+    def test_parser_executor(self):
+        """ Test that the parsing processes are spawned, not forked. """
+        assert plugins.parser_executor(1, 2) is None
+        parser = plugins.parser_executor(plugins.PROCESS_THRESHOLD, 2)
+        try:
+            assert parser._mp_context.get_start_method() == 'spawn'
+        finally:
+            parser.shutdown()
+
+    def test_threads(self):
+        """ Test parsing in a thread pool, and reading the index after. """
+        self.check(plugins.parse_installed_plugins(workers=2))
+        index.init()
+        with patch('mcman.logic.plugins.plugins.read_plugin_yml',
+                   side_effect=BadZipFile) as read:
+            self.check(plugins.parse_installed_plugins())
+        # Only the broken jar is read again
+        read.assert_called_once_with(self.folder + 'plugins/Broken.jar')
+
+    def test_errors(self):
+        """ Test that jars which can't be read are reported and skipped. """
+        with open(self.folder + 'plugins/Invalid.jar', 'wb') as file:
+            with ZipFile(file, 'w') as zipped:
+                zipped.writestr('plugin.yml', 'name: [Invalid')
+        errors = list()
+        found = plugins.scan_installed_plugins(
+            on_error=lambda jar, error: errors.append(jar))
+        self.check(found)
+        assert sorted(errors) == [self.folder + 'plugins/Broken.jar',
+                                  self.folder + 'plugins/Invalid.jar']
+
+    def test_cancel(self):
+        """ Test that closing the scan early cancels the rest. """
+        for number in range(5, 100):
+            shutil.copy(self.folder + 'plugins/P0.jar',
+                        self.folder + 'plugins/C{}.jar'.format(number))
+        scan = plugins.scan_installed_plugins(workers=2)
+        first = next(scan)
+        with patch('mcman.logic.plugins.plugins.scan_jar') as scan_jar:
+            scan.close()
+        scan_jar.assert_not_called()
+        assert first[1] == 'p.P0'
+        # The finished jars were saved to the index
+        index.init()
+        assert index.lookup(first[4])[1] is not None
+
+
+def test_scan_workers():
+    """ Test plugins.scan_workers. """
+    assert plugins.scan_workers(300, 3) == 3
+    assert plugins.scan_workers(1) == 1
+    with patch('os.cpu_count', return_value=4):
+        assert plugins.scan_workers(20) == 3
+        assert plugins.scan_workers(300) == 4
+
+
+def test_estimate_size():
+    """ Test that the size of the installed version is the estimate. """
+    with tempfile.NamedTemporaryFile() as file:
+        file.write(b'x' * 100)
+        file.flush()
+        assert plugins.estimate_size({'installed_file': file.name}) == 100
+    assert plugins.estimate_size({'installed_file': file.name}) is None
+    assert plugins.estimate_size({'slug': 'new'}) is None
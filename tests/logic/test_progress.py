@@ -0,0 +1,88 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.progress. """
+from mcman.logic import progress
+from unittest.mock import patch
+from io import StringIO
+import json
+
+
+def test_tty_renderer():
+    """ Test progress.TTYRenderer. """
+    stream = StringIO()
+    renderer = progress.TTYRenderer(stream, 40)
+    first = progress.Task(renderer, 'download', 'first', 100)
+    progress.Task(renderer, 'download', 'second')
+    first.update(100)
+    first.finish()
+
+    assert renderer.drawn == 1
+    assert len(renderer.tasks) == 1
+    assert 'first - Success\n' in stream.getvalue()
+
+
+def test_tty_frame_rate():
+    """ Test that the TTYRenderer only redraws at the frame rate. """
+    stream = StringIO()
+    renderer = progress.TTYRenderer(stream, 40, frame_rate=1)
+    task = progress.Task(renderer, 'download', 'first', 100)
+    written = len(stream.getvalue())
+    for i in range(100):
+        task.update(i)
+    assert len(stream.getvalue()) == written
+
+
+def test_json_renderer():
+    """ Test progress.JSONRenderer. """
+    stream = StringIO()
+    renderer = progress.JSONRenderer(stream, interval=0)
+    task = progress.Task(renderer, 'checksum', 'server.jar', 1000)
+    task.advance(250)
+    task.advance(250)
+    task.finish(False, 'Broken')
+
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [event['event'] for event in events] == ['start', 'progress',
+                                                     'progress', 'finish']
+    assert events[2]['bytes'] == 500
+    assert events[2]['total'] == 1000
+    assert events[-1]['kind'] == 'checksum'
+    assert events[-1]['success'] is False
+    assert events[-1]['message'] == 'Broken'
+    for key in ('rate', 'eta', 'elapsed'):
+        assert key in events[-1]
+
+
+def test_plain_renderer():
+    """ Test progress.PlainRenderer. """
+    stream = StringIO()
+    renderer = progress.PlainRenderer(stream)
+    task = progress.Task(renderer, 'unzip', 'bundle.zip')
+    task.update(42)
+    task.finish()
+    assert stream.getvalue() == 'bundle.zip - Success\n'
+
+
+def test_task_numbers():
+    """ Test the rate, ETA and percent of a Task. """
+    with patch('time.monotonic', return_value=10):
+        task = progress.Task(progress.Renderer(), 'download', 'herp', 400)
+    task.update(100)
+    with patch('time.monotonic', return_value=12):
+        assert task.rate() == 50
+        assert task.eta() == 6
+    assert task.percent() == 25
@@ -0,0 +1,90 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.ratelimit. """
+from unittest import TestCase
+from unittest.mock import patch
+
+from mcman.logic import ratelimit
+
+
+class TestTokenBucket(TestCase):
+
+    """ Tests for ratelimit.TokenBucket. """
+
+    def setUp(self):
+        """ Control the clock. """
+        self.now = 100.0
+        patcher = patch('time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst(self):
+        """ Test that a full bucket doesn't wait. """
+        bucket = ratelimit.TokenBucket(1000)
+        self.assertEqual(bucket.reserve(500), 0)
+
+    def test_debt(self):
+        """ Test that an empty bucket waits for the debt to be filled. """
+        bucket = ratelimit.TokenBucket(1000)
+        bucket.reserve(500)
+        self.assertAlmostEqual(bucket.reserve(1000), 1.0)
+        self.assertAlmostEqual(bucket.reserve(500), 1.5)
+
+    def test_refill(self):
+        """ Test that the bucket is refilled, up to the capacity. """
+        bucket = ratelimit.TokenBucket(1000)
+        bucket.reserve(1500)
+        self.now += 1
+        self.assertEqual(bucket.reserve(0), 0)
+        self.now += 10
+        self.assertAlmostEqual(bucket.reserve(1000), 0.5)
+
+
+class TestThrottle(TestCase):
+
+    """ Tests for ratelimit.throttle. """
+
+    def tearDown(self):
+        """ Remove the limits. """
+        ratelimit.init()
+
+    @patch('time.sleep')
+    def test_no_limit(self, sleep):
+        """ Test that nothing waits without limits. """
+        ratelimit.init()
+        ratelimit.throttle('example.com', 10 ** 9)
+        sleep.assert_not_called()
+
+    @patch('time.sleep')
+    @patch('time.monotonic', return_value=100.0)
+    def test_shared(self, monotonic, sleep):
+        """ Test that the global limit is shared by all hosts. """
+        ratelimit.init(1000)
+        ratelimit.throttle('a.example.com', 500)
+        ratelimit.throttle('b.example.com', 1000)
+        sleep.assert_called_once_with(1.0)
+
+    @patch('time.sleep')
+    @patch('time.monotonic', return_value=100.0)
+    def test_per_host(self, monotonic, sleep):
+        """ Test that each host has it's own limit. """
+        ratelimit.init(host_rate=1000)
+        ratelimit.throttle('a.example.com', 500)
+        ratelimit.throttle('b.example.com', 500)
+        sleep.assert_not_called()
+        ratelimit.throttle('a.example.com', 500)
+        sleep.assert_called_once_with(0.5)
@@ -0,0 +1,98 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.plugins.resolver. """
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from mcman.logic.plugins import resolver
+
+
+def plugin(name, *dependencies):
+    """ Create a plugin dict named `name`, with `dependencies`. """
+    return {
+        'slug': name.lower(),
+        'plugin_name': name,
+        'versions': [{'type': 'Release',
+                      'hard_dependencies': list(dependencies)}],
+    }
+
+
+class TestResolve(TestCase):
+
+    """ Tests for resolver.resolve. """
+
+    def setUp(self):
+        """ Set up a repository of plugins to look up. """
+        resolver.clear()
+        self.addCleanup(resolver.clear)
+        self.plugins = {p['plugin_name'].lower(): p for p in [
+            plugin('A', 'B', 'C'),
+            plugin('B', 'D'),
+            plugin('C', 'D', 'Missing'),
+            plugin('D'),
+            plugin('X', 'Y'),
+            plugin('Y', 'Z'),
+            plugin('Z', 'X'),
+        ]}
+        self.lookup = MagicMock(side_effect=lambda names: [
+            self.plugins[name.lower()] for name in names
+            if name.lower() in self.plugins])
+
+    def names(self, plugins):
+        """ Return the names of `plugins`. """
+        return [p['plugin_name'] for p in plugins]
+
+    def test_order(self):
+        """ Test that dependencies come before the plugins needing them. """
+        result = resolver.resolve([self.plugins['a']], self.lookup)
+        self.assertEqual(self.names(result), ['D', 'B', 'C', 'A'])
+
+    def test_batched(self):
+        """ Test that each level of the graph is one lookup. """
+        resolver.resolve([self.plugins['a']], self.lookup)
+        self.assertEqual([call[0][0] for call in self.lookup.call_args_list],
+                         [['B', 'C'], ['D', 'Missing']])
+
+    def test_remembered(self):
+        """ Test that resolved subgraphs are not looked up again. """
+        resolver.resolve([self.plugins['a']], self.lookup)
+        self.lookup.reset_mock()
+
+        result = resolver.resolve([plugin('E', 'B')], self.lookup)
+        self.assertEqual(self.names(result), ['D', 'B', 'E'])
+        self.lookup.assert_not_called()
+
+    def test_cycle(self):
+        """ Test that circular dependencies are reported, and broken. """
+        cycles = list()
+        result = resolver.resolve([self.plugins['x']], self.lookup,
+                                  on_cycle=cycles.append)
+        self.assertEqual(self.names(result), ['Z', 'Y', 'X'])
+        self.assertEqual(cycles, [['X', 'Y', 'Z', 'X']])
+
+    def test_deep(self):
+        """ Test a chain deeper than the recursion limit. """
+        chain = {'p0': plugin('P0')}
+        for number in range(1, 2000):
+            chain['p{}'.format(number)] = plugin(
+                'P{}'.format(number), 'P{}'.format(number - 1))
+        lookup = MagicMock(side_effect=lambda names: [
+            chain[name.lower()] for name in names])
+
+        result = resolver.resolve([chain['p1999']], lookup)
+        self.assertEqual(len(result), 2000)
+        self.assertEqual(result[0]['plugin_name'], 'P0')
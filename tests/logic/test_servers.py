@@ -0,0 +1,95 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.servers. """
+from unittest import TestCase
+from unittest.mock import patch
+import hashlib
+import os
+import shutil
+
+from mcman.logic import index, servers
+
+
+def fake_builds(build=None, where=None):
+    """ Find builds on a fake SpaceGDN. """
+    fake_builds.queries.append(build or where)
+    if build is not None:
+        return [{'id': build}] if build != 404 else []
+    checksum = where.split('.')[-1]
+    return [{'id': checksum[:4]}] if checksum != fake_builds.unknown else []
+
+
+@patch('spacegdn.builds', side_effect=fake_builds)
+class TestServers(TestCase):
+
+    """ Test servers.list_servers and servers.find_servers. """
+
+    def setUp(self):
+        """ Set up a folder with server jars, two are the same. """
+        self.folder = '/tmp/test_servers/'
+        os.makedirs(self.folder)
+        contents = {'a.jar': b'A', 'b.jar': b'B', 'copy.jar': b'A',
+                    'unknown.jar': b'?', 'notes.txt': b'A'}
+        for name, content in contents.items():
+            with open(self.folder + name, 'wb') as file:
+                file.write(content)
+        fake_builds.queries = list()
+        fake_builds.unknown = hashlib.md5(b'?').hexdigest()
+
+        patcher = patch('mcman.logic.index.INDEX_FILE',
+                        self.folder + 'index.json')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        index.init()
+        self.addCleanup(index.init)
+
+        cwd = os.getcwd()
+        os.chdir(self.folder)
+        self.addCleanup(os.chdir, cwd)
+
+    def tearDown(self):
+        """ Tear down. """
+        shutil.rmtree(self.folder)
+
+    def test_list_servers(self, fake_search):
+        """ Test that each distinct checksum is looked up once. """
+        a_id = hashlib.md5(b'A').hexdigest()[:4]
+        b_id = hashlib.md5(b'B').hexdigest()[:4]
+        assert servers.list_servers(jobs=2) == {'a.jar': a_id,
+                                                'b.jar': b_id,
+                                                'copy.jar': a_id}
+        assert len(fake_builds.queries) == 3
+
+    def test_find_servers(self, fake_search):
+        """ Test that the builds keep their order, and are found once. """
+        assert servers.find_servers([3, 1, 404, 3]) == [{'id': 3},
+                                                         {'id': 1},
+                                                         {'id': 3}]
+        assert sorted(fake_builds.queries) == [1, 3, 404]
+
+
+@patch('spacegdn.versions', return_value=[{'version': '1.7.10'}])
+@patch('spacegdn.channels', return_value=[{'name': 'Stable'}])
+@patch('spacegdn.jars', return_value=[{'name': 'Spigot'}])
+def test_get_roots(fake_jars, fake_channels, fake_versions):
+    """ Test that servers.get_roots asks for the three names. """
+    roots = servers.get_roots({'jar_id': 1, 'channel_id': 2,
+                               'version_id': 3, 'build': 1649})
+    assert roots == ('Spigot', 'Stable', '1.7.10', 1649)
+    fake_jars.assert_called_once_with(1)
+    fake_channels.assert_called_once_with(1, 2)
+    fake_versions.assert_called_once_with(1, 2, 3)
@@ -0,0 +1,166 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.transport. """
+from mcman.logic import hedge, transport
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import TestCase
+from unittest.mock import patch
+from urllib.error import HTTPError, URLError
+import gzip
+import json
+import socket
+import threading
+import time
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+
+    """ A HTTP handler that answers with JSON, gzipped if asked. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+        if self.path.endswith('/fail'):
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps({'path': self.path}).encode()
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = gzip.compress(body)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestTransport(TestCase):
+
+    """ Test the pooled transport. """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), JSONHandler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.requests = list()
+        # The slow responses fail when the client has given up on them
+        self.server.handle_error = lambda request, address: None
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = 'http://127.0.0.1:{}/'.format(
+            self.server.server_address[1])
+
+    def tearDown(self):
+        transport.close_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path, headers=None):
+        with transport.open(self.base + path, headers=headers) as response:
+            return response.read()
+
+    def test_keep_alive(self):
+        """ Test that the connection is reused for the next request. """
+        for i in range(5):
+            body = json.loads(self.get('search/{}'.format(i)).decode())
+            assert body['path'] == '/search/{}'.format(i)
+        assert self.server.connections == 1
+
+    def test_gzip(self):
+        """ Test that JSON is requested gzipped, and decompressed. """
+        body = json.loads(self.get('plugins').decode())
+        assert body['path'] == '/plugins'
+        assert self.server.requests[0]['Accept-Encoding'] == 'gzip'
+
+    def test_identity(self):
+        """ Test that an explicit encoding is kept. """
+        self.get('file.jar', {'Accept-Encoding': 'identity'})
+        assert self.server.requests[0]['Accept-Encoding'] == 'identity'
+
+    def test_stale_connection(self):
+        """ Test that a request on a closed idle connection is sent again. """
+        self.get('first')
+        for connection in transport._IDLE[('http', self.base[7:-1])]:
+            connection.sock.shutdown(socket.SHUT_RDWR)
+        body = json.loads(self.get('second').decode())
+        assert body['path'] == '/second'
+
+    def test_unread_response(self):
+        """ Test that a response closed before it is read isn't reused. """
+        transport.open(self.base + 'first',
+                       headers={'Accept-Encoding': 'identity'}).close()
+        self.get('second')
+        assert self.server.connections == 2
+
+    @patch('mcman.logic.transport.READ_TIMEOUT', 0.1)
+    def test_read_timeout(self):
+        """ Test that a server which doesn't answer times out. """
+        started = time.monotonic()
+        with self.assertRaises(URLError):
+            self.get('slow')
+        assert time.monotonic() - started < 0.4
+
+    @patch('mcman.logic.transport.READ_TIMEOUT', 0.1)
+    def test_mirror_read_timeout(self):
+        """ Test that the read timeout is kept when there are mirrors. """
+        self.addCleanup(transport.clear_mirrors)
+        transport.add_mirrors([self.base + 'slow1/', self.base + 'slow2/'])
+        started = time.monotonic()
+        with self.assertRaises(URLError):
+            self.get('slow1/plugins')
+        assert time.monotonic() - started < 0.8
+        assert len(self.server.requests) == 2
+
+    def test_deadline(self):
+        """ Test that no requests are made after the deadline. """
+        self.addCleanup(transport.set_deadline, None)
+        transport.set_deadline(0.01)
+        time.sleep(0.02)
+        with self.assertRaises(transport.DeadlineExceeded):
+            self.get('late')
+        assert len(self.server.requests) == 0
+
+    @patch('mcman.logic.transport.backoff')
+    def test_retry_budget(self, backoff):
+        """ Test how many requests a failing server gets. """
+        with self.assertRaises(HTTPError):
+            hedge.call('kind', self.get, 'fail')
+        assert len(self.server.requests) == hedge.RETRIES
+
+        # Failing over to the other mirror uses up the retries
+        del self.server.requests[:]
+        self.addCleanup(transport.clear_mirrors)
+        transport.add_mirrors([self.base + 'a/', self.base + 'b/'])
+        with self.assertRaises(HTTPError):
+            hedge.call('kind', self.get, 'a/fail')
+        assert len(self.server.requests) == 2
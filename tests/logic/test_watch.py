@@ -0,0 +1,188 @@
+# "mcman" - An utility for managing Minecraft server jars and plugins.
+# Copyright (C) 2014  Tobias Laundal <totokaka>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Tests for mcman.logic.watch. """
+from unittest import TestCase, SkipTest
+from unittest.mock import patch
+from urllib.request import urlopen
+from zipfile import ZipFile
+import json
+import os
+import shutil
+
+from mcman.logic import index, watch
+
+
+def write_plugin(path, name, version):
+    """ Write a plugin jar. """
+    with ZipFile(path, 'w') as zipped:
+        zipped.writestr('plugin.yml', 'name: {}\nmain: a.{}\nversion: {}\n'
+                        .format(name, name, version))
+
+
+def fake_lookup(installed):
+    """ Find all plugins on a fake BukGet, with 2.0 as the newest version. """
+    return {record[0]: {'slug': record[2].lower(), 'plugin_name': record[2],
+                        'versions': [{'version': '2.0', 'type': 'Release'}]}
+            for record in installed}
+
+
+class WatchTestCase(TestCase):
+
+    """ Set up a server folder with a plugins folder. """
+
+    def setUp(self):
+        """ Set up. """
+        self.folder = '/tmp/test_watch/'
+        self.plugins = self.folder + 'plugins'
+        os.makedirs(self.plugins)
+        write_plugin(self.plugins + '/Herp.jar', 'Herp', '1.0')
+
+        patcher = patch('mcman.logic.index.INDEX_FILE',
+                        self.folder + 'index.json')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        index.init()
+        self.addCleanup(index.init)
+
+    def tearDown(self):
+        """ Tear down. """
+        shutil.rmtree(self.folder)
+
+
+class TestWatchers(WatchTestCase):
+
+    """ Test the watchers. """
+
+    def check(self, watcher):
+        """ Check that `watcher` finds new, changed and removed jars. """
+        try:
+            assert watcher.wait(0) == set()
+            write_plugin(self.plugins + '/Derp.jar', 'Derp', '1.0')
+            assert watcher.wait(5) == {self.plugins + '/Derp.jar'}
+            os.remove(self.plugins + '/Herp.jar')
+            assert watcher.wait(5) == {self.plugins + '/Herp.jar'}
+            with open(self.folder + 'notes.txt', 'w') as file:
+                file.write('Not a jar')
+            assert watcher.wait(0.3) == set()
+        finally:
+            watcher.close()
+
+    def test_polling(self):
+        """ Test the PollingWatcher. """
+        self.check(watch.PollingWatcher([self.plugins, self.folder],
+                                        interval=0.01))
+
+    def test_inotify(self):
+        """ Test the InotifyWatcher. """
+        try:
+            watcher = watch.InotifyWatcher([self.plugins, self.folder])
+        except OSError:
+            raise SkipTest('inotify is not available')
+        self.check(watcher)
+
+
+@patch('mcman.logic.plugins.plugins.lookup_plugin_checksums',
+       side_effect=fake_lookup)
+@patch('mcman.logic.servers.build_by_checksum', return_value={'id': 42})
+class TestState(WatchTestCase):
+
+    """ Test watch.State and the server. """
+
+    def test_refresh(self, fake_build, fake_lookup_plugins):
+        """ Test that only changed jars are read and looked up again. """
+        with open(self.folder + 'server.jar', 'wb') as file:
+            file.write(b'Not really a server')
+        state = watch.State(self.plugins, self.folder)
+        state.refresh()
+        write_plugin(self.plugins + '/Derp.jar', 'Derp', '2.0')
+        state.refresh({self.plugins + '/Derp.jar'})
+
+        assert fake_lookup_plugins.call_count == 2
+        assert [record[2] for record in
+                fake_lookup_plugins.call_args[0][0]] == ['Derp']
+        assert fake_build.call_count == 1
+        snapshot = state.snapshot()
+        assert [(plugin['name'], plugin['outdated'])
+                for plugin in snapshot['plugins']] == [('Derp', False),
+                                                       ('Herp', True)]
+        assert snapshot['servers'][0]['build'] == 42
+
+        os.remove(self.plugins + '/Herp.jar')
+        state.refresh({self.plugins + '/Herp.jar'})
+        assert len(state.snapshot()['plugins']) == 1
+
+    def test_expiry(self, fake_build, fake_lookup_plugins):
+        """ Test that expired lookups are done again. """
+        with open(self.folder + 'server.jar', 'wb') as file:
+            file.write(b'Not really a server')
+        state = watch.State(self.plugins, self.folder)
+        state.refresh()
+        state.refresh(set())
+        assert fake_lookup_plugins.call_count == 1
+        assert state.next_expiry() > 0
+
+        for found in (state.found_plugins, state.found_builds):
+            for checksum, (_, value) in list(found.items()):
+                found[checksum] = (0, value)
+        assert state.next_expiry() == 0
+        state.refresh(set())
+        assert fake_lookup_plugins.call_count == 2
+        assert [record[2] for record in
+                fake_lookup_plugins.call_args[0][0]] == ['Herp']
+        assert fake_build.call_count == 2
+        assert state.next_expiry() > 0
+
+    def test_removed(self, fake_build, fake_lookup_plugins):
+        """ Test that the lookups of removed jars are forgotten. """
+        with open(self.folder + 'server.jar', 'wb') as file:
+            file.write(b'Not really a server')
+        state = watch.State(self.plugins, self.folder)
+        state.refresh()
+        assert len(state.found_plugins) == 1
+        assert len(state.found_builds) == 1
+
+        os.remove(self.plugins + '/Herp.jar')
+        os.remove(self.folder + 'server.jar')
+        state.refresh({self.plugins + '/Herp.jar',
+                       self.folder + 'server.jar'})
+        assert state.found_plugins == dict()
+        assert state.found_builds == dict()
+        assert state.next_expiry() is None
+
+    def test_same_plugin(self, fake_build, fake_lookup_plugins):
+        """ Test that several versions of one plugin are all paired. """
+        write_plugin(self.plugins + '/Herp2.jar', 'Herp', '2.0')
+        state = watch.State(self.plugins, self.folder)
+        state.refresh()
+        assert [(plugin['version'], plugin['outdated'])
+                for plugin in state.snapshot()['plugins']] == [('1.0', True),
+                                                               ('2.0', False)]
+
+    def test_serve(self, fake_build, fake_lookup_plugins):
+        """ Test serving the state over HTTP. """
+        state = watch.State(self.plugins, self.folder)
+        state.refresh()
+        server = watch.serve(state, ('127.0.0.1', 0))
+        try:
+            url = 'http://127.0.0.1:{}/plugins'.format(server.server_port)
+            with urlopen(url) as response:
+                plugins = json.loads(response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert plugins[0]['name'] == 'Herp'
+        assert plugins[0]['newest'] == '2.0'